@@ -1,45 +1,106 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash, session, Response
+from flask import Flask, render_template, request, redirect, url_for, flash, session, Response, g, send_file, stream_with_context
 from dotenv import load_dotenv
-from db import get_connection
-from datetime import datetime
+from db import get_connection, init_app as init_db, pool_stats
+from permisos_cache import PermisosCache, crear_backend_version
+from busqueda_empleados import IndiceEmpleados
+from snapshot import Snapshot
+from auditoria import EscritorAuditoria, compactar_auditoria, tablas_archivo
+from asistencia_diaria import recalcular_sql, backfill as backfill_asistencia_diaria, verificar as verificar_asistencia_diaria
+from exportar import generar_csv, generar_xlsx
+from importar_asistencias import (
+    ANCHO_FIJO_DEFAULT, TIPOS_MARCA, MapaEmpleados, importar_asistencias, escribir_rechazos, escribir_rechazos_csv,
+    parsear_ancho_fijo,
+)
+from marcas_kiosco import EscritorMarcas
+from permisos_masivos import aplicar_plantilla as aplicar_plantilla_permisos, guardar_permisos, permisos_formulario
+from paginacion import condicion_keyset, codificar_cursor, decodificar_cursor
+from reportes_pdf import (
+    NORMAL as ESTILO_NORMAL, REPORTE_ASISTENCIA, REPORTE_EMPLEADOS, REPORTE_NOMINA_PERIODO, REPORTE_USUARIOS,
+    TOTALES_NOMINA as ESTILO_TOTALES_NOMINA, alto_flowables, construir as construir_pdf,
+    documento as documento_reporte, encabezado as encabezado_reporte, filas_cursor, tablas_por_pagina,
+)
+from trabajos_reportes import ColaTrabajos, LimiteTrabajos, describir as describir_trabajo
+from comprobantes_pdf import (
+    CacheComprobantes, renderizar_comprobante, renderizar_comprobantes, renderizador_configurado, huella_comprobante,
+    generar_zip, unir_pdfs,
+)
+from datetime import datetime, timedelta
 import io
 import csv
+import hashlib
+import hmac
+import json
+import uuid
+import zlib
 from functools import wraps
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+import click
+from reportlab.platypus import Table, Paragraph, Spacer
 
 # Cargar variables de entorno
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "dev-secret-key-change-me")
+# Tamaño máximo de una petición (archivos subidos); más grande responde 413
+try:
+    _max_subida_mb = int(os.getenv("MAX_SUBIDA_MB", "50"))
+except ValueError:
+    _max_subida_mb = 50
+app.config["MAX_CONTENT_LENGTH"] = _max_subida_mb * 1024 * 1024
+# Pool de conexiones: una conexión por petición, devuelta al pool en el teardown
+init_db(app)
+
+# Caché de permisos entre peticiones (TTL + versión compartida entre workers)
+try:
+    _permisos_ttl = int(os.getenv("PERMISOS_CACHE_TTL", "60"))
+except ValueError:
+    _permisos_ttl = 60
+permisos_cache = PermisosCache(crear_backend_version(), ttl=_permisos_ttl)
+
+# Caché de comprobantes PDF (memoria LRU; en disco si COMPROBANTES_CACHE_DIR está definido)
+try:
+    _comprobantes_cache_mb = int(os.getenv("COMPROBANTES_CACHE_MB", "64"))
+except ValueError:
+    _comprobantes_cache_mb = 64
+comprobantes_cache = CacheComprobantes(
+    max_bytes=_comprobantes_cache_mb * 1024 * 1024,
+    directorio=os.getenv("COMPROBANTES_CACHE_DIR") or None,
+)
+
+# Auditoría asíncrona por lotes (cola acotada + archivo de respaldo si la base no responde)
+try:
+    _auditoria_cola = int(os.getenv("AUDITORIA_MAX_COLA", "10000"))
+    _auditoria_lote = int(os.getenv("AUDITORIA_LOTE", "200"))
+    _auditoria_intervalo = float(os.getenv("AUDITORIA_INTERVALO", "2"))
+except ValueError:
+    _auditoria_cola, _auditoria_lote, _auditoria_intervalo = 10000, 200, 2.0
+escritor_auditoria = EscritorAuditoria(
+    os.getenv("AUDITORIA_SPILL", os.path.join("instance", "auditoria_spill.jsonl")),
+    tamano_lote=_auditoria_lote,
+    intervalo=_auditoria_intervalo,
+    max_cola=_auditoria_cola,
+)
 
 
 # =============================
-# Utilidades: Auditoría y Roles (JAMES) GENERAR EXCEL PARA EL MÓDULO DE AUDITORÍA PARA FILTRAR POR FECHAS Y USUARIOS
+# Utilidades: Auditoría y Roles
 # =============================
 def registrar_auditoria(accion: str, modulo: str = None, detalles: str = None):
-    """Registra una acción en la tabla Auditoria."""
+    """Registra una acción en la tabla Auditoria.
+
+    Solo encola el evento: el escritor en segundo plano lo inserta por lotes
+    (ver auditoria.EscritorAuditoria), fuera de la transacción de la petición.
+    """
     try:
-        id_usuario = session.get("user_id")
-        nombre_usuario = session.get("username")
-        ip = request.remote_addr
-        
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    INSERT INTO Auditoria (IdUsuario, NombreUsuario, Accion, Modulo, Detalles, DireccionIP)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                    """,
-                    (id_usuario, nombre_usuario, accion, modulo, detalles, ip)
-                )
-                conn.commit()
+        escritor_auditoria.registrar(
+            session.get("user_id"),
+            session.get("username"),
+            accion,
+            modulo,
+            detalles,
+            request.remote_addr,
+        )
     except Exception:
         # Si falla auditoría, no interrumpimos la operación principal
         pass
@@ -83,24 +144,64 @@ def requiere_rol(*roles_permitidos):
     return decorator
 
 
+_PERMISOS_VACIOS = {'ver': False, 'crear': False, 'editar': False, 'eliminar': False}
+
+
+def _consultar_matriz_permisos(id_usuario):
+    """Lee de la BD la matriz módulo -> acciones del usuario (una sola consulta)."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT m.Nombre, pu.TieneAcceso, pu.PuedeCrear, pu.PuedeEditar, pu.PuedeEliminar
+                FROM PermisosUsuarios pu
+                JOIN Modulos m ON m.IdModulo = pu.IdModulo
+                WHERE pu.IdUsuario = ?
+                  AND pu.TieneAcceso = 1
+                  AND m.Activo = 1
+            """, (id_usuario,))
+            return {
+                row[0]: {
+                    'ver': bool(row[1]),
+                    'crear': bool(row[2]),
+                    'editar': bool(row[3]),
+                    'eliminar': bool(row[4])
+                }
+                for row in cur.fetchall()
+            }
+
+
+def obtener_matriz_permisos():
+    """
+    Devuelve la matriz de permisos del usuario actual, resuelta una sola vez por petición
+    desde la caché del proceso (`permisos_cache`), que solo va a la BD si la entrada venció
+    o alguien invalidó los permisos.
+    El decorador, el context processor y los helpers de plantillas leen de este diccionario.
+    Lanza la excepción de BD si no se pudo cargar (no se guarda en caché).
+    """
+    id_usuario = session.get("user_id")
+    if not id_usuario:
+        return {}
+    cache = g.get("_permisos_usuario")
+    if cache is None or cache[0] != id_usuario:
+        cache = (id_usuario, permisos_cache.obtener(id_usuario, _consultar_matriz_permisos))
+        g._permisos_usuario = cache
+    return cache[1]
+
+
+def invalidar_permisos():
+    """Invalida la caché de permisos en todos los workers. Llamar tras modificar
+    PermisosUsuarios, Usuarios o Modulos."""
+    permisos_cache.invalidar()
+    g.pop("_permisos_usuario", None)
+
+
 def obtener_permisos_usuario():
     """Obtiene la lista de módulos a los que el usuario tiene acceso."""
     if not session.get("user_id"):
         return []
     
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT m.Nombre
-                    FROM PermisosUsuarios pu
-                    JOIN Modulos m ON m.IdModulo = pu.IdModulo
-                    WHERE pu.IdUsuario = ? 
-                      AND pu.TieneAcceso = 1
-                      AND m.Activo = 1
-                """, (session.get("user_id"),))
-                
-                return [row[0] for row in cur.fetchall()]
+        return list(obtener_matriz_permisos())
     except Exception:
         return []
 
@@ -116,19 +217,7 @@ def requiere_permiso_modulo(nombre_modulo):
             
             # Verificar si el usuario tiene permiso para este módulo
             try:
-                with get_connection() as conn:
-                    with conn.cursor() as cur:
-                        cur.execute("""
-                            SELECT COUNT(*)
-                            FROM PermisosUsuarios pu
-                            JOIN Modulos m ON m.IdModulo = pu.IdModulo
-                            WHERE pu.IdUsuario = ? 
-                              AND m.Nombre = ? 
-                              AND pu.TieneAcceso = 1
-                              AND m.Activo = 1
-                        """, (session.get("user_id"), nombre_modulo))
-                        
-                        tiene_permiso = cur.fetchone()[0] > 0
+                tiene_permiso = nombre_modulo in obtener_matriz_permisos()
             except Exception as e:
                 flash("Error verificando permisos de módulo.", "danger")
                 return redirect(url_for("sin_permisos"))
@@ -199,37 +288,13 @@ def obtener_permisos_usuario_modulo(nombre_modulo):
     Retorna un diccionario con: ver, crear, editar, eliminar
     """
     if not session.get("user_id"):
-        return {'ver': False, 'crear': False, 'editar': False, 'eliminar': False}
+        return dict(_PERMISOS_VACIOS)
     
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT pu.TieneAcceso, pu.PuedeCrear, pu.PuedeEditar, pu.PuedeEliminar
-                    FROM PermisosUsuarios pu
-                    JOIN Modulos m ON m.IdModulo = pu.IdModulo
-                    WHERE pu.IdUsuario = ? 
-                      AND m.Nombre = ? 
-                      AND pu.TieneAcceso = 1
-                      AND m.Activo = 1
-                """, (session.get("user_id"), nombre_modulo))
-                
-                row = cur.fetchone()
-                if row:
-                    permisos = {
-                        'ver': bool(row[0]),
-                        'crear': bool(row[1]),
-                        'editar': bool(row[2]),
-                        'eliminar': bool(row[3])
-                    }
-                    # Debug: imprimir permisos en consola
-                    print(f"DEBUG: Usuario {session.get('user_id')} - Módulo '{nombre_modulo}' - Permisos: {permisos}")
-                    return permisos
-                print(f"DEBUG: Usuario {session.get('user_id')} - Módulo '{nombre_modulo}' - SIN PERMISOS (no hay registro)")
-                return {'ver': False, 'crear': False, 'editar': False, 'eliminar': False}
+        return dict(obtener_matriz_permisos().get(nombre_modulo, _PERMISOS_VACIOS))
     except Exception as e:
         print(f"Error obteniendo permisos del usuario: {e}")
-        return {'ver': False, 'crear': False, 'editar': False, 'eliminar': False}
+        return dict(_PERMISOS_VACIOS)
 
 
 def puede_crear(nombre_modulo):
@@ -417,7 +482,7 @@ def mis_comprobantes():
                             rn.SalarioBase,
                             rn.TotalDeducciones,
                             rn.SalarioNeto,
-                            DATEDIFF(DAY, p.FechaInicio, p.FechaFin) as DiasLaborados,
+                            rn.DiasLaborados,
                             'Procesado' as Estado
                         FROM RegistrosNomina rn
                         INNER JOIN PeriodosNomina p ON p.IdPeriodo = rn.IdPeriodo
@@ -476,7 +541,7 @@ def mi_comprobante_detalle(id_registro: int):
                         rn.SalarioBase,
                         rn.TotalDeducciones,
                         rn.SalarioNeto,
-                        DATEDIFF(DAY, p.FechaInicio, p.FechaFin) as DiasLaborados,
+                        rn.DiasLaborados,
                         pu.Titulo as Puesto,
                         d.Nombre as Departamento
                     FROM RegistrosNomina rn
@@ -611,6 +676,24 @@ def debug_permisos():
     return html
 
 
+@app.route("/debug-pool")
+def debug_pool():
+    """Métricas del pool de conexiones a SQL Server y de las cachés de permisos y comprobantes."""
+    if not session.get("user_id"):
+        return "No hay sesión activa", 403
+    return {
+        "pool": pool_stats(),
+        "permisos_cache": permisos_cache.stats(),
+        "comprobantes_cache": comprobantes_cache.stats(),
+        "comprobantes_render": renderizador_configurado(),
+        "dashboard_snapshot": dashboard_snapshot.stats(),
+        "auditoria": escritor_auditoria.stats(),
+        "busqueda_empleados": indice_empleados.stats(),
+        "kiosco": escritor_marcas.stats(),
+        "reportes": cola_reportes.stats(),
+    }
+
+
 @app.route("/sin-permisos")
 def sin_permisos():
     """Página que se muestra cuando el usuario no tiene permisos para acceder a un módulo."""
@@ -638,140 +721,153 @@ def sin_permisos():
     return render_template("sin_permisos.html", modulos=modulos_disponibles, hide_sidebar=False)
 
 
+def _cargar_estadisticas_dashboard() -> dict:
+    """Consulta las estadísticas y series del dashboard (la usa el snapshot en segundo plano)."""
+    datos = {
+        "stats": {"empleados": 0, "periodos": 0, "departamentos": 0, "usuarios": 0, "total_dias_laborados": 0},
+        "empleados_mejor_pagados": [],
+        "empleados_por_departamento": [],
+        "nomina_ultimos_meses": [],
+        "asistencia_semanal": [],
+    }
+    stats = datos["stats"]
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            # Estadísticas básicas (una sola ida a la base)
+            try:
+                cur.execute("""
+                    SELECT
+                        (SELECT COUNT(*) FROM Empleados WHERE FechaFin IS NULL OR FechaFin >= GETDATE()),
+                        (SELECT COUNT(*) FROM PeriodosNomina),
+                        (SELECT COUNT(*) FROM Departamentos),
+                        (SELECT COUNT(*) FROM Usuarios WHERE Activo = 1)
+                """)
+                row = cur.fetchone()
+                stats["empleados"], stats["periodos"], stats["departamentos"], stats["usuarios"] = row
+            except Exception as e:
+                print(f"Error contando estadísticas básicas: {e}")
+
+            # Total de días laborados (días del resumen diario con 'entrada')
+            try:
+                cur.execute("SELECT COUNT(*) FROM AsistenciaDiaria WHERE Entradas > 0")
+                row = cur.fetchone()
+                stats["total_dias_laborados"] = row[0] if row else 0
+            except Exception as e:
+                print(f"Error contando días laborados: {e}")
+
+            # Top 10 empleados mejor pagados
+            try:
+                cur.execute("""
+                    SELECT TOP 10 
+                        e.Nombres + ' ' + e.Apellidos as Nombre,
+                        e.SalarioBase
+                    FROM Empleados e
+                    ORDER BY e.SalarioBase DESC
+                """)
+                datos["empleados_mejor_pagados"] = [list(row) for row in cur.fetchall()]
+            except Exception as e:
+                print(f"Error obteniendo empleados mejor pagados: {e}")
+
+            # Empleados por departamento
+            try:
+                cur.execute("""
+                    SELECT 
+                        ISNULL(d.Nombre, 'Sin Departamento') as Departamento,
+                        COUNT(e.IdEmpleado) as Total
+                    FROM Empleados e
+                    LEFT JOIN Puestos p ON p.IdPuesto = e.IdPuesto
+                    LEFT JOIN Departamentos d ON d.IdDepartamento = p.IdDepartamento
+                    GROUP BY d.Nombre
+                """)
+                datos["empleados_por_departamento"] = [list(row) for row in cur.fetchall()]
+            except Exception as e:
+                print(f"Error obteniendo empleados por departamento: {e}")
+
+            # Nómina de últimos 6 meses (FORMAT solo sobre las filas ya agrupadas)
+            try:
+                cur.execute("""
+                    SELECT TOP 6
+                        FORMAT(x.FechaInicio, 'MMM yyyy') as Mes,
+                        x.TotalPagado
+                    FROM (
+                        SELECT p.FechaInicio, ISNULL(SUM(r.TotalNeto), 0) as TotalPagado
+                        FROM PeriodosNomina p
+                        LEFT JOIN ResumenPeriodosNomina r ON r.IdPeriodo = p.IdPeriodo
+                        WHERE p.FechaInicio >= DATEADD(MONTH, -6, GETDATE())
+                        GROUP BY p.FechaInicio
+                    ) x
+                    ORDER BY x.FechaInicio DESC
+                """)
+                rows = cur.fetchall()
+                datos["nomina_ultimos_meses"] = [list(row) for row in reversed(rows)]
+            except Exception as e:
+                print(f"Error obteniendo nómina: {e}")
+
+            # Asistencia de última semana
+            try:
+                cur.execute("""
+                    SELECT 
+                        FORMAT(x.Dia, 'ddd dd/MM') as Dia,
+                        x.Empleados
+                    FROM (
+                        SELECT Fecha as Dia,
+                               COUNT(*) as Empleados
+                        FROM AsistenciaDiaria
+                        WHERE Entradas > 0
+                          AND Fecha > CAST(DATEADD(DAY, -7, GETDATE()) AS DATE)
+                        GROUP BY Fecha
+                    ) x
+                    ORDER BY x.Dia
+                """)
+                datos["asistencia_semanal"] = [list(row) for row in cur.fetchall()]
+            except Exception as e:
+                print(f"Error obteniendo asistencia: {e}")
+
+    return datos
+
+
+# Estadísticas del dashboard: se refrescan en un hilo; la petición solo lee memoria
+def _env_segundos(nombre: str, default: int) -> int:
+    try:
+        return int(os.getenv(nombre, str(default)))
+    except ValueError:
+        return default
+
+
+dashboard_snapshot = Snapshot(
+    "dashboard",
+    _cargar_estadisticas_dashboard,
+    intervalo=_env_segundos("DASHBOARD_REFRESCO", 60),
+    max_antiguedad=_env_segundos("DASHBOARD_MAX_ANTIGUEDAD", 300),
+    espera_error=_env_segundos("DASHBOARD_ESPERA_ERROR", 15),
+)
+
+
 @app.route("/dashboard")
 @requiere_permiso_modulo("Dashboard")
 def dashboard():
-    # Obtener estadísticas básicas
-    stats = {"empleados": 0, "periodos": 0, "departamentos": 0, "usuarios": 0, "total_dias_laborados": 0}
-    
-    # Datos para gráficas
-    empleados_mejor_pagados = []
-    empleados_por_departamento = []
-    nomina_ultimos_meses = []
-    asistencia_semanal = []
-    
-    try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # Estadísticas básicas
-                try:
-                    cur.execute("SELECT COUNT(*) FROM Empleados WHERE FechaFin IS NULL OR FechaFin >= GETDATE()")
-                    stats["empleados"] = cur.fetchone()[0]
-                except Exception as e:
-                    print(f"Error contando empleados: {e}")
-                
-                try:
-                    cur.execute("SELECT COUNT(*) FROM PeriodosNomina")
-                    stats["periodos"] = cur.fetchone()[0]
-                except Exception as e:
-                    print(f"Error contando periodos: {e}")
-                
-                try:
-                    cur.execute("SELECT COUNT(*) FROM Departamentos")
-                    stats["departamentos"] = cur.fetchone()[0]
-                except Exception as e:
-                    print(f"Error contando departamentos: {e}")
-                
-                try:
-                    cur.execute("SELECT COUNT(*) FROM Usuarios WHERE Activo = 1")
-                    stats["usuarios"] = cur.fetchone()[0]
-                except Exception as e:
-                    print(f"Error contando usuarios: {e}")
-                
-                # Total de días laborados
-                try:
-                    cur.execute("""
-                        SELECT COUNT(DISTINCT CONCAT(IdEmpleado, '_', CAST(FechaHora AS DATE)))
-                        FROM Asistencias
-                        WHERE Tipo = 'entrada'
-                    """)
-                    row = cur.fetchone()
-                    stats["total_dias_laborados"] = row[0] if row else 0
-                except Exception as e:
-                    print(f"Error contando días laborados: {e}")
-                
-                # Top 10 empleados mejor pagados
-                try:
-                    cur.execute("""
-                        SELECT TOP 10 
-                            e.Nombres + ' ' + e.Apellidos as Nombre,
-                            e.SalarioBase
-                        FROM Empleados e
-                        ORDER BY e.SalarioBase DESC
-                    """)
-                    rows = cur.fetchall()
-                    empleados_mejor_pagados = [list(row) for row in rows]
-                    print(f"Empleados mejor pagados: {len(empleados_mejor_pagados)} registros")
-                except Exception as e:
-                    print(f"Error obteniendo empleados mejor pagados: {e}")
-                
-                # Empleados por departamento
-                try:
-                    cur.execute("""
-                        SELECT 
-                            ISNULL(d.Nombre, 'Sin Departamento') as Departamento,
-                            COUNT(e.IdEmpleado) as Total
-                        FROM Empleados e
-                        LEFT JOIN Puestos p ON p.IdPuesto = e.IdPuesto
-                        LEFT JOIN Departamentos d ON d.IdDepartamento = p.IdDepartamento
-                        GROUP BY d.Nombre
-                    """)
-                    rows = cur.fetchall()
-                    empleados_por_departamento = [list(row) for row in rows]
-                    print(f"Empleados por departamento: {len(empleados_por_departamento)} registros")
-                except Exception as e:
-                    print(f"Error obteniendo empleados por departamento: {e}")
-                
-                # Nómina de últimos 6 meses
-                try:
-                    cur.execute("""
-                        SELECT TOP 6
-                            FORMAT(p.FechaInicio, 'MMM yyyy') as Mes,
-                            ISNULL(SUM(rn.SalarioNeto), 0) as TotalPagado
-                        FROM PeriodosNomina p
-                        LEFT JOIN RegistrosNomina rn ON rn.IdPeriodo = p.IdPeriodo
-                        WHERE p.FechaInicio >= DATEADD(MONTH, -6, GETDATE())
-                        GROUP BY p.FechaInicio, FORMAT(p.FechaInicio, 'MMM yyyy')
-                        ORDER BY p.FechaInicio DESC
-                    """)
-                    rows = cur.fetchall()
-                    nomina_ultimos_meses = [list(row) for row in reversed(rows)]
-                    print(f"Nómina últimos meses: {len(nomina_ultimos_meses)} registros")
-                except Exception as e:
-                    print(f"Error obteniendo nómina: {e}")
-                
-                # Asistencia de última semana
-                try:
-                    cur.execute("""
-                        SELECT 
-                            FORMAT(CAST(FechaHora AS DATE), 'ddd dd/MM') as Dia,
-                            COUNT(DISTINCT IdEmpleado) as Empleados
-                        FROM Asistencias
-                        WHERE Tipo = 'entrada'
-                          AND FechaHora >= DATEADD(DAY, -7, GETDATE())
-                        GROUP BY CAST(FechaHora AS DATE), FORMAT(CAST(FechaHora AS DATE), 'ddd dd/MM')
-                        ORDER BY CAST(FechaHora AS DATE)
-                    """)
-                    rows = cur.fetchall()
-                    asistencia_semanal = [list(row) for row in rows]
-                    print(f"Asistencia semanal: {len(asistencia_semanal)} registros")
-                except Exception as e:
-                    print(f"Error obteniendo asistencia: {e}")
-                
-    except Exception as e:
-        print(f"Error general en dashboard: {e}")
-        import traceback
-        traceback.print_exc()
+    datos, actualizado = dashboard_snapshot.obtener()
+    if datos is None:
+        # Nunca se pudo cargar: mostrar el dashboard vacío
+        datos = {
+            "stats": {"empleados": 0, "periodos": 0, "departamentos": 0, "usuarios": 0, "total_dias_laborados": 0},
+            "empleados_mejor_pagados": [],
+            "empleados_por_departamento": [],
+            "nomina_ultimos_meses": [],
+            "asistencia_semanal": [],
+        }
     
     return render_template(
         "dashboard_v2.html", 
         usuario=session.get("username"),
         rol=session.get("rol", "Sin rol"),
-        stats=stats,
-        empleados_mejor_pagados=empleados_mejor_pagados,
-        empleados_por_departamento=empleados_por_departamento,
-        nomina_ultimos_meses=nomina_ultimos_meses,
-        asistencia_semanal=asistencia_semanal
+        stats=datos["stats"],
+        empleados_mejor_pagados=datos["empleados_mejor_pagados"],
+        empleados_por_departamento=datos["empleados_por_departamento"],
+        nomina_ultimos_meses=datos["nomina_ultimos_meses"],
+        asistencia_semanal=datos["asistencia_semanal"],
+        actualizado=actualizado
     )
 
 
@@ -862,7 +958,7 @@ def periodos_nuevo():
 @requiere_permiso_modulo("Periodos")
 def periodos_recalcular(id_periodo: int):
     """Elimina ItemsNomina del periodo y los vuelve a calcular con catálogo y overrides por empleado.
-    No toca RegistrosNomina."""
+    De RegistrosNomina solo se actualizan los totales guardados."""
     try:
         with get_connection() as conn:
             with conn.cursor() as cur:
@@ -928,6 +1024,8 @@ def periodos_recalcular(id_periodo: int):
                     """,
                     (id_periodo,),
                 )
+                _actualizar_resumen_nomina(cur, id_periodo)
+                invalidar_comprobantes(cur, id_periodo=id_periodo)
                 conn.commit()
         flash("Ítems del periodo recalculados.", "success")
     except Exception as e:
@@ -952,439 +1050,393 @@ def reportes_listado():
                     ORDER BY FechaInicio DESC
                 """)
                 periodos = cur.fetchall()
-        return render_template("reportes/list.html", periodos=periodos)
+        # Reportes en segundo plano del usuario (en curso y listos para descargar)
+        trabajos = [describir_trabajo(t) for t in cola_reportes.listar(session.get("user_id"))]
+        return render_template("reportes/list.html", periodos=periodos, trabajos=trabajos)
     except Exception as e:
         flash(f"Error cargando reportes: {e}", "danger")
-        return render_template("reportes/list.html", periodos=[])
+        return render_template("reportes/list.html", periodos=[], trabajos=[])
 
 
-@app.route("/reportes/empleados/pdf")
-@requiere_permiso_modulo("Reportes")
-def reporte_empleados_pdf():
-    """Genera reporte PDF de empleados."""
+# =============================
+# Trabajos de reportes en segundo plano
+# =============================
+# Los reportes PDF y los comprobantes masivos se generan en un pool de hilos y
+# se descargan desde REPORTES_DIR; la petición solo encola y redirige a una
+# página que consulta el avance.
+try:
+    _reportes_trabajadores = int(os.getenv("REPORTES_TRABAJADORES", "2"))
+    _reportes_max_usuario = int(os.getenv("REPORTES_MAX_POR_USUARIO", "2"))
+    _reportes_expiracion = int(os.getenv("REPORTES_EXPIRACION", "3600"))
+    _reportes_timeout = int(os.getenv("REPORTES_TIMEOUT", "1800"))
+except ValueError:
+    _reportes_trabajadores, _reportes_max_usuario, _reportes_expiracion, _reportes_timeout = 2, 2, 3600, 1800
+cola_reportes = ColaTrabajos(
+    os.getenv("REPORTES_DIR", os.path.join("instance", "reportes")),
+    trabajadores=_reportes_trabajadores,
+    max_por_usuario=_reportes_max_usuario,
+    expiracion=_reportes_expiracion,
+    timeout=_reportes_timeout,
+)
+
+
+def _enviar_trabajo_reporte(tipo: str, params: dict, titulo: str, modulo: str, volver: str, auditoria: tuple):
+    """Encola el reporte y redirige a su página de avance (o de vuelta si no se pudo)."""
     try:
-        from reportlab.lib.pagesizes import letter, landscape
-        from reportlab.lib import colors
-        from reportlab.lib.units import inch
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.enums import TA_CENTER, TA_LEFT
-        from datetime import datetime
-        
-        # Obtener datos
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT e.CodigoEmpleado, e.Nombres, e.Apellidos, 
-                           p.Titulo, e.SalarioBase,
-                           CONVERT(VARCHAR(10), e.FechaContratacion, 103) as FechaInicio,
-                           CASE WHEN e.FechaFin IS NULL THEN 'Activo' 
-                                ELSE CONVERT(VARCHAR(10), e.FechaFin, 103) END as Estado
-                    FROM Empleados e
-                    LEFT JOIN Puestos p ON p.IdPuesto = e.IdPuesto
-                    ORDER BY e.Apellidos, e.Nombres
-                """)
-                empleados = cur.fetchall()
-        
-        # Crear PDF en memoria
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=landscape(letter), 
-                                rightMargin=30, leftMargin=30, topMargin=40, bottomMargin=30)
-        
-        elements = []
-        styles = getSampleStyleSheet()
-        
-        # Título
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=18,
-            textColor=colors.HexColor('#1e40af'),
-            spaceAfter=6,
-            alignment=TA_CENTER
-        )
-        elements.append(Paragraph("REPORTE DE EMPLEADOS", title_style))
-        
-        # Fecha de generación
-        subtitle_style = ParagraphStyle('Subtitle', parent=styles['Normal'], 
-                                       fontSize=10, textColor=colors.grey, alignment=TA_CENTER)
-        elements.append(Paragraph(f"Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}", subtitle_style))
-        elements.append(Spacer(1, 20))
-        
-        # Tabla de datos
-        data = [['Código', 'Nombre Completo', 'Puesto', 'Salario Base', 'Fecha Inicio', 'Estado']]
-        
-        for emp in empleados:
-            data.append([
-                emp[0],  # Código
-                f"{emp[1]} {emp[2]}",  # Nombre completo
-                emp[3] or 'N/A',  # Puesto
-                f"Q {emp[4]:,.2f}",  # Salario
-                emp[5],  # Fecha inicio
-                emp[6]   # Estado
-            ])
-        
-        # Crear tabla
-        table = Table(data, colWidths=[0.8*inch, 2.2*inch, 1.8*inch, 1.2*inch, 1.2*inch, 1*inch])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('ALIGN', (3, 0), (3, -1), 'RIGHT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('FONTSIZE', (0, 1), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('TOPPADDING', (0, 1), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')])
-        ]))
-        
-        elements.append(table)
-        elements.append(Spacer(1, 20))
-        elements.append(Paragraph(f"<b>Total de empleados:</b> {len(empleados)}", styles['Normal']))
-        
-        doc.build(elements)
-        buffer.seek(0)
-        
-        registrar_auditoria("Reporte de empleados generado", "Reportes", "PDF")
-        
-        return Response(
-            buffer.getvalue(),
-            mimetype='application/pdf',
-            headers={'Content-Disposition': f'attachment; filename="reporte_empleados_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf"'}
-        )
+        trabajo, nuevo = cola_reportes.enviar(tipo, params, session.get("user_id"), modulo, titulo)
+    except LimiteTrabajos as e:
+        flash(str(e), "warning")
+        return redirect(volver)
     except Exception as e:
-        flash(f"Error generando reporte: {e}", "danger")
+        flash(f"Error encolando el reporte: {e}", "danger")
+        return redirect(volver)
+    registrar_auditoria(auditoria[0], modulo, auditoria[1])
+    if not nuevo:
+        flash("Ya se estaba generando un reporte igual; se muestra su avance.", "info")
+    return redirect(url_for("reporte_trabajo", id_trabajo=trabajo["id"]))
+
+
+def _trabajo_autorizado(id_trabajo: str):
+    """Trabajo si existe y el usuario lo pidió o tiene permiso sobre su módulo; si no, None."""
+    trabajo = cola_reportes.estado(id_trabajo)
+    if not trabajo:
+        return None
+    if trabajo["usuario"] == session.get("user_id") or trabajo["modulo"] in obtener_permisos_usuario():
+        return trabajo
+    return None
+
+
+@app.route("/reportes/trabajos/<id_trabajo>")
+def reporte_trabajo(id_trabajo: str):
+    """Página de avance de un reporte en segundo plano (consulta el estado cada segundo)."""
+    if not session.get("user_id"):
+        flash("Debes iniciar sesión.", "warning")
+        return redirect(url_for("login"))
+    trabajo = _trabajo_autorizado(id_trabajo)
+    if not trabajo:
+        flash("El reporte no existe o ya expiró.", "warning")
         return redirect(url_for("reportes_listado"))
+    return render_template("reportes/trabajo.html", trabajo=describir_trabajo(trabajo))
+
+
+@app.route("/reportes/trabajos/<id_trabajo>/estado")
+def reporte_trabajo_estado(id_trabajo: str):
+    """Estado y avance del trabajo en JSON."""
+    if not session.get("user_id"):
+        return {"error": "No hay sesión activa"}, 403
+    trabajo = _trabajo_autorizado(id_trabajo)
+    if not trabajo:
+        return {"error": "El reporte no existe o ya expiró."}, 404
+    return describir_trabajo(trabajo)
+
+
+@app.route("/reportes/trabajos/<id_trabajo>/descargar")
+def reporte_trabajo_descargar(id_trabajo: str):
+    """Descarga el resultado de un trabajo terminado."""
+    if not session.get("user_id"):
+        flash("Debes iniciar sesión.", "warning")
+        return redirect(url_for("login"))
+    trabajo = _trabajo_autorizado(id_trabajo)
+    if not trabajo or trabajo["estado"] != "listo" or not os.path.exists(cola_reportes.ruta_resultado(id_trabajo)):
+        flash("El reporte no está disponible (todavía en proceso o ya expiró).", "warning")
+        return redirect(url_for("reportes_listado"))
+    return send_file(
+        os.path.abspath(cola_reportes.ruta_resultado(id_trabajo)),
+        mimetype=trabajo["mimetype"],
+        as_attachment=True,
+        download_name=trabajo["nombre"],
+    )
+
+
+def _pdf_reporte_empleados(salida, params: dict, progreso) -> dict:
+    """Reporte PDF de empleados escrito en `salida`."""
+    plantilla = REPORTE_EMPLEADOS
+    doc = documento_reporte(salida, plantilla)
+    elements = encabezado_reporte(plantilla, f"Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}")
+    
+    # Tabla de datos (una tabla por página, con encabezado)
+    total = 0
+
+    def fila_empleado(emp):
+        nonlocal total
+        total += 1
+        progreso(total, etapa="Leyendo empleados")
+        return [
+            emp[0],  # Código
+            f"{emp[1]} {emp[2]}",  # Nombre completo
+            emp[3] or 'N/A',  # Puesto
+            f"Q {emp[4]:,.2f}",  # Salario
+            emp[5],  # Fecha inicio
+            emp[6]   # Estado
+        ]
+
+    # Leer por bloques (fetchmany) mientras se arman las tablas
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT e.CodigoEmpleado, e.Nombres, e.Apellidos, 
+                       p.Titulo, e.SalarioBase,
+                       CONVERT(VARCHAR(10), e.FechaContratacion, 103) as FechaInicio,
+                       CASE WHEN e.FechaFin IS NULL THEN 'Activo' 
+                            ELSE CONVERT(VARCHAR(10), e.FechaFin, 103) END as Estado
+                FROM Empleados e
+                LEFT JOIN Puestos p ON p.IdPuesto = e.IdPuesto
+                ORDER BY e.Apellidos, e.Nombres
+            """)
+            elements.extend(tablas_por_pagina(
+                filas_cursor(cur, fila_empleado), plantilla.encabezado, plantilla.anchos,
+                plantilla.estilo_tabla, doc, alto_usado=alto_flowables(elements, doc),
+            ))
+    
+    elements.append(Spacer(1, 20))
+    elements.append(Paragraph(f"<b>Total de empleados:</b> {total}", ESTILO_NORMAL))
+    
+    construir_pdf(doc, elements, progreso)
+    return {"nombre": f"reporte_empleados_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
+            "mimetype": "application/pdf"}
+
+
+@app.route("/reportes/empleados/pdf")
+@requiere_permiso_modulo("Reportes")
+def reporte_empleados_pdf():
+    """Encola el reporte PDF de empleados."""
+    return _enviar_trabajo_reporte("empleados", {}, "Reporte de empleados", "Reportes",
+                                   url_for("reportes_listado"), ("Reporte de empleados generado", "PDF"))
+
+
+def _pdf_reporte_nomina_periodo(salida, params: dict, progreso) -> dict:
+    """Reporte PDF de nómina del periodo params["id_periodo"] escrito en `salida`."""
+    id_periodo = params["id_periodo"]
+    plantilla = REPORTE_NOMINA_PERIODO
+    doc = documento_reporte(salida, plantilla)
+    totales = [0, 0, 0, 0]  # base, prestaciones, deducciones, neto
+    leidas = 0
+
+    def fila_nomina(nom):
+        nonlocal leidas
+        leidas += 1
+        progreso(leidas, etapa="Leyendo nómina")
+        for i in range(4):
+            totales[i] += nom[3 + i]
+        return [
+            nom[0],
+            f"{nom[1]} {nom[2]}",
+            f"Q {nom[3]:,.2f}",
+            f"Q {nom[4]:,.2f}",
+            f"Q {nom[5]:,.2f}",
+            f"Q {nom[6]:,.2f}"
+        ]
+
+    # Obtener datos del periodo y nómina (detalle por bloques con fetchmany)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            # Info del periodo
+            cur.execute("""
+                SELECT FechaInicio, FechaFin, TipoPeriodo
+                FROM PeriodosNomina
+                WHERE IdPeriodo = ?
+            """, (id_periodo,))
+            periodo = cur.fetchone()
+            
+            if not periodo:
+                raise ValueError("Periodo no encontrado.")
+            
+            # Título e info del periodo
+            elements = encabezado_reporte(
+                plantilla,
+                f"Periodo: {periodo[0].strftime('%d/%m/%Y')} - {periodo[1].strftime('%d/%m/%Y')} ({periodo[2]})",
+                f"Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}",
+            )
+            
+            # Detalle de nómina
+            cur.execute("""
+                SELECT e.CodigoEmpleado, e.Nombres, e.Apellidos,
+                       rn.SalarioBase,
+                       rn.TotalPrestaciones as Prestaciones,
+                       rn.TotalDeducciones as Deducciones,
+                       rn.SalarioNeto
+                FROM RegistrosNomina rn
+                JOIN Empleados e ON e.IdEmpleado = rn.IdEmpleado
+                WHERE rn.IdPeriodo = ?
+                ORDER BY e.Apellidos, e.Nombres
+            """, (id_periodo,))
+            elements.extend(tablas_por_pagina(
+                filas_cursor(cur, fila_nomina), plantilla.encabezado, plantilla.anchos,
+                plantilla.estilo_tabla, doc, alto_usado=alto_flowables(elements, doc),
+            ))
+    
+    # Fila de totales (tabla aparte, mismas columnas)
+    tabla_totales = Table([['', 'TOTALES'] + [f"Q {t:,.2f}" for t in totales]], colWidths=plantilla.anchos)
+    tabla_totales.setStyle(ESTILO_TOTALES_NOMINA)
+    elements.append(tabla_totales)
+    
+    construir_pdf(doc, elements, progreso)
+    return {"nombre": f"reporte_nomina_{id_periodo}_{datetime.now().strftime('%Y%m%d')}.pdf",
+            "mimetype": "application/pdf"}
 
 
 @app.route("/reportes/nomina/periodo/pdf")
 @requiere_permiso_modulo("Reportes")
 def reporte_nomina_periodo_pdf():
-    """Genera reporte PDF de nómina por periodo."""
+    """Encola el reporte PDF de nómina por periodo."""
     id_periodo = request.args.get("id_periodo")
     
-    if not id_periodo:
+    if not id_periodo or not id_periodo.isdigit():
         flash("Debe seleccionar un periodo.", "warning")
         return redirect(url_for("reportes_listado"))
     
-    try:
-        from reportlab.lib.pagesizes import letter, landscape
-        from reportlab.lib import colors
-        from reportlab.lib.units import inch
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.enums import TA_CENTER
-        from datetime import datetime
-        
-        # Obtener datos del periodo y nómina
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # Info del periodo
-                cur.execute("""
-                    SELECT FechaInicio, FechaFin, TipoPeriodo
-                    FROM PeriodosNomina
-                    WHERE IdPeriodo = ?
-                """, (id_periodo,))
-                periodo = cur.fetchone()
-                
-                if not periodo:
-                    flash("Periodo no encontrado.", "warning")
-                    return redirect(url_for("reportes_listado"))
-                
-                # Detalle de nómina
-                cur.execute("""
-                    SELECT e.CodigoEmpleado, e.Nombres, e.Apellidos,
-                           rn.SalarioBase,
-                           ISNULL((SELECT SUM(i.Monto) FROM ItemsNomina i 
-                                   JOIN BeneficiosDeducciones b ON b.IdBeneficioDeduccion = i.IdBeneficioDeduccion
-                                   WHERE i.IdNomina = rn.IdNomina AND b.Tipo = 'prestacion'), 0) as Prestaciones,
-                           ISNULL((SELECT SUM(i.Monto) FROM ItemsNomina i 
-                                   JOIN BeneficiosDeducciones b ON b.IdBeneficioDeduccion = i.IdBeneficioDeduccion
-                                   WHERE i.IdNomina = rn.IdNomina AND b.Tipo = 'deduccion'), 0) as Deducciones,
-                           rn.SalarioNeto
-                    FROM RegistrosNomina rn
-                    JOIN Empleados e ON e.IdEmpleado = rn.IdEmpleado
-                    WHERE rn.IdPeriodo = ?
-                    ORDER BY e.Apellidos, e.Nombres
-                """, (id_periodo,))
-                nominas = cur.fetchall()
-        
-        # Crear PDF
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=landscape(letter),
-                                rightMargin=30, leftMargin=30, topMargin=40, bottomMargin=30)
-        
-        elements = []
-        styles = getSampleStyleSheet()
-        
-        # Título
-        title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'],
-                                     fontSize=18, textColor=colors.HexColor('#059669'),
-                                     spaceAfter=6, alignment=TA_CENTER)
-        elements.append(Paragraph("REPORTE DE NÓMINA POR PERIODO", title_style))
-        
-        # Info del periodo
-        subtitle_style = ParagraphStyle('Subtitle', parent=styles['Normal'],
-                                       fontSize=10, textColor=colors.grey, alignment=TA_CENTER)
-        elements.append(Paragraph(
-            f"Periodo: {periodo[0].strftime('%d/%m/%Y')} - {periodo[1].strftime('%d/%m/%Y')} ({periodo[2]})",
-            subtitle_style
-        ))
-        elements.append(Paragraph(f"Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}", subtitle_style))
-        elements.append(Spacer(1, 20))
-        
-        # Tabla
-        data = [['Código', 'Empleado', 'Salario Base', 'Prestaciones', 'Deducciones', 'Salario Neto']]
-        
-        total_base = 0
-        total_prest = 0
-        total_ded = 0
-        total_neto = 0
-        
-        for nom in nominas:
-            data.append([
-                nom[0],
-                f"{nom[1]} {nom[2]}",
-                f"Q {nom[3]:,.2f}",
-                f"Q {nom[4]:,.2f}",
-                f"Q {nom[5]:,.2f}",
-                f"Q {nom[6]:,.2f}"
-            ])
-            total_base += nom[3]
-            total_prest += nom[4]
-            total_ded += nom[5]
-            total_neto += nom[6]
-        
-        # Fila de totales
-        data.append(['', 'TOTALES', f"Q {total_base:,.2f}", f"Q {total_prest:,.2f}",
-                     f"Q {total_ded:,.2f}", f"Q {total_neto:,.2f}"])
-        
-        table = Table(data, colWidths=[0.9*inch, 2.5*inch, 1.3*inch, 1.3*inch, 1.3*inch, 1.3*inch])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#059669')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('FONTSIZE', (0, 1), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('TOPPADDING', (0, 1), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -2), [colors.white, colors.HexColor('#f8f9fa')]),
-            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#d1fae5')),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold')
-        ]))
-        
-        elements.append(table)
-        
-        doc.build(elements)
-        buffer.seek(0)
-        
-        registrar_auditoria("Reporte de nómina generado", "Reportes", f"Periodo: {id_periodo}")
-        
-        return Response(
-            buffer.getvalue(),
-            mimetype='application/pdf',
-            headers={'Content-Disposition': f'attachment; filename="reporte_nomina_{id_periodo}_{datetime.now().strftime("%Y%m%d")}.pdf"'}
-        )
-    except Exception as e:
-        flash(f"Error generando reporte: {e}", "danger")
-        return redirect(url_for("reportes_listado"))
+    return _enviar_trabajo_reporte("nomina_periodo", {"id_periodo": int(id_periodo)},
+                                   f"Reporte de nómina del periodo {id_periodo}", "Reportes",
+                                   url_for("reportes_listado"),
+                                   ("Reporte de nómina generado", f"Periodo: {id_periodo}"))
+
+
+# Rango máximo del reporte de asistencia (días) y rango por defecto si no se indica
+REPORTE_ASISTENCIA_MAX_DIAS = max(1, _env_segundos("REPORTE_ASISTENCIA_MAX_DIAS", 366))
+REPORTE_ASISTENCIA_DIAS_DEFAULT = 30
+
+
+def _rango_reporte_asistencia(desde_txt: str, hasta_txt: str) -> tuple:
+    """(desde, hasta) del reporte de asistencia; por defecto los últimos 30 días."""
+    hasta = datetime.strptime(hasta_txt, "%Y-%m-%d").date() if hasta_txt else datetime.now().date()
+    if desde_txt:
+        desde = datetime.strptime(desde_txt, "%Y-%m-%d").date()
+    else:
+        desde = hasta - timedelta(days=REPORTE_ASISTENCIA_DIAS_DEFAULT - 1)
+    if desde > hasta:
+        raise ValueError("La fecha inicial es mayor que la final.")
+    if (hasta - desde).days + 1 > REPORTE_ASISTENCIA_MAX_DIAS:
+        raise ValueError(f"El rango no puede superar {REPORTE_ASISTENCIA_MAX_DIAS} días.")
+    return desde, hasta
+
+
+def _pdf_reporte_asistencia(salida, params: dict, progreso) -> dict:
+    """Reporte PDF de asistencia de params["desde"] a params["hasta"] (AAAA-MM-DD) escrito en `salida`."""
+    desde, hasta = _rango_reporte_asistencia(params["desde"], params["hasta"])
+    plantilla = REPORTE_ASISTENCIA
+    doc = documento_reporte(salida, plantilla)
+    elements = encabezado_reporte(plantilla, f"Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}",
+                                  f"Del {desde.strftime('%d/%m/%Y')} al {hasta.strftime('%d/%m/%Y')}")
+    
+    # Tabla (una por página, con encabezado)
+    total = 0
+
+    def fila_asistencia(asist):
+        nonlocal total
+        total += 1
+        progreso(total, etapa="Leyendo marcas")
+        return [
+            asist[0],
+            f"{asist[1]} {asist[2]}",
+            asist[3],
+            asist[4],
+            asist[5].capitalize(),
+            asist[6][:30] if len(asist[6]) > 30 else asist[6]
+        ]
+
+    # Rango sobre FechaHora (IX_Asistencias_FechaHora), leído por bloques con fetchmany
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT e.CodigoEmpleado, e.Nombres, e.Apellidos,
+                       CONVERT(VARCHAR(10), a.FechaHora, 103) as Fecha,
+                       CONVERT(VARCHAR(5), a.FechaHora, 108) as Hora,
+                       a.Tipo,
+                       ISNULL(a.Observacion, '') as Obs
+                FROM Asistencias a
+                JOIN Empleados e ON e.IdEmpleado = a.IdEmpleado
+                WHERE a.FechaHora >= ? AND a.FechaHora < ?
+                ORDER BY a.FechaHora DESC, a.IdAsistencia DESC
+            """, (desde, hasta + timedelta(days=1)))
+            elements.extend(tablas_por_pagina(
+                filas_cursor(cur, fila_asistencia), plantilla.encabezado, plantilla.anchos,
+                plantilla.estilo_tabla, doc, alto_usado=alto_flowables(elements, doc),
+            ))
+    
+    elements.append(Spacer(1, 20))
+    elements.append(Paragraph(f"<b>Total de registros:</b> {total}", ESTILO_NORMAL))
+    
+    construir_pdf(doc, elements, progreso)
+    return {"nombre": f"reporte_asistencia_{desde:%Y%m%d}_{hasta:%Y%m%d}.pdf", "mimetype": "application/pdf"}
 
 
 @app.route("/reportes/asistencia/pdf")
 @requiere_permiso_modulo("Reportes")
 def reporte_asistencia_pdf():
-    """Genera reporte PDF de asistencia."""
+    """Encola el reporte PDF de asistencia de un rango de fechas (desde/hasta)."""
     try:
-        from reportlab.lib.pagesizes import letter, landscape
-        from reportlab.lib import colors
-        from reportlab.lib.units import inch
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.enums import TA_CENTER
-        from datetime import datetime
-        
-        # Obtener datos (últimos 500 registros)
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT TOP 500
-                           e.CodigoEmpleado, e.Nombres, e.Apellidos,
-                           CONVERT(VARCHAR(10), a.FechaHora, 103) as Fecha,
-                           CONVERT(VARCHAR(5), a.FechaHora, 108) as Hora,
-                           a.Tipo,
-                           ISNULL(a.Observacion, '') as Obs
-                    FROM Asistencias a
-                    JOIN Empleados e ON e.IdEmpleado = a.IdEmpleado
-                    ORDER BY a.FechaHora DESC
-                """)
-                asistencias = cur.fetchall()
-        
-        # Crear PDF
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=landscape(letter),
-                                rightMargin=30, leftMargin=30, topMargin=40, bottomMargin=30)
-        
-        elements = []
-        styles = getSampleStyleSheet()
-        
-        # Título
-        title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'],
-                                     fontSize=18, textColor=colors.HexColor('#7c3aed'),
-                                     spaceAfter=6, alignment=TA_CENTER)
-        elements.append(Paragraph("REPORTE DE ASISTENCIA", title_style))
-        
-        subtitle_style = ParagraphStyle('Subtitle', parent=styles['Normal'],
-                                       fontSize=10, textColor=colors.grey, alignment=TA_CENTER)
-        elements.append(Paragraph(f"Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}", subtitle_style))
-        elements.append(Paragraph(f"Últimos {len(asistencias)} registros", subtitle_style))
-        elements.append(Spacer(1, 20))
-        
-        # Tabla
-        data = [['Código', 'Empleado', 'Fecha', 'Hora', 'Tipo', 'Observación']]
-        
-        for asist in asistencias:
-            data.append([
-                asist[0],
-                f"{asist[1]} {asist[2]}",
-                asist[3],
-                asist[4],
-                asist[5].capitalize(),
-                asist[6][:30] if len(asist[6]) > 30 else asist[6]
-            ])
-        
-        table = Table(data, colWidths=[0.8*inch, 2.2*inch, 1*inch, 0.8*inch, 0.9*inch, 2.5*inch])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#7c3aed')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('ALIGN', (2, 0), (4, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('FONTSIZE', (0, 1), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('TOPPADDING', (0, 1), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')])
-        ]))
-        
-        elements.append(table)
-        
-        doc.build(elements)
-        buffer.seek(0)
-        
-        registrar_auditoria("Reporte de asistencia generado", "Reportes", "PDF")
-        
-        return Response(
-            buffer.getvalue(),
-            mimetype='application/pdf',
-            headers={'Content-Disposition': f'attachment; filename="reporte_asistencia_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf"'}
-        )
-    except Exception as e:
-        flash(f"Error generando reporte: {e}", "danger")
+        desde, hasta = _rango_reporte_asistencia((request.args.get("desde") or "").strip(),
+                                                 (request.args.get("hasta") or "").strip())
+    except ValueError as e:
+        flash(f"Rango de fechas inválido: {e}", "warning")
         return redirect(url_for("reportes_listado"))
 
+    return _enviar_trabajo_reporte("asistencia", {"desde": desde.isoformat(), "hasta": hasta.isoformat()},
+                                   f"Reporte de asistencia del {desde:%d/%m/%Y} al {hasta:%d/%m/%Y}", "Reportes",
+                                   url_for("reportes_listado"),
+                                   ("Reporte de asistencia generado", f"PDF {desde} a {hasta}"))
+
+
+def _pdf_reporte_usuarios(salida, params: dict, progreso) -> dict:
+    """Reporte PDF de usuarios activos escrito en `salida`."""
+    # Obtener datos
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT u.NombreUsuario, r.Nombre as NombreRol,
+                       ISNULL(e.Nombres + ' ' + e.Apellidos, 'N/A') as Empleado,
+                       CASE WHEN u.Activo = 1 THEN 'Activo' ELSE 'Inactivo' END as Estado,
+                       CONVERT(VARCHAR(10), u.FechaCreacion, 103) as FechaCreacion
+                FROM Usuarios u
+                LEFT JOIN Roles r ON r.IdRol = u.IdRol
+                LEFT JOIN Empleados e ON e.IdEmpleado = u.IdEmpleado
+                WHERE u.Activo = 1
+                ORDER BY u.NombreUsuario
+            """)
+            usuarios = cur.fetchall()
+    progreso(len(usuarios), etapa="Leyendo usuarios")
+    
+    # Crear PDF
+    plantilla = REPORTE_USUARIOS
+    doc = documento_reporte(salida, plantilla)
+    elements = encabezado_reporte(plantilla, f"Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}")
+    
+    # Tabla
+    data = [plantilla.encabezado]
+    
+    for usr in usuarios:
+        data.append([
+            usr[0],
+            usr[1] or 'N/A',
+            usr[2],
+            usr[3],
+            usr[4]
+        ])
+    
+    table = Table(data, colWidths=plantilla.anchos)
+    table.setStyle(plantilla.estilo_tabla)
+    
+    elements.append(table)
+    elements.append(Spacer(1, 20))
+    elements.append(Paragraph(f"<b>Total de usuarios activos:</b> {len(usuarios)}", ESTILO_NORMAL))
+    
+    construir_pdf(doc, elements, progreso)
+    return {"nombre": f"reporte_usuarios_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
+            "mimetype": "application/pdf"}
+
 
 @app.route("/reportes/usuarios/pdf")
 @requiere_permiso_modulo("Reportes")
 def reporte_usuarios_pdf():
-    """Genera reporte PDF de usuarios activos."""
-    try:
-        from reportlab.lib.pagesizes import letter
-        from reportlab.lib import colors
-        from reportlab.lib.units import inch
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.enums import TA_CENTER
-        from datetime import datetime
-        
-        # Obtener datos
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT u.NombreUsuario, r.Nombre as NombreRol,
-                           ISNULL(e.Nombres + ' ' + e.Apellidos, 'N/A') as Empleado,
-                           CASE WHEN u.Activo = 1 THEN 'Activo' ELSE 'Inactivo' END as Estado,
-                           CONVERT(VARCHAR(10), u.FechaCreacion, 103) as FechaCreacion
-                    FROM Usuarios u
-                    LEFT JOIN Roles r ON r.IdRol = u.IdRol
-                    LEFT JOIN Empleados e ON e.IdEmpleado = u.IdEmpleado
-                    WHERE u.Activo = 1
-                    ORDER BY u.NombreUsuario
-                """)
-                usuarios = cur.fetchall()
-        
-        # Crear PDF
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter,
-                                rightMargin=30, leftMargin=30, topMargin=40, bottomMargin=30)
-        
-        elements = []
-        styles = getSampleStyleSheet()
-        
-        # Título
-        title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'],
-                                     fontSize=18, textColor=colors.HexColor('#dc2626'),
-                                     spaceAfter=6, alignment=TA_CENTER)
-        elements.append(Paragraph("REPORTE DE USUARIOS ACTIVOS", title_style))
-        
-        subtitle_style = ParagraphStyle('Subtitle', parent=styles['Normal'],
-                                       fontSize=10, textColor=colors.grey, alignment=TA_CENTER)
-        elements.append(Paragraph(f"Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}", subtitle_style))
-        elements.append(Spacer(1, 20))
-        
-        # Tabla
-        data = [['Usuario', 'Rol', 'Empleado Asociado', 'Estado', 'Fecha Creación']]
-        
-        for usr in usuarios:
-            data.append([
-                usr[0],
-                usr[1] or 'N/A',
-                usr[2],
-                usr[3],
-                usr[4]
-            ])
-        
-        table = Table(data, colWidths=[1.5*inch, 1.3*inch, 2*inch, 1*inch, 1.2*inch])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#dc2626')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('ALIGN', (3, 0), (3, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('FONTSIZE', (0, 1), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('TOPPADDING', (0, 1), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')])
-        ]))
-        
-        elements.append(table)
-        elements.append(Spacer(1, 20))
-        elements.append(Paragraph(f"<b>Total de usuarios activos:</b> {len(usuarios)}", styles['Normal']))
-        
-        doc.build(elements)
-        buffer.seek(0)
-        
-        registrar_auditoria("Reporte de usuarios generado", "Reportes", "PDF")
-        
-        return Response(
-            buffer.getvalue(),
-            mimetype='application/pdf',
-            headers={'Content-Disposition': f'attachment; filename="reporte_usuarios_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf"'}
-        )
-    except Exception as e:
-        flash(f"Error generando reporte: {e}", "danger")
-        return redirect(url_for("reportes_listado"))
+    """Encola el reporte PDF de usuarios activos."""
+    return _enviar_trabajo_reporte("usuarios", {}, "Reporte de usuarios activos", "Reportes",
+                                   url_for("reportes_listado"), ("Reporte de usuarios generado", "PDF"))
+
+
+cola_reportes.registrar("empleados", _pdf_reporte_empleados)
+cola_reportes.registrar("nomina_periodo", _pdf_reporte_nomina_periodo)
+cola_reportes.registrar("asistencia", _pdf_reporte_asistencia)
+cola_reportes.registrar("usuarios", _pdf_reporte_usuarios)
 
 
 @app.route("/nomina/periodos/<int:id_periodo>/generar", methods=["POST"])
@@ -1405,56 +1457,41 @@ def generar_nomina(id_periodo: int):
                 cur.execute("SELECT FechaInicio, FechaFin FROM PeriodosNomina WHERE IdPeriodo = ?", (id_periodo,))
                 fi, ff = cur.fetchone()
 
-                # Insertar RegistrosNomina para empleados activos que aún no lo tengan, prorrateado por asistencia
+                # Insertar RegistrosNomina para empleados activos que aún no lo tengan, prorrateado por asistencia.
+                # Los días con 'entrada' salen del resumen diario (AsistenciaDiaria): una fila por
+                # empleado y día, así que basta un COUNT(*) sobre el rango del periodo.
                 cur.execute(
                     """
                     DECLARE @fi DATE = ?, @ff DATE = ?;
                     DECLARE @diasPeriodo INT = DATEDIFF(DAY, @fi, @ff) + 1;
 
+                    WITH DiasAsistencia AS (
+                        SELECT d.IdEmpleado, COUNT(*) AS Dias
+                        FROM AsistenciaDiaria d
+                        WHERE d.Entradas > 0
+                          AND d.Fecha >= @fi
+                          AND d.Fecha <= @ff
+                        GROUP BY d.IdEmpleado
+                    )
                     INSERT INTO RegistrosNomina (IdEmpleado, IdPeriodo, SalarioBase, TotalPrestaciones, TotalDeducciones, SalarioNeto)
                     SELECT e.IdEmpleado,
                            ?,
-                           -- Regla: si días asistencia > 26 => salario completo; si no, proporcional por días/periodo
-                           CASE 
-                             WHEN (
-                               SELECT COUNT(DISTINCT CAST(a.FechaHora AS DATE))
-                               FROM Asistencias a
-                               WHERE a.IdEmpleado = e.IdEmpleado
-                                 AND a.Tipo = 'entrada'
-                                 AND CAST(a.FechaHora AS DATE) BETWEEN @fi AND @ff
-                             ) > 26 THEN e.SalarioBase
-                             WHEN @diasPeriodo > 0 THEN ROUND(
-                               e.SalarioBase * ISNULL(CAST((
-                                 SELECT COUNT(DISTINCT CAST(a.FechaHora AS DATE))
-                                 FROM Asistencias a
-                                 WHERE a.IdEmpleado = e.IdEmpleado
-                                   AND a.Tipo = 'entrada'
-                                   AND CAST(a.FechaHora AS DATE) BETWEEN @fi AND @ff
-                               ) AS FLOAT) / @diasPeriodo, 0), 2)
-                             ELSE e.SalarioBase
-                           END AS SalarioCalculado,
+                           s.SalarioCalculado,
                            0,
                            0,
                            -- Neto inicial igual al salario calculado (antes de ítems)
-                           CASE 
-                             WHEN (
-                               SELECT COUNT(DISTINCT CAST(a.FechaHora AS DATE))
-                               FROM Asistencias a
-                               WHERE a.IdEmpleado = e.IdEmpleado
-                                 AND a.Tipo = 'entrada'
-                                 AND CAST(a.FechaHora AS DATE) BETWEEN @fi AND @ff
-                             ) > 26 THEN e.SalarioBase
-                             WHEN @diasPeriodo > 0 THEN ROUND(
-                               e.SalarioBase * ISNULL(CAST((
-                                 SELECT COUNT(DISTINCT CAST(a.FechaHora AS DATE))
-                                 FROM Asistencias a
-                                 WHERE a.IdEmpleado = e.IdEmpleado
-                                   AND a.Tipo = 'entrada'
-                                   AND CAST(a.FechaHora AS DATE) BETWEEN @fi AND @ff
-                               ) AS FLOAT) / @diasPeriodo, 0), 2)
-                             ELSE e.SalarioBase
-                           END
+                           s.SalarioCalculado
                     FROM Empleados e
+                    LEFT JOIN DiasAsistencia da ON da.IdEmpleado = e.IdEmpleado
+                    CROSS APPLY (
+                        -- Regla: si días asistencia > 26 => salario completo; si no, proporcional por días/periodo
+                        SELECT CASE
+                                 WHEN ISNULL(da.Dias, 0) > 26 THEN e.SalarioBase
+                                 WHEN @diasPeriodo > 0 THEN ROUND(
+                                   e.SalarioBase * ISNULL(CAST(ISNULL(da.Dias, 0) AS FLOAT) / @diasPeriodo, 0), 2)
+                                 ELSE e.SalarioBase
+                               END AS SalarioCalculado
+                    ) s
                     WHERE e.FechaContratacion <= @ff
                       AND (e.FechaFin IS NULL OR e.FechaFin >= @fi)
                       AND NOT EXISTS (
@@ -1520,21 +1557,6 @@ def generar_nomina(id_periodo: int):
                 
                 # Procesar descuentos de préstamos activos
                 try:
-                    # Obtener préstamos activos con empleados que tienen nómina en este periodo
-                    cur.execute(
-                        """
-                        SELECT p.IdPrestamo, p.IdEmpleado, p.TipoDescuento, p.ValorDescuento, 
-                               p.MontoPendiente, rn.IdNomina, rn.SalarioBase
-                        FROM Prestamos p
-                        JOIN RegistrosNomina rn ON rn.IdEmpleado = p.IdEmpleado
-                        WHERE p.Estado = 'activo'
-                          AND p.MontoPendiente > 0
-                          AND rn.IdPeriodo = ?
-                        """,
-                        (id_periodo,)
-                    )
-                    prestamos_activos = cur.fetchall()
-                    
                     # Buscar o crear el beneficio/deducción "Préstamo"
                     cur.execute("SELECT IdBeneficioDeduccion FROM BeneficiosDeducciones WHERE Nombre = 'Préstamo'")
                     concepto_prestamo = cur.fetchone()
@@ -1551,181 +1573,222 @@ def generar_nomina(id_periodo: int):
                     
                     id_concepto_prestamo = concepto_prestamo[0]
                     
-                    # Procesar cada préstamo
-                    for prestamo in prestamos_activos:
-                        id_prestamo = prestamo[0]
-                        id_empleado = prestamo[1]
-                        tipo_descuento = prestamo[2]
-                        valor_descuento = prestamo[3]
-                        monto_pendiente = prestamo[4]
-                        id_nomina = prestamo[5]
-                        salario_base = prestamo[6]
-                        
-                        # Calcular monto a descontar
-                        if tipo_descuento == 'fijo':
-                            monto_descuento = min(valor_descuento, monto_pendiente)
-                        else:  # porcentaje
-                            monto_descuento = round(salario_base * valor_descuento / 100, 2)
-                            monto_descuento = min(monto_descuento, monto_pendiente)
-                        
-                        # No descontar si el monto es 0
-                        if monto_descuento <= 0:
-                            continue
-                        
-                        # Insertar el item de nómina
-                        cur.execute(
-                            """
-                            INSERT INTO ItemsNomina (IdNomina, IdBeneficioDeduccion, TipoItem, Monto, Descripcion)
-                            VALUES (?, ?, 'deduccion', ?, ?)
-                            """,
-                            (id_nomina, id_concepto_prestamo, monto_descuento, f'Préstamo #{id_prestamo}')
-                        )
-                        
-                        # Registrar el pago
-                        cur.execute(
-                            """
-                            INSERT INTO PrestamoPagos (IdPrestamo, IdPeriodo, IdNomina, MontoPagado)
-                            VALUES (?, ?, ?, ?)
-                            """,
-                            (id_prestamo, id_periodo, id_nomina, monto_descuento)
-                        )
-                        
-                        # Actualizar el monto pendiente del préstamo
-                        nuevo_pendiente = monto_pendiente - monto_descuento
-                        cur.execute(
-                            "UPDATE Prestamos SET MontoPendiente = ? WHERE IdPrestamo = ?",
-                            (nuevo_pendiente, id_prestamo)
-                        )
-                        
-                        # Si el préstamo está completamente pagado, marcar como pagado
-                        if nuevo_pendiente <= 0:
-                            cur.execute(
-                                "UPDATE Prestamos SET Estado = 'pagado', FechaFin = GETDATE() WHERE IdPrestamo = ?",
-                                (id_prestamo,)
-                            )
+                    # Descuento de todos los préstamos en un solo lote:
+                    # - fijo: min(ValorDescuento, MontoPendiente)
+                    # - porcentaje: min(ROUND(SalarioBase * ValorDescuento / 100, 2), MontoPendiente)
+                    # Los préstamos que ya tienen pago en este periodo se omiten, así generar
+                    # el periodo dos veces no vuelve a descontar.
+                    cur.execute(
+                        """
+                        SET NOCOUNT ON;
+                        DECLARE @idPeriodo INT = ?, @idConcepto INT = ?;
+                        DECLARE @Pagos TABLE (
+                            IdPrestamo INT PRIMARY KEY,
+                            IdNomina INT NOT NULL,
+                            Monto DECIMAL(18, 4) NOT NULL
+                        );
+
+                        INSERT INTO @Pagos (IdPrestamo, IdNomina, Monto)
+                        SELECT p.IdPrestamo, rn.IdNomina, m.Monto
+                        FROM Prestamos p
+                        JOIN RegistrosNomina rn ON rn.IdEmpleado = p.IdEmpleado
+                        CROSS APPLY (
+                            SELECT CASE WHEN p.TipoDescuento = 'fijo' THEN p.ValorDescuento
+                                        ELSE ROUND(rn.SalarioBase * p.ValorDescuento / 100, 2)
+                                   END AS Calculado
+                        ) c
+                        CROSS APPLY (
+                            SELECT CASE WHEN c.Calculado < p.MontoPendiente THEN c.Calculado
+                                        ELSE p.MontoPendiente
+                                   END AS Monto
+                        ) m
+                        WHERE p.Estado = 'activo'
+                          AND p.MontoPendiente > 0
+                          AND rn.IdPeriodo = @idPeriodo
+                          AND m.Monto > 0
+                          AND NOT EXISTS (
+                              SELECT 1 FROM PrestamoPagos pp
+                              WHERE pp.IdPrestamo = p.IdPrestamo AND pp.IdPeriodo = @idPeriodo
+                          );
+
+                        INSERT INTO ItemsNomina (IdNomina, IdBeneficioDeduccion, TipoItem, Monto, Descripcion)
+                        SELECT IdNomina, @idConcepto, 'deduccion', Monto, CONCAT(N'Préstamo #', IdPrestamo)
+                        FROM @Pagos;
+
+                        INSERT INTO PrestamoPagos (IdPrestamo, IdPeriodo, IdNomina, MontoPagado)
+                        SELECT IdPrestamo, @idPeriodo, IdNomina, Monto
+                        FROM @Pagos;
+
+                        -- Actualizar saldo y marcar como pagados los que llegan a 0
+                        UPDATE p
+                        SET p.MontoPendiente = p.MontoPendiente - pg.Monto,
+                            p.Estado = CASE WHEN p.MontoPendiente - pg.Monto <= 0 THEN 'pagado' ELSE p.Estado END,
+                            p.FechaFin = CASE WHEN p.MontoPendiente - pg.Monto <= 0 THEN GETDATE() ELSE p.FechaFin END
+                        FROM Prestamos p
+                        JOIN @Pagos pg ON pg.IdPrestamo = p.IdPrestamo;
+                        """,
+                        (id_periodo, id_concepto_prestamo)
+                    )
+                    # Consumir todos los resultados del lote para que aflore cualquier error
+                    while cur.nextset():
+                        pass
                 
                 except Exception as e_prestamo:
                     # Si hay error con préstamos, continuar con el resto
                     print(f"Error procesando préstamos: {e_prestamo}")
-                
+
+                # Totales guardados por nómina y por periodo
+                _actualizar_resumen_nomina(cur, id_periodo)
+                invalidar_comprobantes(cur, id_periodo=id_periodo)
                 conn.commit()
         flash("Registros de nómina generados para el periodo.", "success")
     except Exception as e:
         flash(f"Error generando registros de nómina: {e}", "danger")
     return redirect(url_for("periodos_listado"))
 
+def _actualizar_resumen_nomina(cur, id_periodo: int) -> None:
+    """Recalcula los totales guardados del periodo (por nómina y del periodo completo).
+
+    Actualiza TotalPrestaciones, TotalDeducciones, IGSSMonto, ISRMonto, SalarioBruto,
+    SalarioNeto y DiasLaborados de RegistrosNomina a partir de ItemsNomina/AsistenciaDiaria,
+    y reescribe la fila de ResumenPeriodosNomina. Se ejecuta en la transacción del
+    llamador, que es quien hace commit.
+    """
+    cur.execute(
+        """
+        SET NOCOUNT ON;
+        DECLARE @idPeriodo INT = ?;
+        DECLARE @desde DATE, @hasta DATE;
+        SELECT @desde = FechaInicio, @hasta = FechaFin
+        FROM PeriodosNomina
+        WHERE IdPeriodo = @idPeriodo;
+
+        WITH Totales AS (
+            SELECT i.IdNomina,
+                   SUM(CASE WHEN b.Tipo = 'deduccion' THEN i.Monto END) AS TotalDeducciones,
+                   SUM(CASE WHEN b.Tipo = 'prestacion' THEN i.Monto END) AS TotalPrestaciones,
+                   SUM(CASE WHEN i.TipoItem = 'deduccion' AND b.Nombre = 'IGSS' THEN i.Monto END) AS IGSSMonto,
+                   SUM(CASE WHEN i.TipoItem = 'deduccion' AND b.Nombre = 'ISR' THEN i.Monto END) AS ISRMonto
+            FROM RegistrosNomina rn
+            JOIN ItemsNomina i ON i.IdNomina = rn.IdNomina
+            JOIN BeneficiosDeducciones b ON b.IdBeneficioDeduccion = i.IdBeneficioDeduccion
+            WHERE rn.IdPeriodo = @idPeriodo
+            GROUP BY i.IdNomina
+        ),
+        Dias AS (
+            SELECT d.IdEmpleado, COUNT(*) AS DiasLaborados
+            FROM AsistenciaDiaria d
+            WHERE d.Entradas > 0
+              AND d.Fecha >= @desde
+              AND d.Fecha <= @hasta
+            GROUP BY d.IdEmpleado
+        )
+        UPDATE rn
+        SET rn.TotalPrestaciones = ISNULL(t.TotalPrestaciones, 0),
+            rn.TotalDeducciones = ISNULL(t.TotalDeducciones, 0),
+            rn.IGSSMonto = ISNULL(t.IGSSMonto, 0),
+            rn.ISRMonto = ISNULL(t.ISRMonto, 0),
+            rn.SalarioBruto = rn.SalarioBase + ISNULL(t.TotalPrestaciones, 0),
+            rn.SalarioNeto = rn.SalarioBase + ISNULL(t.TotalPrestaciones, 0) - ISNULL(t.TotalDeducciones, 0),
+            rn.DiasLaborados = ISNULL(d.DiasLaborados, 0)
+        FROM RegistrosNomina rn
+        LEFT JOIN Totales t ON t.IdNomina = rn.IdNomina
+        LEFT JOIN Dias d ON d.IdEmpleado = rn.IdEmpleado
+        WHERE rn.IdPeriodo = @idPeriodo;
+
+        DELETE FROM ResumenPeriodosNomina WHERE IdPeriodo = @idPeriodo;
+
+        IF @desde IS NOT NULL
+        BEGIN
+            INSERT INTO ResumenPeriodosNomina (IdPeriodo, Registros, TotalSalarioBase, TotalPrestaciones,
+                                               TotalDeducciones, TotalIGSS, TotalISR, TotalBruto, TotalNeto,
+                                               TotalDiasLaborados, FechaActualizacion)
+            SELECT @idPeriodo,
+                   COUNT(*),
+                   ISNULL(SUM(SalarioBase), 0),
+                   ISNULL(SUM(TotalPrestaciones), 0),
+                   ISNULL(SUM(TotalDeducciones), 0),
+                   ISNULL(SUM(IGSSMonto), 0),
+                   ISNULL(SUM(ISRMonto), 0),
+                   ISNULL(SUM(SalarioBruto), 0),
+                   ISNULL(SUM(SalarioNeto), 0),
+                   ISNULL(SUM(DiasLaborados), 0),
+                   SYSDATETIME()
+            FROM RegistrosNomina
+            WHERE IdPeriodo = @idPeriodo;
+        END
+        """,
+        (id_periodo,),
+    )
+    while cur.nextset():
+        pass
+
+
+_SQL_DETALLE_PERIODO = """
+    SELECT 
+        e.IdEmpleado,
+        e.Apellidos,
+        e.Nombres,
+        e.SalarioBase,
+        dias.DiasLaborados AS DiasLaborados,
+        e.NumeroIGSS AS NumeroIGSS,
+        ISNULL(r.TotalDeducciones, 0) AS TotalDeducciones,
+        ISNULL(r.TotalPrestaciones, 0) AS TotalBonificaciones,
+        ISNULL(r.IGSSMonto, 0) AS IGSSMonto,
+        ISNULL(r.ISRMonto, 0) AS DescuentoISR,
+        rn0.SalarioBase + ISNULL(r.TotalPrestaciones, 0) AS SalarioBruto,
+        rn0.SalarioBase + ISNULL(r.TotalPrestaciones, 0) - ISNULL(r.TotalDeducciones, 0) AS SalarioNeto,
+        -- IdNomina (para acciones, no se exporta en CSV)
+        r.IdNomina AS IdNomina
+    FROM PeriodosNomina p
+    JOIN Empleados e
+      ON e.FechaContratacion <= p.FechaFin
+     AND (e.FechaFin IS NULL OR e.FechaFin >= p.FechaInicio)
+    LEFT JOIN RegistrosNomina rn0 ON rn0.IdEmpleado = e.IdEmpleado AND rn0.IdPeriodo = p.IdPeriodo
+    -- Totales del empleado en el periodo (suma de todos sus registros, último IdNomina)
+    LEFT JOIN (
+        SELECT IdPeriodo, IdEmpleado,
+               SUM(TotalDeducciones) AS TotalDeducciones,
+               SUM(TotalPrestaciones) AS TotalPrestaciones,
+               SUM(IGSSMonto) AS IGSSMonto,
+               SUM(ISRMonto) AS ISRMonto,
+               MAX(IdNomina) AS IdNomina
+        FROM RegistrosNomina
+        GROUP BY IdPeriodo, IdEmpleado
+    ) r ON r.IdEmpleado = e.IdEmpleado AND r.IdPeriodo = p.IdPeriodo
+    -- Días laborados en vivo (días con entrada en el resumen diario): incluye marcas
+    -- registradas después de generar la nómina y empleados sin registro en el periodo
+    OUTER APPLY (
+        SELECT COUNT(*) AS DiasLaborados
+        FROM AsistenciaDiaria d
+        WHERE d.IdEmpleado = e.IdEmpleado
+          AND d.Entradas > 0
+          AND d.Fecha >= p.FechaInicio
+          AND d.Fecha <= p.FechaFin
+    ) dias
+    WHERE p.IdPeriodo = ?
+    ORDER BY e.Apellidos, e.Nombres
+"""
+
+
 def _consultar_detalle_periodo(id_periodo: int):
-    """Obtiene el detalle de nómina del periodo con agregados por empleado."""
+    """Obtiene el detalle de nómina del periodo con agregados por empleado.
+
+    Los totales se leen de las columnas que mantiene `_actualizar_resumen_nomina`
+    (sin agregar ItemsNomina en cada consulta). Empleados activos sin registro en
+    el periodo aparecen con totales en 0 y bruto/neto vacíos. Los días laborados
+    se cuentan en vivo sobre AsistenciaDiaria: el DiasLaborados guardado queda
+    fijo al generar y no vería las marcas del quiosco o importadas después.
+    Igual que la consulta original, un empleado con varios registros en el periodo
+    sale una vez por registro, todas con los totales sumados de sus registros, el
+    último IdNomina y bruto/neto calculados sobre el salario base de cada registro.
+    Columnas: IdEmpleado, Apellidos, Nombres, SalarioBase, DiasLaborados, NumeroIGSS,
+    TotalDeducciones, TotalBonificaciones, IGSSMonto, DescuentoISR, SalarioBruto,
+    SalarioNeto, IdNomina.
+    """
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT 
-                    e.IdEmpleado,
-                    e.Apellidos,
-                    e.Nombres,
-                    e.SalarioBase,
-                    -- Días laborados (conteo de días con 'entrada' dentro del rango del periodo)
-                    ISNULL((
-                        SELECT COUNT(*) 
-                        FROM (
-                            SELECT DISTINCT CAST(a.FechaHora AS date) AS Dia
-                            FROM Asistencias a
-                            WHERE a.IdEmpleado = e.IdEmpleado
-                              AND a.Tipo = 'entrada'
-                              AND CAST(a.FechaHora AS date) BETWEEN p.FechaInicio AND p.FechaFin
-                        ) d
-                    ), 0) AS DiasLaborados,
-                    -- Número IGSS (columna dedicada)
-                    e.NumeroIGSS AS NumeroIGSS,
-                    -- Total deducciones (según tipo del catálogo)
-                    ISNULL((
-                        SELECT SUM(i.Monto)
-                        FROM RegistrosNomina rn
-                        JOIN ItemsNomina i ON i.IdNomina = rn.IdNomina
-                        JOIN BeneficiosDeducciones b ON b.IdBeneficioDeduccion = i.IdBeneficioDeduccion
-                        WHERE rn.IdPeriodo = p.IdPeriodo
-                          AND rn.IdEmpleado = e.IdEmpleado
-                          AND b.Tipo = 'deduccion'
-                    ), 0) AS TotalDeducciones,
-                    -- Total bonificaciones (prestaciones) (según tipo del catálogo)
-                    ISNULL((
-                        SELECT SUM(i.Monto)
-                        FROM RegistrosNomina rn
-                        JOIN ItemsNomina i ON i.IdNomina = rn.IdNomina
-                        JOIN BeneficiosDeducciones b ON b.IdBeneficioDeduccion = i.IdBeneficioDeduccion
-                        WHERE rn.IdPeriodo = p.IdPeriodo
-                          AND rn.IdEmpleado = e.IdEmpleado
-                          AND b.Tipo = 'prestacion'
-                    ), 0) AS TotalBonificaciones,
-                    -- IGSS calculado por ItemsNomina con Beneficio 'IGSS'
-                    ISNULL((
-                        SELECT SUM(i.Monto)
-                        FROM RegistrosNomina rn
-                        JOIN ItemsNomina i ON i.IdNomina = rn.IdNomina
-                        JOIN BeneficiosDeducciones b ON b.IdBeneficioDeduccion = i.IdBeneficioDeduccion
-                        WHERE rn.IdPeriodo = p.IdPeriodo
-                          AND rn.IdEmpleado = e.IdEmpleado
-                          AND i.TipoItem = 'deduccion'
-                          AND b.Nombre = 'IGSS'
-                    ), 0) AS IGSSMonto,
-                    -- Descuento ISR (si existe un concepto llamado 'ISR')
-                    ISNULL((
-                        SELECT SUM(i.Monto)
-                        FROM RegistrosNomina rn
-                        JOIN ItemsNomina i ON i.IdNomina = rn.IdNomina
-                        JOIN BeneficiosDeducciones b ON b.IdBeneficioDeduccion = i.IdBeneficioDeduccion
-                        WHERE rn.IdPeriodo = p.IdPeriodo
-                          AND rn.IdEmpleado = e.IdEmpleado
-                          AND i.TipoItem = 'deduccion'
-                          AND b.Nombre = 'ISR'
-                    ), 0) AS DescuentoISR,
-                    -- Salario bruto (base + bonificaciones)
-                    (rn0.SalarioBase + ISNULL((
-                        SELECT SUM(i.Monto)
-                        FROM RegistrosNomina rn
-                        JOIN ItemsNomina i ON i.IdNomina = rn.IdNomina
-                        JOIN BeneficiosDeducciones b ON b.IdBeneficioDeduccion = i.IdBeneficioDeduccion
-                        WHERE rn.IdPeriodo = p.IdPeriodo
-                          AND rn.IdEmpleado = e.IdEmpleado
-                          AND b.Tipo = 'prestacion'
-                    ), 0)) AS SalarioBruto,
-                    -- Salario neto (base + bonificaciones - deducciones)
-                    (rn0.SalarioBase + ISNULL((
-                        SELECT SUM(i.Monto)
-                        FROM RegistrosNomina rn
-                        JOIN ItemsNomina i ON i.IdNomina = rn.IdNomina
-                        JOIN BeneficiosDeducciones b ON b.IdBeneficioDeduccion = i.IdBeneficioDeduccion
-                        WHERE rn.IdPeriodo = p.IdPeriodo
-                          AND rn.IdEmpleado = e.IdEmpleado
-                          AND b.Tipo = 'prestacion'
-                    ), 0)
-                    - ISNULL((
-                        SELECT SUM(i.Monto)
-                        FROM RegistrosNomina rn
-                        JOIN ItemsNomina i ON i.IdNomina = rn.IdNomina
-                        JOIN BeneficiosDeducciones b ON b.IdBeneficioDeduccion = i.IdBeneficioDeduccion
-                        WHERE rn.IdPeriodo = p.IdPeriodo
-                          AND rn.IdEmpleado = e.IdEmpleado
-                          AND b.Tipo = 'deduccion'
-                    ), 0)) AS SalarioNeto,
-                    -- IdNomina (para acciones, no se exporta en CSV)
-                    (
-                        SELECT TOP 1 rn.IdNomina
-                        FROM RegistrosNomina rn
-                        WHERE rn.IdPeriodo = p.IdPeriodo AND rn.IdEmpleado = e.IdEmpleado
-                        ORDER BY rn.IdNomina DESC
-                    ) AS IdNomina
-                FROM Empleados e
-                CROSS JOIN PeriodosNomina p
-                LEFT JOIN RegistrosNomina rn0 ON rn0.IdEmpleado = e.IdEmpleado AND rn0.IdPeriodo = p.IdPeriodo
-                WHERE p.IdPeriodo = ?
-                  AND e.FechaContratacion <= p.FechaFin
-                  AND (e.FechaFin IS NULL OR e.FechaFin >= p.FechaInicio)
-                ORDER BY e.Apellidos, e.Nombres
-                """,
-                (id_periodo,),
-            )
+            cur.execute(_SQL_DETALLE_PERIODO, (id_periodo,))
             return cur.fetchall()
 
 
@@ -1740,40 +1803,95 @@ def periodo_detalle(id_periodo: int):
         return render_template("nomina/periodo_detalle.html", filas=[], id_periodo=id_periodo)
 
 
+COLUMNAS_CSV_PERIODO = [
+    "IdEmpleado",
+    "Apellidos",
+    "Nombres",
+    "SalarioBase",
+    "DiasLaborados",
+    "NumeroIGSS",
+    "TotalDeducciones",
+    "TotalBonificaciones",
+    "IGSSMonto",
+    "DescuentoISR",
+    "SalarioBruto",
+    "SalarioNeto",
+]
+
+# Filas leídas por cada fetchmany al exportar
+CSV_LOTE_FILAS = max(1, _env_segundos("CSV_LOTE_FILAS", 1000))
+
+
+def _generar_csv_periodo(cur, tamano_lote: int = CSV_LOTE_FILAS):
+    """Genera el CSV del periodo por bloques (bytes UTF-8) leyendo el cursor con fetchmany.
+
+    Solo hay en memoria un lote de filas a la vez. Cierra el cursor al terminar.
+    """
+    output = io.StringIO()
+    writer = csv.writer(output)
+    try:
+        writer.writerow(COLUMNAS_CSV_PERIODO)
+        while True:
+            filas = cur.fetchmany(tamano_lote)
+            if not filas:
+                break
+            for r in filas:
+                # Excluir cualquier columna agregada al final (p.ej., IdNomina para acciones)
+                writer.writerow(list(r)[:12])
+            yield output.getvalue().encode("utf-8")
+            output.seek(0)
+            output.truncate(0)
+        resto = output.getvalue()
+        if resto:
+            yield resto.encode("utf-8")
+    except Exception as e:
+        # Los encabezados ya se enviaron: solo queda cortar el archivo
+        print(f"Error exportando CSV: {e}")
+    finally:
+        output.close()
+        cur.close()
+
+
+def _comprimir_gzip(partes):
+    """Comprime en gzip un iterable de bytes sin juntarlo en memoria."""
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 => formato gzip
+    for parte in partes:
+        datos = compresor.compress(parte)
+        if datos:
+            yield datos
+    yield compresor.flush()
+
+
 @app.route("/nomina/periodos/<int:id_periodo>/csv")
 @requiere_permiso_modulo("Periodos")
 def periodo_csv(id_periodo: int):
+    """Exporta el detalle del periodo en CSV como respuesta en streaming.
+
+    Con `?gzip=1` (y si el cliente acepta gzip) la respuesta va comprimida.
+    """
     try:
-        datos = _consultar_detalle_periodo(id_periodo)
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow([
-            "IdEmpleado",
-            "Apellidos",
-            "Nombres",
-            "SalarioBase",
-            "DiasLaborados",
-            "NumeroIGSS",
-            "TotalDeducciones",
-            "TotalBonificaciones",
-            "IGSSMonto",
-            "DescuentoISR",
-            "SalarioBruto",
-            "SalarioNeto",
-        ])
-        for r in datos:
-            # Excluir cualquier columna agregada al final (p.ej., IdNomina para acciones)
-            writer.writerow(list(r)[:12])
-        csv_data = output.getvalue()
-        output.close()
+        # La consulta se ejecuta aquí para que un error todavía pueda redirigir;
+        # las filas se leen mientras se envía la respuesta (conexión de la petición).
+        conn = get_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute(_SQL_DETALLE_PERIODO, (id_periodo,))
+        except Exception:
+            cur.close()
+            raise
+
+        partes = _generar_csv_periodo(cur)
+        headers = {"Content-Disposition": f"attachment; filename=periodo_{id_periodo}.csv"}
+        if request.args.get("gzip") == "1":
+            headers["Vary"] = "Accept-Encoding"
+            if "gzip" in request.accept_encodings:
+                partes = _comprimir_gzip(partes)
+                headers["Content-Encoding"] = "gzip"
 
-        from flask import Response
         return Response(
-            csv_data,
+            stream_with_context(partes),
             mimetype="text/csv",
-            headers={
-                "Content-Disposition": f"attachment; filename=periodo_{id_periodo}.csv"
-            },
+            headers=headers,
         )
     except Exception as e:
         flash(f"No se pudo generar CSV: {e}", "danger")
@@ -1890,6 +2008,18 @@ def beneficios_editar(id_beneficio: int):
                         """,
                         (nombre, tipo, tipo_calc, valor_num, descripcion, activo, id_beneficio),
                     )
+                    # Tipo y Nombre entran en los totales guardados: recalcular los periodos que usan el concepto
+                    cur.execute(
+                        """
+                        SELECT DISTINCT rn.IdPeriodo
+                        FROM ItemsNomina i
+                        JOIN RegistrosNomina rn ON rn.IdNomina = i.IdNomina
+                        WHERE i.IdBeneficioDeduccion = ?
+                        """,
+                        (id_beneficio,),
+                    )
+                    for (id_periodo,) in cur.fetchall():
+                        _actualizar_resumen_nomina(cur, id_periodo)
                     conn.commit()
             registrar_auditoria("Beneficio/Deducción actualizado", "BeneficiosDeducciones", f"ID: {id_beneficio}, Nombre: {nombre}")
             flash("Registro actualizado.", "success")
@@ -1922,10 +2052,23 @@ def beneficios_eliminar(id_beneficio: int):
     try:
         with get_connection() as conn:
             with conn.cursor() as cur:
+                # Periodos cuyos totales cambian al quitar el concepto
+                cur.execute(
+                    """
+                    SELECT DISTINCT rn.IdPeriodo
+                    FROM ItemsNomina i
+                    JOIN RegistrosNomina rn ON rn.IdNomina = i.IdNomina
+                    WHERE i.IdBeneficioDeduccion = ?
+                    """,
+                    (id_beneficio,),
+                )
+                periodos = [r[0] for r in cur.fetchall()]
                 # Eliminar primero items que lo referencian
                 cur.execute("DELETE FROM ItemsNomina WHERE IdBeneficioDeduccion = ?", (id_beneficio,))
                 # Luego el catálogo
                 cur.execute("DELETE FROM BeneficiosDeducciones WHERE IdBeneficioDeduccion = ?", (id_beneficio,))
+                for id_periodo in periodos:
+                    _actualizar_resumen_nomina(cur, id_periodo)
             conn.commit()
         flash("Beneficio/Deducción eliminado.", "success")
     except Exception as e:
@@ -1949,6 +2092,7 @@ def periodos_eliminar(id_periodo: int):
                     """,
                     (id_periodo,),
                 )
+                invalidar_comprobantes(cur, id_periodo=id_periodo)
                 # Borrar registros nómina del periodo
                 cur.execute("DELETE FROM RegistrosNomina WHERE IdPeriodo = ?", (id_periodo,))
                 # Borrar el periodo
@@ -1958,6 +2102,56 @@ def periodos_eliminar(id_periodo: int):
     except Exception as e:
         flash(f"No se pudo eliminar el periodo: {e}", "danger")
     return redirect(url_for("periodos_listado"))
+# =============================
+# Búsqueda de empleados (índice en memoria)
+# =============================
+def _cargar_textos_empleados():
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT IdEmpleado, CodigoEmpleado, Nombres, Apellidos, DocumentoIdentidad, NumeroIGSS FROM Empleados"
+            )
+            return cur.fetchall()
+
+
+indice_empleados = IndiceEmpleados(
+    crear_backend_version("empleados"),
+    _cargar_textos_empleados,
+    max_antiguedad=_env_segundos("BUSQUEDA_EMPLEADOS_MAX_ANTIGUEDAD", 600),
+)
+
+
+def _filtro_busqueda_empleados(busqueda: str, columna: str) -> tuple:
+    """(condición, params, cantidad) para filtrar `columna` por los IdEmpleado que encuentra el índice.
+
+    Los ids viajan como un solo parámetro JSON (OPENJSON), sin el límite de 2100 parámetros.
+    """
+    ids = indice_empleados.buscar(busqueda)
+    if not ids:
+        return "1 = 0", [], 0
+    return (
+        f"{columna} IN (SELECT CAST(value AS INT) FROM OPENJSON(?))",
+        [json.dumps(sorted(ids))],
+        len(ids),
+    )
+
+
+def _indexar_empleado(cur, id_empleado: int) -> None:
+    """Vuelve a indexar un empleado con sus datos guardados (si falla, se corrige al reconstruir)."""
+    try:
+        cur.execute(
+            "SELECT CodigoEmpleado, Nombres, Apellidos, DocumentoIdentidad, NumeroIGSS FROM Empleados WHERE IdEmpleado = ?",
+            (id_empleado,),
+        )
+        row = cur.fetchone()
+        if row:
+            indice_empleados.actualizar(id_empleado, *row)
+        else:
+            indice_empleados.eliminar(id_empleado)
+    except Exception as e:
+        print(f"Error actualizando índice de búsqueda del empleado {id_empleado}: {e}")
+
+
 # =============================
 # Control de Asistencia (esquema sugerido)
 # =============================
@@ -1975,44 +2169,106 @@ def asistencia_listado():
         Observacion VARCHAR(255) NULL
     );
     """
-    # Obtener filtros
-    busqueda = request.args.get("busqueda", "").strip()
-    
+    filtros = {
+        "busqueda": request.args.get("busqueda", "").strip(),
+        "desde": (request.args.get("desde") or "").strip(),
+        "hasta": (request.args.get("hasta") or "").strip(),
+        "empleado": (request.args.get("empleado") or "").strip(),
+        "tipo": (request.args.get("tipo") or "").strip(),
+    }
+    try:
+        tam = min(max(int(request.args.get("tam", 50)), 10), 500)
+    except ValueError:
+        tam = 50
+
+    # Rango de fechas sobre FechaHora (IX_Asistencias_FechaHora) y empleado (IX_Asistencias_IdEmpleado)
+    condiciones, params = [], []
+    for clave, operador, dias in (("desde", ">=", 0), ("hasta", "<", 1)):
+        if filtros[clave]:
+            try:
+                fecha = datetime.strptime(filtros[clave], "%Y-%m-%d") + timedelta(days=dias)
+                condiciones.append(f"a.FechaHora {operador} ?")
+                params.append(fecha)
+            except ValueError:
+                filtros[clave] = ""
+    if filtros["empleado"].isdigit():
+        condiciones.append("a.IdEmpleado = ?")
+        params.append(int(filtros["empleado"]))
+    else:
+        filtros["empleado"] = ""
+    if filtros["tipo"] in ("entrada", "salida"):
+        condiciones.append("a.Tipo = ?")
+        params.append(filtros["tipo"])
+    else:
+        filtros["tipo"] = ""
+    filtros_activos = {k: v for k, v in filtros.items() if v}
+    # Enlaces "ver solo este empleado" (desde cada fila) y "quitar empleado"
+    filtros_sin_empleado = {k: v for k, v in filtros_activos.items() if k != "empleado"}
+
+    # Cursor (FechaHora con 7 decimales, IdAsistencia); "antes" retrocede a la página anterior
+    columnas = ["a.FechaHora", "a.IdAsistencia"]
+    despues = decodificar_cursor(request.args.get("despues", ""), 2)
+    antes = None if despues else decodificar_cursor(request.args.get("antes", ""), 2)
+    cursor = despues or antes
+    hacia_atras = antes is not None
+
+    items, empleado_filtro, anterior, siguiente = [], None, None, None
     try:
         with get_connection() as conn:
             with conn.cursor() as cur:
-                if busqueda:
-                    # Filtrar por código o nombre
-                    cur.execute(
-                        """
-                        SELECT TOP 100 a.IdAsistencia, a.FechaHora, a.Tipo, a.Observacion,
-                               e.IdEmpleado, e.Nombres, e.Apellidos, e.CodigoEmpleado
-                        FROM Asistencias a
-                        JOIN Empleados e ON e.IdEmpleado = a.IdEmpleado
-                        WHERE e.CodigoEmpleado LIKE ?
-                           OR e.Nombres LIKE ?
-                           OR e.Apellidos LIKE ?
-                           OR (e.Nombres + ' ' + e.Apellidos) LIKE ?
-                        ORDER BY a.FechaHora DESC
-                        """,
-                        (f"%{busqueda}%", f"%{busqueda}%", f"%{busqueda}%", f"%{busqueda}%")
-                    )
-                else:
-                    # Sin filtro, mostrar todos
+                if filtros["busqueda"]:
+                    # Código, nombre, DPI o IGSS (índice de búsqueda de empleados)
+                    filtro, params_busqueda, _ = _filtro_busqueda_empleados(filtros["busqueda"], "a.IdEmpleado")
+                    condiciones.append(filtro)
+                    params.extend(params_busqueda)
+                if cursor:
+                    sql_cursor, indices = condicion_keyset(columnas, not hacia_atras)
+                    condiciones.append(sql_cursor)
+                    params.extend(cursor[i] for i in indices)
+                where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+                sentido = "ASC" if hacia_atras else "DESC"
+                cur.execute(
+                    f"""
+                    SELECT TOP (?) a.IdAsistencia, a.FechaHora, a.Tipo, a.Observacion,
+                           e.IdEmpleado, e.Nombres, e.Apellidos, e.CodigoEmpleado,
+                           CONVERT(varchar(27), a.FechaHora, 121) as CursorPagina
+                    FROM Asistencias a
+                    JOIN Empleados e ON e.IdEmpleado = a.IdEmpleado
+                    {where}
+                    ORDER BY a.FechaHora {sentido}, a.IdAsistencia {sentido}
+                    """,
+                    [tam + 1] + params,
+                )
+                items = cur.fetchall()
+                hay_mas = len(items) > tam
+                items = items[:tam]
+                if hacia_atras:
+                    items.reverse()
+                if items:
+                    primera = codificar_cursor([items[0][8], items[0][0]])
+                    ultima = codificar_cursor([items[-1][8], items[-1][0]])
+                    if hacia_atras:
+                        anterior = primera if hay_mas else None
+                        siguiente = ultima
+                    else:
+                        anterior = primera if cursor else None
+                        siguiente = ultima if hay_mas else None
+
+                if filtros["empleado"]:
                     cur.execute(
-                        """
-                        SELECT TOP 100 a.IdAsistencia, a.FechaHora, a.Tipo, a.Observacion,
-                               e.IdEmpleado, e.Nombres, e.Apellidos, e.CodigoEmpleado
-                        FROM Asistencias a
-                        JOIN Empleados e ON e.IdEmpleado = a.IdEmpleado
-                        ORDER BY a.FechaHora DESC
-                        """
+                        "SELECT IdEmpleado, Nombres, Apellidos, CodigoEmpleado FROM Empleados WHERE IdEmpleado = ?",
+                        (int(filtros["empleado"]),),
                     )
-                rows = cur.fetchall()
-        return render_template("asistencia/list.html", items=rows, tabla_ok=True, busqueda=busqueda)
+                    empleado_filtro = cur.fetchone()
+        tabla_ok = True
     except Exception as e:
         flash(f"No se pudo consultar asistencias: {e}", "warning")
-        return render_template("asistencia/list.html", items=[], tabla_ok=False, busqueda=busqueda)
+        tabla_ok = False
+    return render_template(
+        "asistencia/list.html", items=items, tabla_ok=tabla_ok, busqueda=filtros["busqueda"],
+        filtros=filtros, filtros_activos=filtros_activos, filtros_sin_empleado=filtros_sin_empleado,
+        empleado_filtro=empleado_filtro, tam=tam, anterior=anterior, siguiente=siguiente,
+    )
 
 
 @app.route("/asistencia/nuevo", methods=["GET", "POST"])
@@ -2036,12 +2292,14 @@ def asistencia_nuevo():
                         flash("Empleado no existe.", "warning")
                         return render_template("asistencia/new.html", empleados=[])
 
-                    # Insertar (si la tabla existe)
+                    # Insertar y actualizar el resumen del día en la misma transacción
                     cur.execute(
                         """
+                        SET NOCOUNT ON;
+                        DECLARE @id INT = ?, @ahora DATETIME2 = GETDATE();
                         INSERT INTO Asistencias (IdEmpleado, FechaHora, Tipo, Observacion)
-                        VALUES (?, GETDATE(), ?, ?)
-                        """,
+                        VALUES (@id, @ahora, ?, ?);
+                        """ + recalcular_sql("SELECT @id AS IdEmpleado, CAST(@ahora AS DATE) AS Fecha"),
                         (id_empleado, tipo, observacion),
                     )
                     conn.commit()
@@ -2064,54 +2322,406 @@ def asistencia_nuevo():
     return render_template("asistencia/new.html", empleados=empleados)
 
 
+# Marcas por lote de fast_executemany al importar archivos de relojes
+ASISTENCIA_IMPORTAR_LOTE = max(1, _env_segundos("ASISTENCIA_IMPORTAR_LOTE", 5000))
+
+
+def _layout_ancho_fijo() -> dict:
+    texto = os.getenv("ASISTENCIA_ANCHO_FIJO")
+    return parsear_ancho_fijo(texto) if texto else ANCHO_FIJO_DEFAULT
+
+
+def _ejecutar_importacion(lineas, formato: str, nombre: str, max_rechazos: int = 1000, progreso=None) -> dict:
+    inicio = datetime.now()
+    with get_connection() as conn:
+        resultado = importar_asistencias(
+            conn, lineas, formato=formato, nombre=nombre, tamano_lote=ASISTENCIA_IMPORTAR_LOTE,
+            max_rechazos=max_rechazos, layout=_layout_ancho_fijo(), progreso=progreso,
+        )
+    resultado["segundos"] = (datetime.now() - inicio).total_seconds()
+    return resultado
+
+
+def _trabajo_importar_asistencias(salida, params: dict, progreso) -> dict:
+    """Importa el archivo subido (guardado en REPORTES_DIR) y deja las filas rechazadas como CSV."""
+    try:
+        with open(params["archivo"], "r", encoding="utf-8-sig", errors="replace", newline="") as fh:
+            resultado = _ejecutar_importacion(fh, params["formato"], params["nombre"], max_rechazos=1000000,
+                                              progreso=progreso)
+    finally:
+        try:
+            os.remove(params["archivo"])
+        except OSError:
+            pass
+    resumen = (f"{resultado['leidas']} leídas, {resultado['insertadas']} insertadas, "
+               f"{resultado['duplicadas']} duplicadas, {resultado['rechazadas']} rechazadas "
+               f"({resultado['segundos']:.1f} s)")
+    # Sin contexto de petición: la auditoría se encola directo con los datos de quien subió el archivo
+    escritor_auditoria.registrar(params["usuario"], params["nombre_usuario"], "Asistencia importada", "Asistencia",
+                                 f"{params['nombre']}: {resumen}", params["ip"])
+    texto = io.TextIOWrapper(salida, encoding="utf-8-sig", newline="")
+    escribir_rechazos_csv(texto, resultado["rechazos"])
+    texto.flush()
+    texto.detach()
+    nombre = os.path.splitext(params["nombre"])[0]
+    return {"nombre": f"rechazos_{nombre}.csv", "mimetype": "text/csv", "resumen": resumen}
+
+
+cola_reportes.registrar("asistencia_importar", _trabajo_importar_asistencias)
+
+
+@app.route("/asistencia/importar", methods=["GET", "POST"])
+@requiere_permiso_modulo("Asistencia")
+def asistencia_importar():
+    """Importa un archivo de marcas de reloj en segundo plano (cola de reportes) y muestra su avance.
+
+    El archivo se guarda en REPORTES_DIR (en streaming, hasta MAX_SUBIDA_MB) y el trabajo
+    lo lee desde ahí; al terminar se descargan las filas rechazadas como CSV.
+    """
+    layout_texto = ", ".join(f"{k} {i}-{f}" for k, (i, f) in _layout_ancho_fijo().items())
+    if request.method == "POST":
+        archivo = request.files.get("archivo")
+        formato = "fijo" if request.form.get("formato") == "fijo" else "csv"
+        if not archivo or not archivo.filename:
+            flash("Selecciona un archivo.", "warning")
+            return render_template("asistencia/importar.html", layout_texto=layout_texto)
+        ruta = os.path.join(cola_reportes.directorio, f"subida_{uuid.uuid4().hex}.dat")
+        params = {
+            "archivo": ruta, "formato": formato, "nombre": archivo.filename,
+            "usuario": session.get("user_id"), "nombre_usuario": session.get("username"), "ip": request.remote_addr,
+        }
+        try:
+            os.makedirs(cola_reportes.directorio, exist_ok=True)
+            archivo.save(ruta)
+            trabajo, _ = cola_reportes.enviar("asistencia_importar", params, session.get("user_id"), "Asistencia",
+                                              f"Importación de {archivo.filename}")
+        except Exception as e:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+            if isinstance(e, LimiteTrabajos):
+                flash(str(e), "warning")
+            else:
+                flash(f"No se pudo importar el archivo: {e}", "danger")
+            return render_template("asistencia/importar.html", layout_texto=layout_texto)
+        return redirect(url_for("reporte_trabajo", id_trabajo=trabajo["id"]))
+    return render_template("asistencia/importar.html", layout_texto=layout_texto)
+
+
+@app.errorhandler(413)
+def peticion_muy_grande(e):
+    if request.path.startswith("/api/"):
+        return {"error": f"La petición supera el máximo permitido ({_max_subida_mb} MB)"}, 413
+    flash(f"El archivo supera el máximo permitido ({_max_subida_mb} MB).", "warning")
+    return redirect(request.url)
+
+
+@app.cli.command("asistencia-importar")
+@click.argument("archivo", type=click.Path(exists=True, dir_okay=False))
+@click.option("--formato", type=click.Choice(["csv", "fijo"]), default="csv", show_default=True)
+@click.option("--rechazos", type=click.Path(dir_okay=False), default=None,
+              help="CSV donde guardar las filas rechazadas (default: <archivo>.rechazos.csv si hay)")
+def asistencia_importar_cli(archivo: str, formato: str, rechazos):
+    """Importa un archivo de marcas de reloj biométrico a Asistencias."""
+    with open(archivo, "r", encoding="utf-8-sig", errors="replace", newline="") as fh:
+        resultado = _ejecutar_importacion(fh, formato, os.path.basename(archivo), max_rechazos=1000000)
+    click.echo(
+        f"{resultado['leidas']} leídas, {resultado['insertadas']} insertadas, "
+        f"{resultado['duplicadas']} duplicadas, {resultado['rechazadas']} rechazadas "
+        f"({resultado['segundos']:.1f}s)"
+    )
+    if resultado["rechazos"]:
+        ruta = rechazos or f"{archivo}.rechazos.csv"
+        escribir_rechazos(ruta, resultado["rechazos"])
+        click.echo(f"Filas rechazadas en {ruta}")
+
+
+@app.cli.command("asistencia-diaria-backfill")
+@click.option("--desde", type=click.DateTime(formats=["%Y-%m-%d"]), default=None,
+              help="Primer día a reconstruir (default: primera marca)")
+@click.option("--hasta", type=click.DateTime(formats=["%Y-%m-%d"]), default=None,
+              help="Último día a reconstruir (default: última marca)")
+@click.option("--lote", type=int, default=31, show_default=True, help="Días por transacción")
+def asistencia_diaria_backfill_cli(desde, hasta, lote: int):
+    """Reconstruye el resumen diario AsistenciaDiaria a partir de Asistencias."""
+    def progreso(inicio, fin, filas):
+        click.echo(f"{inicio:%Y-%m-%d} a {fin:%Y-%m-%d}: {filas} día(s)")
+
+    with get_connection() as conn:
+        total = backfill_asistencia_diaria(conn, desde, hasta, dias_por_lote=lote, progreso=progreso)
+    click.echo(f"{total} fila(s) escritas en AsistenciaDiaria")
+
+
+@app.cli.command("asistencia-diaria-verificar")
+@click.option("--desde", type=click.DateTime(formats=["%Y-%m-%d"]), default=None)
+@click.option("--hasta", type=click.DateTime(formats=["%Y-%m-%d"]), default=None)
+@click.option("--corregir", is_flag=True, help="Recalcular los días con diferencias")
+def asistencia_diaria_verificar_cli(desde, hasta, corregir: bool):
+    """Compara AsistenciaDiaria con Asistencias; sale con código 1 si hay diferencias sin corregir."""
+    with get_connection() as conn:
+        resultado = verificar_asistencia_diaria(conn, desde, hasta, corregir=corregir)
+    for id_empleado, fecha, motivo in resultado["detalle"]:
+        click.echo(f"  {motivo:<9} IdEmpleado={id_empleado} Fecha={fecha}")
+    click.echo(f"{resultado['faltantes']} faltante(s) o distinta(s), {resultado['sobrantes']} sobrante(s), "
+               f"{resultado['corregidas']} corregida(s)")
+    if (resultado["faltantes"] or resultado["sobrantes"]) and not corregir:
+        raise SystemExit(1)
+
+
+# =============================
+# Kioscos de asistencia (API JSON)
+# =============================
+try:
+    _kiosco_lote = int(os.getenv("KIOSCO_LOTE", "500"))
+    _kiosco_intervalo = float(os.getenv("KIOSCO_INTERVALO", "1"))
+    _kiosco_cola = int(os.getenv("KIOSCO_MAX_COLA", "20000"))
+except ValueError:
+    _kiosco_lote, _kiosco_intervalo, _kiosco_cola = 500, 1.0, 20000
+escritor_marcas = EscritorMarcas(
+    os.getenv("KIOSCO_SPILL", os.path.join("instance", "kiosco_spill.jsonl")),
+    tamano_lote=_kiosco_lote,
+    intervalo=_kiosco_intervalo,
+    max_cola=_kiosco_cola,
+)
+KIOSCO_TOKENS = [t.strip() for t in os.getenv("KIOSCO_TOKENS", "").split(",") if t.strip()]
+KIOSCO_MAX_MARCAS = 1000  # marcas por petición
+_mapa_kiosco = {"version": None, "cargado": None, "mapa": None}
+
+
+def _mapa_empleados_kiosco() -> MapaEmpleados:
+    """Código -> IdEmpleado en memoria; se recarga si cambian los empleados o cada 5 minutos."""
+    version = indice_empleados.backend.actual()
+    ahora = datetime.now()
+    if (_mapa_kiosco["mapa"] is None or _mapa_kiosco["version"] != version
+            or ahora - _mapa_kiosco["cargado"] > timedelta(minutes=5)):
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT IdEmpleado, CodigoEmpleado FROM Empleados")
+                _mapa_kiosco.update(version=version, cargado=ahora, mapa=MapaEmpleados(cur.fetchall()))
+    return _mapa_kiosco["mapa"]
+
+
+def _token_kiosco():
+    """Token de KIOSCO_TOKENS con el que se autenticó la petición, o None."""
+    auth = request.headers.get("Authorization", "")
+    token = auth[7:].strip() if auth.lower().startswith("bearer ") else request.headers.get("X-Kiosco-Token", "")
+    if not token:
+        return None
+    return next((t for t in KIOSCO_TOKENS if hmac.compare_digest(token, t)), None)
+
+
+def _clave_kiosco(token: str, dispositivo, clave: str) -> str:
+    """Clave de idempotencia propia del kiosco (token + dispositivo) que se guarda en ClaveIdempotencia.
+
+    Dos kioscos que generen la misma clave no se pisan. Es un SHA-256 en hex
+    (64 caracteres, el ancho de la columna), así el token no queda en la base.
+    """
+    texto = json.dumps([token, dispositivo or "", clave])
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def _validar_marca(marca, mapa: MapaEmpleados, limite_futuro: datetime) -> tuple:
+    """(IdEmpleado, FechaHora, Tipo) o lanza ValueError con el motivo."""
+    if not isinstance(marca, dict):
+        raise ValueError("La marca debe ser un objeto")
+    id_empleado = mapa.get(str(marca.get("codigo") or ""))
+    if id_empleado is None:
+        raise ValueError("Código de empleado no registrado")
+    try:
+        fecha_hora = datetime.fromisoformat(str(marca.get("fecha_hora") or "").replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError("fecha_hora inválida (ISO 8601)")
+    if fecha_hora.tzinfo is not None:
+        fecha_hora = fecha_hora.astimezone().replace(tzinfo=None)
+    if fecha_hora > limite_futuro:
+        raise ValueError("fecha_hora en el futuro (revisar el reloj del kiosco)")
+    tipo = TIPOS_MARCA.get(str(marca.get("tipo") or "").strip().lower())
+    if tipo is None:
+        raise ValueError("tipo inválido (entrada/salida)")
+    return id_empleado, fecha_hora, tipo
+
+
+@app.route("/api/asistencia/marcas", methods=["POST"])
+def api_asistencia_marcas():
+    """Recibe una marca o un lote desde un kiosco y responde sin esperar la escritura (202).
+
+    Cuerpo: {"codigo", "fecha_hora", "tipo", "clave"} o {"dispositivo": "...", "marcas": [...]}.
+    `fecha_hora` es la hora del dispositivo (ISO 8601) y `clave` la clave de idempotencia de
+    la marca (o el encabezado Idempotency-Key). Autenticación: Authorization: Bearer <KIOSCO_TOKENS>.
+    """
+    token = _token_kiosco() if KIOSCO_TOKENS else None
+    if not token:
+        return {"error": "No autorizado"}, 401
+
+    datos = request.get_json(silent=True)
+    dispositivo = None
+    if isinstance(datos, dict):
+        dispositivo = datos.get("dispositivo")
+        marcas = datos["marcas"] if "marcas" in datos else [datos]
+    elif isinstance(datos, list):
+        marcas = datos
+    else:
+        return {"error": "Se esperaba JSON"}, 400
+    if not isinstance(marcas, list) or not marcas:
+        return {"error": "No hay marcas"}, 400
+    if len(marcas) > KIOSCO_MAX_MARCAS:
+        return {"error": f"Máximo {KIOSCO_MAX_MARCAS} marcas por envío"}, 413
+
+    try:
+        mapa = _mapa_empleados_kiosco()
+    except Exception as e:
+        return {"error": f"No se pudo consultar empleados: {e}"}, 503
+
+    clave_peticion = (request.headers.get("Idempotency-Key") or "").strip()
+    observacion = f"Kiosco {dispositivo}" if dispositivo else "Kiosco"
+    limite_futuro = datetime.now() + timedelta(minutes=10)
+    conteo = {"aceptada": 0, "duplicada": 0, "rechazada": 0, "descartada": 0}
+    resultados = []
+    for i, marca in enumerate(marcas):
+        clave = str(marca.get("clave") or "").strip() if isinstance(marca, dict) else ""
+        if not clave and clave_peticion:
+            clave = clave_peticion if len(marcas) == 1 else f"{clave_peticion}:{i}"
+        resultado = {"indice": i, "clave": clave or None}
+        try:
+            if len(clave) > 64:
+                raise ValueError("clave de más de 64 caracteres")
+            id_empleado, fecha_hora, tipo = _validar_marca(marca, mapa, limite_futuro)
+            clave_kiosco = _clave_kiosco(token, dispositivo, clave) if clave else None
+            estado = escritor_marcas.registrar(id_empleado, fecha_hora, tipo, observacion, clave_kiosco)
+        except ValueError as e:
+            estado = "rechazada"
+            resultado["motivo"] = str(e)
+        conteo[estado] += 1
+        resultado["estado"] = estado
+        resultados.append(resultado)
+
+    respuesta = {
+        "aceptadas": conteo["aceptada"],
+        "duplicadas": conteo["duplicada"],
+        "rechazadas": conteo["rechazada"],
+        "descartadas": conteo["descartada"],
+        "resultados": resultados,
+    }
+    if conteo["descartada"]:
+        # Búfer y respaldo llenos: el kiosco debe reintentar (las claves evitan duplicados)
+        return respuesta, 503, {"Retry-After": "5"}
+    return respuesta, 202
+
+
 # =============================
 # Empleados (listar y crear)
 # =============================
+# Orden del listado de empleados: columnas de la clave del cursor (la última siempre es IdEmpleado).
+# Las columnas opcionales van con ISNULL para que el cursor no tenga que comparar NULL.
+_ORDEN_EMPLEADOS = {
+    "apellidos": ["Apellidos", "Nombres", "IdEmpleado"],
+    "nombres": ["Nombres", "Apellidos", "IdEmpleado"],
+    "id": ["IdEmpleado"],
+    "codigo": ["CodigoEmpleado", "IdEmpleado"],
+    "inicio": ["FechaContratacion", "IdEmpleado"],
+    "fin": ["ISNULL(FechaFin, '9999-12-31')", "IdEmpleado"],
+    "salario": ["SalarioBase", "IdEmpleado"],
+    "dpi": ["DocumentoIdentidad", "IdEmpleado"],
+    "igss": ["ISNULL(NumeroIGSS, '')", "IdEmpleado"],
+    "nacimiento": ["ISNULL(FechaNacimiento, '0001-01-01')", "IdEmpleado"],
+}
+_COLS_LISTA_EMPLEADOS = 10  # columnas que muestra la tabla; después vienen las de la clave
+
+
 @app.route("/empleados")
 @requiere_permiso_modulo("Empleados")
 def empleados_listado():
-    # Obtener filtros
+    """Listado paginado por cursor (keyset) sobre la columna de orden elegida + IdEmpleado."""
     busqueda = request.args.get("busqueda", "").strip()
-    
+    orden = request.args.get("orden", "apellidos")
+    if orden not in _ORDEN_EMPLEADOS:
+        orden = "apellidos"
+    descendente = request.args.get("dir") == "desc"
+    try:
+        tam = min(max(int(request.args.get("tam", 50)), 10), 500)
+    except ValueError:
+        tam = 50
+    columnas = _ORDEN_EMPLEADOS[orden]
+
+    # Filtros (se conservan en los enlaces de página)
+    condiciones, params = [], []
+    empleados, anterior, siguiente, total = [], None, None, None
+    try:
+        if busqueda:
+            filtro, params, total = _filtro_busqueda_empleados(busqueda, "IdEmpleado")
+            condiciones.append(filtro)
+    except Exception as e:
+        flash(f"Error en la búsqueda de empleados: {e}", "danger")
+        return render_template(
+            "empleados/list.html", empleados=[], busqueda=busqueda, orden=orden,
+            dir="desc" if descendente else "asc", tam=tam, anterior=None, siguiente=None, total=None,
+        )
+
+    # "despues" avanza desde la última fila; "antes" retrocede desde la primera
+    despues = decodificar_cursor(request.args.get("despues", ""), len(columnas))
+    antes = None if despues else decodificar_cursor(request.args.get("antes", ""), len(columnas))
+    cursor = despues or antes
+    hacia_atras = antes is not None
+    if cursor:
+        sql_cursor, indices = condicion_keyset(columnas, descendente != hacia_atras)
+        condiciones.append(sql_cursor)
+        params.extend(cursor[i] for i in indices)
+    where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+    sentido = "DESC" if descendente != hacia_atras else "ASC"
+    order_by = ", ".join(f"{c} {sentido}" for c in columnas)
+    clave = ", ".join(columnas)
+
     try:
         with get_connection() as conn:
             with conn.cursor() as cur:
-                if busqueda:
-                    # Filtrar por código o nombre
-                    cur.execute(
-                        """
-                        SELECT IdEmpleado, CodigoEmpleado, Nombres, Apellidos, 
-                               CONVERT(varchar(10), FechaContratacion, 23) as FechaInicio,
-                               CONVERT(varchar(10), FechaFin, 23) as FechaFin,
-                               SalarioBase, DocumentoIdentidad, NumeroIGSS,
-                               CONVERT(varchar(10), FechaNacimiento, 23) as FechaNacimiento
-                        FROM Empleados
-                        WHERE CodigoEmpleado LIKE ? 
-                           OR Nombres LIKE ?
-                           OR Apellidos LIKE ?
-                           OR (Nombres + ' ' + Apellidos) LIKE ?
-                        ORDER BY Apellidos, Nombres
-                        """,
-                        (f"%{busqueda}%", f"%{busqueda}%", f"%{busqueda}%", f"%{busqueda}%")
-                    )
-                else:
-                    # Sin filtro, mostrar todos
+                cur.execute(
+                    f"""
+                    SELECT TOP (?) IdEmpleado, CodigoEmpleado, Nombres, Apellidos,
+                           CONVERT(varchar(10), FechaContratacion, 23) as FechaInicio,
+                           CONVERT(varchar(10), FechaFin, 23) as FechaFin,
+                           SalarioBase, DocumentoIdentidad, NumeroIGSS,
+                           CONVERT(varchar(10), FechaNacimiento, 23) as FechaNacimiento,
+                           {clave}
+                    FROM Empleados
+                    {where}
+                    ORDER BY {order_by}
+                    """,
+                    [tam + 1] + params,
+                )
+                empleados = cur.fetchall()
+                hay_mas = len(empleados) > tam
+                empleados = empleados[:tam]
+                if hacia_atras:
+                    empleados.reverse()
+                if empleados:
+                    primera = codificar_cursor(empleados[0][_COLS_LISTA_EMPLEADOS:])
+                    ultima = codificar_cursor(empleados[-1][_COLS_LISTA_EMPLEADOS:])
+                    if hacia_atras:
+                        anterior = primera if hay_mas else None
+                        siguiente = ultima
+                    else:
+                        anterior = primera if cursor else None
+                        siguiente = ultima if hay_mas else None
+
+                # Sin búsqueda, total aproximado desde los metadatos (sin contar la tabla);
+                # con búsqueda, el índice ya sabe cuántos coinciden
+                if not busqueda:
                     cur.execute(
                         """
-                        SELECT IdEmpleado, CodigoEmpleado, Nombres, Apellidos, 
-                               CONVERT(varchar(10), FechaContratacion, 23) as FechaInicio,
-                               CONVERT(varchar(10), FechaFin, 23) as FechaFin,
-                               SalarioBase, DocumentoIdentidad, NumeroIGSS,
-                               CONVERT(varchar(10), FechaNacimiento, 23) as FechaNacimiento
-                        FROM Empleados
-                        ORDER BY Apellidos, Nombres
+                        SELECT SUM(rows) FROM sys.partitions
+                        WHERE object_id = OBJECT_ID('Empleados') AND index_id IN (0, 1)
                         """
                     )
-                empleados = cur.fetchall()
-        return render_template("empleados/list.html", empleados=empleados, busqueda=busqueda)
+                    total = cur.fetchone()[0]
     except Exception as e:
         flash(f"Error cargando empleados: {e}", "danger")
-        return render_template("empleados/list.html", empleados=[], busqueda=busqueda)
+
+    return render_template(
+        "empleados/list.html", empleados=empleados, busqueda=busqueda, orden=orden,
+        dir="desc" if descendente else "asc", tam=tam, anterior=anterior, siguiente=siguiente,
+        total=total,
+    )
 
 
 @app.route("/empleados/nuevo", methods=["GET", "POST"])
@@ -2194,14 +2804,17 @@ def empleados_nuevo():
                             CodigoEmpleado, Nombres, Apellidos, DocumentoIdentidad,
                             FechaContratacion, FechaFin, SalarioBase, NumeroIGSS, FechaNacimiento,
                             Correo, IdPuesto
-                        ) VALUES (?,?,?,?,?,?,?,?,?,?,?)
+                        ) OUTPUT INSERTED.IdEmpleado
+                        VALUES (?,?,?,?,?,?,?,?,?,?,?)
                         """,
                         (
                             codigo, nombres, apellidos, dpi,
                             fi, ff, salario_num, igss, fn, correo, id_puesto
                         ),
                     )
+                    id_nuevo = cur.fetchone()[0]
                     conn.commit()
+                    _indexar_empleado(cur, id_nuevo)
             flash("Empleado creado.", "success")
             return redirect(url_for("empleados_listado"))
         except Exception as e:
@@ -2297,6 +2910,7 @@ def empleados_editar(id_empleado: int):
                         WHERE IdEmpleado = ?
                     """, (nombres, apellidos, dpi, fi, ff, salario_num, igss, fn, correo, id_puesto, id_empleado))
                     conn.commit()
+                    _indexar_empleado(cur, id_empleado)
             
             flash("Empleado actualizado.", "success")
             return redirect(url_for("empleados_listado"))
@@ -2433,6 +3047,8 @@ def empleados_eliminar(id_empleado: int):
     try:
         with get_connection() as conn:
             with conn.cursor() as cur:
+                cur.execute("SELECT IdPeriodo FROM RegistrosNomina WHERE IdEmpleado = ?", (id_empleado,))
+                periodos = [r[0] for r in cur.fetchall()]
                 # Eliminar dependencias de nómina del empleado
                 cur.execute(
                     """
@@ -2444,10 +3060,13 @@ def empleados_eliminar(id_empleado: int):
                     (id_empleado,),
                 )
                 cur.execute("DELETE FROM RegistrosNomina WHERE IdEmpleado = ?", (id_empleado,))
-                # Asistencias tiene ON DELETE CASCADE (según DDL sugerido)
+                for id_periodo in periodos:
+                    _actualizar_resumen_nomina(cur, id_periodo)
+                # Asistencias y AsistenciaDiaria tienen ON DELETE CASCADE (según DDL sugerido)
                 # Finalmente eliminar empleado
                 cur.execute("DELETE FROM Empleados WHERE IdEmpleado = ?", (id_empleado,))
-            conn.commit()
+                conn.commit()
+                _indexar_empleado(cur, id_empleado)
         flash("Empleado eliminado.", "success")
     except Exception as e:
         flash(f"No se pudo eliminar el empleado: {e}", "danger")
@@ -2592,10 +3211,15 @@ def registro_nomina_eliminar(id_nomina: int):
     try:
         with get_connection() as conn:
             with conn.cursor() as cur:
+                cur.execute("SELECT IdPeriodo FROM RegistrosNomina WHERE IdNomina = ?", (id_nomina,))
+                row = cur.fetchone()
                 # Borrar items dependientes primero
                 cur.execute("DELETE FROM ItemsNomina WHERE IdNomina = ?", (id_nomina,))
                 # Borrar el registro de nómina
                 cur.execute("DELETE FROM RegistrosNomina WHERE IdNomina = ?", (id_nomina,))
+                if row:
+                    _actualizar_resumen_nomina(cur, row[0])
+                invalidar_comprobantes(cur, id_nomina=id_nomina)
             conn.commit()
         flash("Registro de nómina eliminado.", "success")
     except Exception as e:
@@ -3064,6 +3688,7 @@ def usuarios_editar(id_usuario: int):
                             (nombre_usuario, correo, id_rol, id_empleado, activo, id_usuario),
                         )
                     conn.commit()
+                    invalidar_permisos()
                     
                     # Registrar la acción en auditoría
                     empleado_info = f", Empleado: {id_empleado}" if id_empleado else ", Sin empleado"
@@ -3123,6 +3748,7 @@ def usuarios_toggle(id_usuario: int):
                     (id_usuario,),
                 )
                 conn.commit()
+        invalidar_permisos()
         registrar_auditoria("Estado de usuario actualizado", "Usuarios", f"ID: {id_usuario}")
         flash("Estado del usuario actualizado.", "success")
     except Exception as e:
@@ -3138,6 +3764,7 @@ def usuarios_eliminar(id_usuario: int):
             with conn.cursor() as cur:
                 cur.execute("DELETE FROM Usuarios WHERE IdUsuario = ?", (id_usuario,))
                 conn.commit()
+        invalidar_permisos()
         registrar_auditoria("Usuario eliminado", "Usuarios", f"ID: {id_usuario}")
         flash("Usuario eliminado.", "success")
     except Exception as e:
@@ -3212,38 +3839,44 @@ def permisos_listado():
 @app.route("/seguridad/permisos/guardar", methods=["POST"])
 @requiere_permiso_modulo("Permisos")
 def permisos_guardar():
+    """Guarda la matriz de permisos aplicando solo los cambios.
+
+    Si el formulario trae `usuarios` (las filas modificadas en la página) solo se
+    guardan esos usuarios; si no, todos los usuarios activos.
+    """
+    seleccion = [int(u) for u in request.form.getlist("usuarios") if u.isdigit()]
+    if request.form.getlist("usuarios") and not seleccion:
+        flash("No hay cambios para guardar.", "info")
+        return redirect(url_for("permisos_listado"))
     try:
         with get_connection() as conn:
             with conn.cursor() as cur:
-                # Obtener todos los usuarios y módulos
-                cur.execute("SELECT IdUsuario FROM Usuarios WHERE Activo = 1")
+                if seleccion:
+                    cur.execute("""
+                        SELECT IdUsuario FROM Usuarios
+                        WHERE Activo = 1 AND IdUsuario IN (SELECT CAST(value AS INT) FROM OPENJSON(?))
+                    """, (json.dumps(sorted(set(seleccion))),))
+                else:
+                    cur.execute("SELECT IdUsuario FROM Usuarios WHERE Activo = 1")
                 usuarios = [row[0] for row in cur.fetchall()]
                 
                 cur.execute("SELECT IdModulo FROM Modulos WHERE Activo = 1")
                 modulos = [row[0] for row in cur.fetchall()]
-                
-                # Eliminar todos los permisos existentes
-                cur.execute("DELETE FROM PermisosUsuarios")
-                
-                # Insertar nuevos permisos basados en checkboxes (con acciones)
-                for id_usuario in usuarios:
-                    for id_modulo in modulos:
-                        ver = 1 if request.form.get(f"ver_{id_usuario}_{id_modulo}") else 0
-                        crear = 1 if request.form.get(f"crear_{id_usuario}_{id_modulo}") else 0
-                        editar = 1 if request.form.get(f"editar_{id_usuario}_{id_modulo}") else 0
-                        eliminar = 1 if request.form.get(f"eliminar_{id_usuario}_{id_modulo}") else 0
-                        
-                        # Solo insertar si tiene al menos acceso de ver
-                        if ver:
-                            cur.execute("""
-                                INSERT INTO PermisosUsuarios (IdUsuario, IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar)
-                                VALUES (?, ?, 1, ?, ?, ?)
-                            """, (id_usuario, id_modulo, crear, editar, eliminar))
-                
-                conn.commit()
+            
+            deseados = permisos_formulario(request.form, usuarios, modulos)
+            cambios = guardar_permisos(conn, usuarios, deseados)
         
-        registrar_auditoria("Permisos actualizados", "Permisos", "Permisos de módulos y acciones actualizados para todos los usuarios")
-        flash("Permisos actualizados correctamente.", "success")
+        total = cambios["insertados"] + cambios["actualizados"] + cambios["borrados"]
+        if total:
+            invalidar_permisos()
+            registrar_auditoria(
+                "Permisos actualizados", "Permisos",
+                f"Permisos de {len(usuarios)} usuario(s): {cambios['insertados']} agregado(s), "
+                f"{cambios['actualizados']} modificado(s), {cambios['borrados']} quitado(s)",
+            )
+            flash(f"Permisos actualizados correctamente ({total} cambio(s)).", "success")
+        else:
+            flash("No hay cambios para guardar.", "info")
     except Exception as e:
         flash(f"Error guardando permisos: {e}", "danger")
     
@@ -3253,41 +3886,32 @@ def permisos_guardar():
 @app.route("/seguridad/permisos/aplicar-plantilla", methods=["POST"])
 @requiere_permiso_modulo("Permisos")
 def permisos_aplicar_plantilla():
-    """Aplica una plantilla de permisos a usuarios seleccionados."""
+    """Aplica una plantilla de permisos a usuarios seleccionados (un solo MERGE)."""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         id_plantilla = data.get('id_plantilla')
         usuarios = data.get('usuarios', [])
         
-        if not id_plantilla or not usuarios:
+        if not id_plantilla or not usuarios or not isinstance(usuarios, list):
             return {"error": "Datos incompletos"}, 400
+        try:
+            id_plantilla = int(id_plantilla)
+            usuarios = [int(u) for u in usuarios]
+        except (TypeError, ValueError):
+            return {"error": "Identificadores inválidos"}, 400
         
         with get_connection() as conn:
             with conn.cursor() as cur:
-                # Obtener permisos de la plantilla
-                cur.execute("""
-                    SELECT IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar
-                    FROM PlantillasPermisosDetalle
-                    WHERE IdPlantilla = ?
-                """, (id_plantilla,))
-                permisos_plantilla = cur.fetchall()
-                
-                # Aplicar a cada usuario
-                for id_usuario in usuarios:
-                    # Eliminar permisos existentes del usuario
-                    cur.execute("DELETE FROM PermisosUsuarios WHERE IdUsuario = ?", (id_usuario,))
-                    
-                    # Insertar permisos de la plantilla
-                    for perm in permisos_plantilla:
-                        cur.execute("""
-                            INSERT INTO PermisosUsuarios (IdUsuario, IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar)
-                            VALUES (?, ?, ?, ?, ?, ?)
-                        """, (id_usuario, perm[0], perm[1], perm[2], perm[3], perm[4]))
-                
-                conn.commit()
+                cur.execute("SELECT 1 FROM PlantillasPermisos WHERE IdPlantilla = ?", (id_plantilla,))
+                if not cur.fetchone():
+                    return {"error": "Plantilla no encontrada"}, 404
+            cambios = aplicar_plantilla_permisos(conn, id_plantilla, usuarios)
+        if cambios:
+            invalidar_permisos()
         
-        registrar_auditoria("Plantilla de permisos aplicada", "Permisos", f"Plantilla {id_plantilla} aplicada a {len(usuarios)} usuario(s)")
-        return {"success": True}, 200
+        registrar_auditoria("Plantilla de permisos aplicada", "Permisos",
+                            f"Plantilla {id_plantilla} aplicada a {len(set(usuarios))} usuario(s), {cambios} cambio(s)")
+        return {"success": True, "cambios": cambios}, 200
     except Exception as e:
         return {"error": str(e)}, 500
 
@@ -3295,158 +3919,311 @@ def permisos_aplicar_plantilla():
 # =============================
 # Auditoría
 # =============================
+_COLUMNAS_AUDITORIA = ["IdLog", "Usuario", "Accion", "Modulo", "Detalles", "FechaHora", "DireccionIP"]
+
+
+# Las consultas se arman por tabla: Auditoria (meses recientes) y AuditoriaArchivo_AAAAMM
+_SQL_PAGINA_AUDITORIA = """
+    SELECT TOP (?) a.IdLog, a.NombreUsuario, a.Accion, a.Modulo, a.Detalles,
+           CONVERT(varchar(19), a.FechaHora, 120) as FechaHora, a.DireccionIP,
+           CONVERT(varchar(27), a.FechaHora, 121) as CursorPagina
+    FROM {tabla} a
+    {where}
+    ORDER BY a.FechaHora DESC, a.IdLog DESC
+"""
+
+_SQL_EXPORTAR_AUDITORIA = """
+    SELECT a.IdLog, a.NombreUsuario, a.Accion, a.Modulo, a.Detalles,
+           CONVERT(varchar(19), a.FechaHora, 120) as FechaHora, a.DireccionIP
+    FROM {tabla} a
+    {where}
+    ORDER BY a.FechaHora DESC, a.IdLog DESC
+"""
+
+
+def _filtros_auditoria(args) -> tuple:
+    """Arma el WHERE de auditoría a partir de los filtros del querystring.
+
+    Devuelve (condiciones, params, filtros). Fechas como rango sobre FechaHora
+    (IX_Auditoria_FechaHora) y usuario por IdUsuario (IX_Auditoria_Usuario).
+    """
+    condiciones = []
+    params = []
+    filtros = {
+        "desde": (args.get("desde") or "").strip(),
+        "hasta": (args.get("hasta") or "").strip(),
+        "usuario": (args.get("usuario") or "").strip(),
+        "modulo": (args.get("modulo") or "").strip(),
+        "accion": (args.get("accion") or "").strip(),
+    }
+    if filtros["desde"]:
+        try:
+            condiciones.append("a.FechaHora >= ?")
+            params.append(datetime.strptime(filtros["desde"], "%Y-%m-%d"))
+        except ValueError:
+            condiciones.pop()
+            filtros["desde"] = ""
+    if filtros["hasta"]:
+        try:
+            condiciones.append("a.FechaHora < ?")
+            params.append(datetime.strptime(filtros["hasta"], "%Y-%m-%d") + timedelta(days=1))
+        except ValueError:
+            condiciones.pop()
+            filtros["hasta"] = ""
+    if filtros["usuario"].isdigit():
+        condiciones.append("a.IdUsuario = ?")
+        params.append(int(filtros["usuario"]))
+    else:
+        filtros["usuario"] = ""
+    if filtros["modulo"]:
+        condiciones.append("a.Modulo = ?")
+        params.append(filtros["modulo"])
+    if filtros["accion"]:
+        condiciones.append("a.Accion LIKE ?")
+        params.append(filtros["accion"].replace("[", "[[]").replace("%", "[%]").replace("_", "[_]") + "%")
+    return condiciones, params, filtros
+
+
+def _rango_busqueda_auditoria(filtros: dict, cursor: str = "") -> tuple:
+    """(desde, hasta) para elegir qué meses archivados pueden tener resultados."""
+    desde = datetime.strptime(filtros["desde"], "%Y-%m-%d") if filtros["desde"] else None
+    hasta = datetime.strptime(filtros["hasta"], "%Y-%m-%d") if filtros["hasta"] else None
+    if cursor:
+        try:
+            fecha_cursor = datetime.strptime(cursor[:10], "%Y-%m-%d")
+            hasta = min(hasta, fecha_cursor) if hasta else fecha_cursor
+        except ValueError:
+            pass
+    return desde, hasta
+
+
+def _lotes_auditoria(cur, where: str, params: list, tablas: list, tamano_lote: int):
+    """Lotes de la exportación: la tabla activa (ya ejecutada) y luego cada mes archivado."""
+    try:
+        for i, tabla in enumerate(tablas):
+            if i:
+                cur.execute(_SQL_EXPORTAR_AUDITORIA.format(tabla=tabla, where=where), params)
+            while True:
+                filas = cur.fetchmany(tamano_lote)
+                if not filas:
+                    break
+                yield filas
+    finally:
+        cur.close()
+
+
 @app.route("/seguridad/auditoria")
 @requiere_permiso_modulo("Auditoria")
 def auditoria_listado():
+    """Auditoría con filtros y paginación por cursor (FechaHora, IdLog) en vez de TOP/OFFSET."""
+    condiciones, params, filtros = _filtros_auditoria(request.args)
+    filtros_activos = {k: v for k, v in filtros.items() if v}
+    try:
+        tam = min(max(int(request.args.get("tam", 50)), 10), 500)
+    except ValueError:
+        tam = 50
+
+    # Cursor de la página: "<FechaHora con 7 decimales>|<IdLog>" de la última fila mostrada
+    cursor = (request.args.get("cursor") or "").strip()
+    if cursor:
+        fecha_cursor, _, id_cursor = cursor.rpartition("|")
+        if fecha_cursor and id_cursor.isdigit():
+            condiciones.append(
+                "(a.FechaHora < CAST(? AS DATETIME2(7)) OR (a.FechaHora = CAST(? AS DATETIME2(7)) AND a.IdLog < ?))"
+            )
+            params.extend([fecha_cursor, fecha_cursor, int(id_cursor)])
+        else:
+            cursor = ""
+
+    where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+    logs, usuarios, siguiente = [], [], None
     try:
         with get_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT TOP 200 IdLog, NombreUsuario, Accion, Modulo, Detalles,
-                           CONVERT(varchar(19), FechaHora, 120) as FechaHora, DireccionIP
-                    FROM Auditoria
-                    ORDER BY FechaHora DESC
-                    """
-                )
+                # Primero la tabla activa; solo si no llena la página se sigue por los meses archivados
+                cur.execute(_SQL_PAGINA_AUDITORIA.format(tabla="Auditoria", where=where), [tam + 1] + params)
                 logs = cur.fetchall()
-        return render_template("auditoria/list.html", logs=logs)
+                if len(logs) <= tam:
+                    desde, hasta = _rango_busqueda_auditoria(filtros, cursor)
+                    for tabla in tablas_archivo(cur, desde, hasta):
+                        cur.execute(_SQL_PAGINA_AUDITORIA.format(tabla=tabla, where=where),
+                                    [tam + 1 - len(logs)] + params)
+                        logs.extend(cur.fetchall())
+                        if len(logs) > tam:
+                            break
+                if len(logs) > tam:
+                    logs = logs[:tam]
+                    siguiente = f"{logs[-1][7]}|{logs[-1][0]}"
+
+                cur.execute("SELECT IdUsuario, NombreUsuario FROM Usuarios ORDER BY NombreUsuario")
+                usuarios = cur.fetchall()
+        return render_template("auditoria/list.html", logs=logs, usuarios=usuarios, filtros=filtros,
+                               filtros_activos=filtros_activos, tam=tam, cursor=cursor, siguiente=siguiente)
     except Exception as e:
         flash(f"Error cargando auditoría: {e}", "danger")
-        return render_template("auditoria/list.html", logs=[])
+        return render_template("auditoria/list.html", logs=[], usuarios=usuarios, filtros=filtros,
+                               filtros_activos=filtros_activos, tam=tam, cursor="", siguiente=None)
+
+
+@app.route("/seguridad/auditoria/exportar")
+@requiere_permiso_modulo("Auditoria")
+def auditoria_exportar():
+    """Exporta la auditoría filtrada en CSV o XLSX, escribiendo las filas a medida que se leen."""
+    formato = "xlsx" if request.args.get("formato") == "xlsx" else "csv"
+    condiciones, params, filtros = _filtros_auditoria(request.args)
+    where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+    try:
+        conn = get_connection()
+        cur = conn.cursor()
+        try:
+            desde, hasta = _rango_busqueda_auditoria(filtros)
+            tablas = ["Auditoria"] + tablas_archivo(cur, desde, hasta)
+            cur.execute(_SQL_EXPORTAR_AUDITORIA.format(tabla="Auditoria", where=where), params)
+        except Exception:
+            cur.close()
+            raise
+
+        registrar_auditoria("Auditoría exportada", "Auditoria",
+                            ", ".join(f"{k}={v}" for k, v in filtros.items() if v) or "sin filtros")
+
+        lotes = _lotes_auditoria(cur, where, params, tablas, CSV_LOTE_FILAS)
+        nombre = f"auditoria_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}"
+        if formato == "xlsx":
+            partes = generar_xlsx(_COLUMNAS_AUDITORIA, lotes, hoja="Auditoria")
+            mimetype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        else:
+            partes = generar_csv(_COLUMNAS_AUDITORIA, lotes)
+            mimetype = "text/csv"
+        return Response(
+            stream_with_context(partes),
+            mimetype=mimetype,
+            headers={"Content-Disposition": f'attachment; filename="{nombre}"'},
+        )
+    except Exception as e:
+        flash(f"No se pudo exportar la auditoría: {e}", "danger")
+        return redirect(url_for("auditoria_listado", **{k: v for k, v in filtros.items() if v}))
 
 
 # =============================
-# Comprobantes de Pago (PDF) (JAMES) GENERAR CARGA MASIVA PARA OBTENER UN DOCUMENTO CON TODOS LOS COMPROBANTES DE ACUERDO 
-#CON LOS PERIODOS DE NÓMINA (POR FECHAS)
+# Comprobantes de Pago (PDF)
+# El render vive en comprobantes_pdf.py para poder repartirlo en un pool de procesos.
 # =============================
-def generar_comprobante_pdf(id_nomina: int):
-    """Genera un comprobante de pago en PDF para un registro de nómina."""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
-    
-    # Obtener datos del comprobante
+_SQL_COMPROBANTES = """
+    SELECT 
+        rn.IdNomina,
+        e.IdEmpleado, e.CodigoEmpleado, e.Nombres, e.Apellidos, e.DocumentoIdentidad, e.NumeroIGSS,
+        p.IdPeriodo, p.FechaInicio, p.FechaFin, p.TipoPeriodo,
+        rn.SalarioBase, rn.TotalPrestaciones, rn.TotalDeducciones, rn.SalarioNeto
+    FROM RegistrosNomina rn
+    JOIN Empleados e ON e.IdEmpleado = rn.IdEmpleado
+    JOIN PeriodosNomina p ON p.IdPeriodo = rn.IdPeriodo
+"""
+
+_SQL_ITEMS_COMPROBANTES = """
+    SELECT i.IdNomina, b.Nombre, i.TipoItem, i.Monto
+    FROM ItemsNomina i
+    JOIN BeneficiosDeducciones b ON b.IdBeneficioDeduccion = i.IdBeneficioDeduccion
+"""
+
+
+def _armar_comprobante(row, items) -> dict:
+    """Convierte la fila de _SQL_COMPROBANTES en el dict que recibe renderizar_comprobante."""
+    return {
+        "id_nomina": row[0],
+        "empleado": {
+            "id": row[1], "codigo": row[2], "nombres": row[3], "apellidos": row[4],
+            "dpi": row[5], "igss": row[6]
+        },
+        "periodo": {
+            "id": row[7], "inicio": row[8], "fin": row[9], "tipo": row[10]
+        },
+        "nomina": {
+            "salario_base": row[11], "prestaciones": row[12],
+            "deducciones": row[13], "neto": row[14]
+        },
+        "items": items,
+    }
+
+
+def cargar_comprobantes_periodo(id_periodo: int) -> list:
+    """Carga todos los comprobantes del periodo en dos consultas (registros e ítems)."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                _SQL_COMPROBANTES + " WHERE rn.IdPeriodo = ? ORDER BY e.Apellidos, e.Nombres",
+                (id_periodo,),
+            )
+            registros = cur.fetchall()
+
+            cur.execute(
+                _SQL_ITEMS_COMPROBANTES + """
+                JOIN RegistrosNomina rn ON rn.IdNomina = i.IdNomina
+                WHERE rn.IdPeriodo = ?
+                ORDER BY i.IdNomina, i.TipoItem DESC, b.Nombre
+                """,
+                (id_periodo,),
+            )
+            items_por_nomina = {}
+            for it in cur.fetchall():
+                items_por_nomina.setdefault(it[0], []).append((it[1], it[2], it[3]))
+
+    return [_armar_comprobante(row, items_por_nomina.get(row[0], [])) for row in registros]
+
+
+def cargar_comprobante(id_nomina: int):
+    """Carga los datos de un comprobante (registro e ítems) o None si no existe."""
     with get_connection() as conn:
         with conn.cursor() as cur:
             # Datos del empleado y periodo
-            cur.execute("""
-                SELECT 
-                    e.IdEmpleado, e.CodigoEmpleado, e.Nombres, e.Apellidos, e.DocumentoIdentidad, e.NumeroIGSS,
-                    p.IdPeriodo, p.FechaInicio, p.FechaFin, p.TipoPeriodo,
-                    rn.SalarioBase, rn.TotalPrestaciones, rn.TotalDeducciones, rn.SalarioNeto
-                FROM RegistrosNomina rn
-                JOIN Empleados e ON e.IdEmpleado = rn.IdEmpleado
-                JOIN PeriodosNomina p ON p.IdPeriodo = rn.IdPeriodo
-                WHERE rn.IdNomina = ?
-            """, (id_nomina,))
+            cur.execute(_SQL_COMPROBANTES + " WHERE rn.IdNomina = ?", (id_nomina,))
             row = cur.fetchone()
             if not row:
                 return None
-            
-            empleado = {
-                "id": row[0], "codigo": row[1], "nombres": row[2], "apellidos": row[3],
-                "dpi": row[4], "igss": row[5]
-            }
-            periodo = {
-                "id": row[6], "inicio": row[7], "fin": row[8], "tipo": row[9]
-            }
-            nomina = {
-                "salario_base": row[10], "prestaciones": row[11], 
-                "deducciones": row[12], "neto": row[13]
-            }
-            
+
             # Items de nómina (prestaciones y deducciones)
-            cur.execute("""
-                SELECT b.Nombre, i.TipoItem, i.Monto
-                FROM ItemsNomina i
-                JOIN BeneficiosDeducciones b ON b.IdBeneficioDeduccion = i.IdBeneficioDeduccion
-                WHERE i.IdNomina = ?
-                ORDER BY i.TipoItem DESC, b.Nombre
-            """, (id_nomina,))
-            items = cur.fetchall()
-    
-    # Estilos
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=18, textColor=colors.HexColor('#1e40af'), alignment=TA_CENTER)
-    subtitle_style = ParagraphStyle('CustomSubtitle', parent=styles['Normal'], fontSize=10, textColor=colors.grey, alignment=TA_CENTER)
-    
-    # Contenido del PDF
-    story = []
-    
-    # Encabezado
-    story.append(Paragraph("COMPROBANTE DE PAGO", title_style))
-    story.append(Paragraph(f"Periodo: {periodo['inicio']} - {periodo['fin']}", subtitle_style))
-    story.append(Spacer(1, 0.3*inch))
-    
-    # Información del empleado
-    emp_data = [
-        ["Código:", empleado['codigo'], "Nombre:", f"{empleado['nombres']} {empleado['apellidos']}"],
-        ["DPI:", empleado['dpi'], "IGSS:", empleado['igss'] or 'N/A']
-    ]
-    emp_table = Table(emp_data, colWidths=[1*inch, 1.5*inch, 1*inch, 2.5*inch])
-    emp_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#e5e7eb')),
-        ('BACKGROUND', (2, 0), (2, -1), colors.HexColor('#e5e7eb')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-    ]))
-    story.append(emp_table)
-    story.append(Spacer(1, 0.3*inch))
-    
-    # Detalle de nómina
-    detail_data = [["Concepto", "Tipo", "Monto"]]
-    detail_data.append(["Salario Base", "Base", f"Q {nomina['salario_base']:.2f}"])
-    
-    for item in items:
-        tipo_label = "Prestación" if item[1] == "prestacion" else "Deducción"
-        detail_data.append([item[0], tipo_label, f"Q {item[2]:.2f}"])
-    
-    detail_table = Table(detail_data, colWidths=[3*inch, 1.5*inch, 1.5*inch])
-    detail_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('ALIGN', (2, 0), (2, -1), 'RIGHT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f3f4f6')])
-    ]))
-    story.append(detail_table)
-    story.append(Spacer(1, 0.2*inch))
-    
-    # Resumen
-    summary_data = [
-        ["Total Prestaciones:", f"Q {nomina['prestaciones']:.2f}"],
-        ["Total Deducciones:", f"Q {nomina['deducciones']:.2f}"],
-        ["SALARIO NETO:", f"Q {nomina['neto']:.2f}"]
-    ]
-    summary_table = Table(summary_data, colWidths=[4*inch, 2*inch])
-    summary_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, -1), (-1, -1), 12),
-        ('TEXTCOLOR', (0, -1), (-1, -1), colors.HexColor('#1e40af')),
-        ('LINEABOVE', (0, -1), (-1, -1), 2, colors.HexColor('#1e40af')),
-        ('FONTSIZE', (0, 0), (-1, -2), 10),
-    ]))
-    story.append(summary_table)
-    story.append(Spacer(1, 0.5*inch))
-    
-    # Pie de página
-    footer_style = ParagraphStyle('Footer', parent=styles['Normal'], fontSize=8, textColor=colors.grey, alignment=TA_CENTER)
-    story.append(Paragraph(f"Generado el {datetime.now().strftime('%d/%m/%Y %H:%M')}", footer_style))
-    
-    # Construir PDF
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
+            cur.execute(
+                _SQL_ITEMS_COMPROBANTES + " WHERE i.IdNomina = ? ORDER BY i.TipoItem DESC, b.Nombre",
+                (id_nomina,),
+            )
+            items = [(it[1], it[2], it[3]) for it in cur.fetchall()]
+
+    return _armar_comprobante(row, items)
+
+
+def pdf_comprobante(datos: dict, huella: str = None) -> bytes:
+    """PDF del comprobante, tomado de la caché si su contenido no cambió."""
+    huella = huella or huella_comprobante(datos)
+    return comprobantes_cache.obtener(datos["id_nomina"], huella, lambda: renderizar_comprobante(datos))
+
+
+def invalidar_comprobantes(cur, id_periodo: int = None, id_nomina: int = None) -> None:
+    """Saca de la caché los PDF de un registro o de todos los registros de un periodo."""
+    if id_nomina is not None:
+        comprobantes_cache.invalidar([id_nomina])
+        return
+    cur.execute("SELECT IdNomina FROM RegistrosNomina WHERE IdPeriodo = ?", (id_periodo,))
+    comprobantes_cache.invalidar(r[0] for r in cur.fetchall())
+
+
+def generar_comprobante_pdf(id_nomina: int):
+    """Genera un comprobante de pago en PDF para un registro de nómina."""
+    datos = cargar_comprobante(id_nomina)
+    if not datos:
+        return None
+    return io.BytesIO(pdf_comprobante(datos))
+
+
+def generar_comprobantes_periodo(id_periodo: int, formato: str = "zip"):
+    """Genera todos los comprobantes del periodo.
+
+    Devuelve (cantidad, generador de bytes): un ZIP con un PDF por empleado
+    (formato "zip") o un solo PDF con todos los comprobantes (formato "pdf").
+    """
+    lista = cargar_comprobantes_periodo(id_periodo)
+    resultados = renderizar_comprobantes(lista)
+    if formato == "pdf":
+        return len(lista), unir_pdfs(resultados)
+    return len(lista), generar_zip(resultados)
 
 
 def generar_comprobante_html(id_nomina: int):
@@ -3694,20 +4471,32 @@ def comprobante_pdf(id_nomina: int):
                         flash("No tienes permiso para descargar este comprobante.", "danger")
                         return redirect(url_for("mis_comprobantes"))
         
-        # Generar PDF del comprobante
-        pdf_buffer = generar_comprobante_pdf(id_nomina)
-        if not pdf_buffer:
+        datos = cargar_comprobante(id_nomina)
+        if not datos:
             flash("No se encontró el registro de nómina.", "warning")
             return redirect(url_for("mis_comprobantes") if not tiene_permiso_admin else url_for("comprobantes_listado"))
+
+        # La huella del contenido es el ETag: si el cliente ya tiene esta versión, 304
+        huella = huella_comprobante(datos)
+        if request.if_none_match.contains(huella):
+            response = Response(status=304)
+            response.set_etag(huella)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+
+        # Generar PDF del comprobante (o tomarlo de la caché)
+        pdf = pdf_comprobante(datos, huella)
         
         registrar_auditoria("Comprobante PDF generado", "Comprobantes", f"IdNomina: {id_nomina}")
         
         response = Response(
-            pdf_buffer.getvalue(),
+            pdf,
             mimetype='application/pdf'
         )
         response.headers['Content-Disposition'] = f'attachment; filename="comprobante_{id_nomina}.pdf"'
         response.headers['Content-Type'] = 'application/pdf'
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.set_etag(huella)
         return response
     except Exception as e:
         print(f"Error generando PDF: {e}")
@@ -3716,6 +4505,82 @@ def comprobante_pdf(id_nomina: int):
         return redirect(url_for("mis_comprobantes") if not tiene_permiso_admin else url_for("comprobantes_listado"))
 
 
+def _trabajo_comprobantes_periodo(salida, params: dict, progreso) -> dict:
+    """Comprobantes del periodo en un ZIP (un PDF por empleado) o un PDF unido, escritos en `salida`."""
+    id_periodo, formato = params["id_periodo"], params["formato"]
+    lista = cargar_comprobantes_periodo(id_periodo)
+    if not lista:
+        raise ValueError("El periodo no tiene registros de nómina.")
+
+    def con_avance(resultados):
+        for hechos, resultado in enumerate(resultados, start=1):
+            progreso(hechos, len(lista), "Generando comprobantes")
+            yield resultado
+
+    resultados = con_avance(renderizar_comprobantes(lista))
+    partes = unir_pdfs(resultados) if formato == "pdf" else generar_zip(resultados)
+    for parte in partes:
+        salida.write(parte)
+    return {"nombre": f"comprobantes_periodo_{id_periodo}.{formato}",
+            "mimetype": "application/pdf" if formato == "pdf" else "application/zip"}
+
+
+cola_reportes.registrar("comprobantes_periodo", _trabajo_comprobantes_periodo)
+
+
+@app.route("/comprobantes/periodo/<int:id_periodo>/descargar")
+@requiere_permiso_modulo("Comprobantes")
+def comprobantes_periodo_descargar(id_periodo: int):
+    """Encola los comprobantes del periodo: ?formato=zip (default) o ?formato=pdf."""
+    formato = "pdf" if request.args.get("formato") == "pdf" else "zip"
+    return _enviar_trabajo_reporte(
+        "comprobantes_periodo", {"id_periodo": id_periodo, "formato": formato},
+        f"Comprobantes del periodo {id_periodo} ({formato.upper()})", "Comprobantes",
+        url_for("comprobantes_listado", periodo=id_periodo),
+        ("Comprobantes del periodo generados", f"IdPeriodo: {id_periodo}, formato {formato}"),
+    )
+
+
+@app.cli.command("comprobantes-periodo")
+@click.argument("id_periodo", type=int)
+@click.option("--formato", type=click.Choice(["zip", "pdf"]), default="zip", show_default=True)
+@click.option("--salida", type=click.Path(dir_okay=False), default=None,
+              help="Archivo de salida (default: comprobantes_periodo_<id>.<formato>)")
+def comprobantes_periodo_cli(id_periodo: int, formato: str, salida):
+    """Genera todos los comprobantes de un periodo en un ZIP o un PDF unido."""
+    salida = salida or f"comprobantes_periodo_{id_periodo}.{formato}"
+    inicio = datetime.now()
+    cantidad, partes = generar_comprobantes_periodo(id_periodo, formato)
+    if not cantidad:
+        click.echo("El periodo no tiene registros de nómina.")
+        return
+    with open(salida, "wb") as fh:
+        for parte in partes:
+            fh.write(parte)
+    segundos = (datetime.now() - inicio).total_seconds()
+    click.echo(f"{cantidad} comprobante(s) escritos en {salida} ({segundos:.1f}s)")
+
+
+@app.cli.command("auditoria-compactar")
+@click.option("--meses", type=int, default=lambda: int(os.getenv("AUDITORIA_RETENCION_MESES", "6")),
+              show_default="AUDITORIA_RETENCION_MESES o 6", help="Meses que se conservan en la tabla Auditoria")
+@click.option("--lote", type=int, default=5000, show_default=True, help="Filas movidas por transacción")
+@click.option("--compresion", type=click.Choice(["PAGE", "ROW", "NONE"]), default="PAGE", show_default=True)
+def auditoria_compactar_cli(meses: int, lote: int, compresion: str):
+    """Mueve la auditoría anterior a la retención a tablas mensuales de archivo.
+
+    Pensado para correr programado (cron / Programador de tareas), p. ej. una vez al día.
+    """
+    inicio = datetime.now()
+    resultado = compactar_auditoria(meses, tamano_lote=max(1, lote),
+                                    compresion="" if compresion == "NONE" else compresion,
+                                    informar=click.echo)
+    segundos = (datetime.now() - inicio).total_seconds()
+    total = sum(resultado["movidos"].values())
+    click.echo(f"{total} fila(s) anteriores a {resultado['corte']:%Y-%m-%d} archivadas "
+               f"en {len(resultado['movidos'])} mes(es) ({segundos:.1f}s)")
+
+
 @app.route("/comprobantes", methods=["GET"])
 @requiere_permiso_modulo("Comprobantes")
 def comprobantes_listado():
@@ -3766,11 +4631,9 @@ def comprobantes_listado():
                     params.append(id_periodo)
                 
                 if busqueda:
-                    query += """ AND (e.CodigoEmpleado LIKE ? 
-                                   OR e.Nombres LIKE ? 
-                                   OR e.Apellidos LIKE ?
-                                   OR (e.Nombres + ' ' + e.Apellidos) LIKE ?)"""
-                    params.extend([f"%{busqueda}%", f"%{busqueda}%", f"%{busqueda}%", f"%{busqueda}%"])
+                    filtro, params_busqueda, _ = _filtro_busqueda_empleados(busqueda, "rn.IdEmpleado")
+                    query += f" AND {filtro}"
+                    params.extend(params_busqueda)
                 
                 query += " ORDER BY p.FechaInicio DESC, e.Apellidos, e.Nombres"
                 
@@ -0,0 +1,191 @@
+from datetime import date, datetime, timedelta
+
+
+# =============================
+# Resumen diario de asistencia (AsistenciaDiaria)
+# =============================
+# Una fila por empleado y día con marcas: primera entrada, última salida y
+# cantidad de marcas. Nómina y dashboard cuentan "días laborados" como las filas
+# con Entradas > 0, sin agrupar Asistencias.
+#
+# La aplicación la mantiene en la misma transacción que inserta las marcas
+# (registro manual, importación de archivos y kioscos) recalculando solo los
+# días tocados; `verificar` encuentra diferencias si alguien escribió en
+# Asistencias por fuera y `backfill` la reconstruye por rangos de fechas.
+
+# Recalcula los días de `{origen}` (un SELECT que devuelve IdEmpleado, Fecha) a
+# partir de Asistencias: actualiza, inserta o borra (día sin marcas) cada fila.
+# HOLDLOCK evita que dos inserciones simultáneas del mismo día choquen en la PK.
+SQL_RECALCULAR = """
+    WITH Claves AS (
+        SELECT DISTINCT k.IdEmpleado, k.Fecha FROM ({origen}) k
+    ),
+    Calculo AS (
+        SELECT c.IdEmpleado, c.Fecha, x.PrimeraEntrada, x.UltimaSalida, x.Entradas, x.Salidas, x.Marcas
+        FROM Claves c
+        CROSS APPLY (
+            SELECT MIN(CASE WHEN a.Tipo = 'entrada' THEN a.FechaHora END) AS PrimeraEntrada,
+                   MAX(CASE WHEN a.Tipo = 'salida' THEN a.FechaHora END) AS UltimaSalida,
+                   COUNT(CASE WHEN a.Tipo = 'entrada' THEN 1 END) AS Entradas,
+                   COUNT(CASE WHEN a.Tipo = 'salida' THEN 1 END) AS Salidas,
+                   COUNT(*) AS Marcas
+            FROM Asistencias a
+            WHERE a.IdEmpleado = c.IdEmpleado
+              AND a.FechaHora >= CAST(c.Fecha AS DATETIME2)
+              AND a.FechaHora < DATEADD(DAY, 1, CAST(c.Fecha AS DATETIME2))
+        ) x
+    )
+    MERGE AsistenciaDiaria WITH (HOLDLOCK) AS d
+    USING Calculo AS c
+       ON d.IdEmpleado = c.IdEmpleado AND d.Fecha = c.Fecha
+    WHEN MATCHED AND c.Marcas = 0 THEN
+        DELETE
+    WHEN MATCHED THEN
+        UPDATE SET d.PrimeraEntrada = c.PrimeraEntrada,
+                   d.UltimaSalida = c.UltimaSalida,
+                   d.Entradas = c.Entradas,
+                   d.Salidas = c.Salidas,
+                   d.Marcas = c.Marcas
+    WHEN NOT MATCHED BY TARGET AND c.Marcas > 0 THEN
+        INSERT (IdEmpleado, Fecha, PrimeraEntrada, UltimaSalida, Entradas, Salidas, Marcas)
+        VALUES (c.IdEmpleado, c.Fecha, c.PrimeraEntrada, c.UltimaSalida, c.Entradas, c.Salidas, c.Marcas);
+"""
+
+# Filas esperadas de AsistenciaDiaria para un rango [?, ?) de FechaHora
+_SQL_ESPERADO = """
+    SELECT a.IdEmpleado,
+           CAST(a.FechaHora AS DATE) AS Fecha,
+           MIN(CASE WHEN a.Tipo = 'entrada' THEN a.FechaHora END) AS PrimeraEntrada,
+           MAX(CASE WHEN a.Tipo = 'salida' THEN a.FechaHora END) AS UltimaSalida,
+           COUNT(CASE WHEN a.Tipo = 'entrada' THEN 1 END) AS Entradas,
+           COUNT(CASE WHEN a.Tipo = 'salida' THEN 1 END) AS Salidas,
+           COUNT(*) AS Marcas
+    FROM Asistencias a
+    WHERE a.FechaHora >= ? AND a.FechaHora < ?
+    GROUP BY a.IdEmpleado, CAST(a.FechaHora AS DATE)
+"""
+
+_SQL_BACKFILL_LOTE = """
+    SET NOCOUNT ON;
+    DELETE FROM AsistenciaDiaria WHERE Fecha >= ? AND Fecha < ?;
+    INSERT INTO AsistenciaDiaria (IdEmpleado, Fecha, PrimeraEntrada, UltimaSalida, Entradas, Salidas, Marcas)
+""" + _SQL_ESPERADO + """;
+    SELECT @@ROWCOUNT;
+"""
+
+# Diferencias en ambos sentidos: días que faltan o tienen otros valores, y días sobrantes
+_SQL_DIFERENCIAS = """
+    SET NOCOUNT ON;
+    IF OBJECT_ID('tempdb..#DiferenciasDiarias') IS NOT NULL DROP TABLE #DiferenciasDiarias;
+    CREATE TABLE #DiferenciasDiarias (IdEmpleado INT NOT NULL, Fecha DATE NOT NULL, Motivo VARCHAR(10) NOT NULL);
+
+    INSERT INTO #DiferenciasDiarias (IdEmpleado, Fecha, Motivo)
+    SELECT IdEmpleado, Fecha, 'faltante' FROM (
+        """ + _SQL_ESPERADO + """
+        EXCEPT
+        SELECT IdEmpleado, Fecha, PrimeraEntrada, UltimaSalida, Entradas, Salidas, Marcas
+        FROM AsistenciaDiaria WHERE Fecha >= ? AND Fecha < ?
+    ) x;
+
+    INSERT INTO #DiferenciasDiarias (IdEmpleado, Fecha, Motivo)
+    SELECT IdEmpleado, Fecha, 'sobrante' FROM (
+        SELECT IdEmpleado, Fecha, PrimeraEntrada, UltimaSalida, Entradas, Salidas, Marcas
+        FROM AsistenciaDiaria WHERE Fecha >= ? AND Fecha < ?
+        EXCEPT
+        """ + _SQL_ESPERADO + """
+    ) x
+    WHERE NOT EXISTS (
+        SELECT 1 FROM #DiferenciasDiarias f WHERE f.IdEmpleado = x.IdEmpleado AND f.Fecha = x.Fecha
+    );
+
+    SELECT IdEmpleado, Fecha, Motivo FROM #DiferenciasDiarias ORDER BY Fecha, IdEmpleado;
+"""
+
+
+def recalcular_sql(origen: str) -> str:
+    """SQL que recalcula los días devueltos por `origen` (SELECT de IdEmpleado, Fecha)."""
+    return SQL_RECALCULAR.format(origen=origen)
+
+
+def _como_fecha(valor) -> date:
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return date.fromisoformat(str(valor)[:10])
+
+
+def _rango_asistencias(cur, desde, hasta) -> tuple:
+    """[desde, hasta] en fechas; lo que falte se toma de la primera/última marca."""
+    if desde is None or hasta is None:
+        cur.execute("SELECT MIN(FechaHora), MAX(FechaHora) FROM Asistencias")
+        minimo, maximo = cur.fetchone()
+        if minimo is None:
+            return None, None
+        desde = desde if desde is not None else minimo
+        hasta = hasta if hasta is not None else maximo
+    return _como_fecha(desde), _como_fecha(hasta)
+
+
+def backfill(conn, desde=None, hasta=None, dias_por_lote: int = 31, progreso=None) -> int:
+    """Reconstruye AsistenciaDiaria para [desde, hasta] y devuelve las filas escritas.
+
+    Trabaja en bloques de `dias_por_lote` días con commit por bloque (transacciones
+    y log acotados); cada bloque borra sus días y los vuelve a insertar con un
+    GROUP BY sobre el rango de FechaHora. Se puede repetir o cortar sin problema.
+    """
+    cur = conn.cursor()
+    total = 0
+    try:
+        desde, hasta = _rango_asistencias(cur, desde, hasta)
+        if desde is None:
+            return 0
+        inicio = desde
+        while inicio <= hasta:
+            fin = min(inicio + timedelta(days=dias_por_lote), hasta + timedelta(days=1))
+            cur.execute(_SQL_BACKFILL_LOTE, (inicio, fin, inicio, fin))
+            filas = cur.fetchone()[0]
+            conn.commit()
+            total += filas
+            if progreso:
+                progreso(inicio, fin - timedelta(days=1), filas)
+            inicio = fin
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    return total
+
+
+def verificar(conn, desde=None, hasta=None, corregir: bool = False, max_detalle: int = 100) -> dict:
+    """Compara AsistenciaDiaria con Asistencias en [desde, hasta].
+
+    Devuelve {"faltantes", "sobrantes", "corregidas", "detalle"}: "faltantes" son
+    días que no están o tienen otros valores en el resumen, "sobrantes" días del
+    resumen sin marcas. Con `corregir` recalcula esos días en la misma transacción.
+    """
+    resultado = {"faltantes": 0, "sobrantes": 0, "corregidas": 0, "detalle": []}
+    cur = conn.cursor()
+    try:
+        desde, hasta = _rango_asistencias(cur, desde, hasta)
+        if desde is None:
+            return resultado
+        fin = hasta + timedelta(days=1)
+        cur.execute(_SQL_DIFERENCIAS, (desde, fin, desde, fin, desde, fin, desde, fin))
+        for id_empleado, fecha, motivo in cur.fetchall():
+            resultado[motivo + "s"] += 1
+            if len(resultado["detalle"]) < max_detalle:
+                resultado["detalle"].append((id_empleado, fecha, motivo))
+
+        if corregir and (resultado["faltantes"] or resultado["sobrantes"]):
+            cur.execute("SET NOCOUNT ON;" + recalcular_sql("SELECT IdEmpleado, Fecha FROM #DiferenciasDiarias"))
+            resultado["corregidas"] = resultado["faltantes"] + resultado["sobrantes"]
+        cur.execute("DROP TABLE #DiferenciasDiarias")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    return resultado
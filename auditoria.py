@@ -0,0 +1,215 @@
+from datetime import datetime
+
+import pyodbc
+
+from db import get_connection
+from escritor_lotes import EscritorPorLotes
+
+
+_SQL_INSERTAR = """
+    INSERT INTO Auditoria (IdUsuario, NombreUsuario, Accion, Modulo, Detalles, FechaHora, DireccionIP)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Largos de las columnas de Auditoria (varchar): se recorta antes de encolar para que
+# un texto largo no haga fallar el lote completo
+_LARGOS = (None, 50, 100, 50, 500, None, 45)
+
+# Errores que indican que la base no está disponible (el lote se guarda en el spill)
+_ERRORES_CONEXION = (pyodbc.OperationalError, pyodbc.InterfaceError)
+
+
+def _recortar(evento: tuple) -> tuple:
+    return tuple(
+        v[:largo] if largo and isinstance(v, str) else v
+        for v, largo in zip(evento, _LARGOS)
+    )
+
+
+class EscritorAuditoria(EscritorPorLotes):
+    """Escribe la auditoría en segundo plano, por lotes (ver EscritorPorLotes).
+
+    - `registrar()` solo encola el evento (con su FechaHora) y regresa.
+    - Filas que la base rechaza (p. ej. IdUsuario ya eliminado) se reintentan una por
+      una y las que fallan se descartan (contador `rechazados`) para no trabar el resto.
+    """
+
+    nombre_hilo = "auditoria-writer"
+
+    def registrar(self, id_usuario, nombre_usuario, accion, modulo, detalles, ip, fecha_hora=None) -> None:
+        self.encolar(_recortar((id_usuario, nombre_usuario, accion, modulo, detalles,
+                                fecha_hora or datetime.now(), ip)))
+
+    def _a_json(self, evento: tuple) -> list:
+        fila = list(evento)
+        fila[5] = fila[5].isoformat()
+        return fila
+
+    def _de_json(self, fila: list) -> tuple:
+        fila[5] = datetime.fromisoformat(fila[5])
+        return tuple(fila)
+
+    def _insertar(self, eventos: list) -> None:
+        """Inserta el lote. Lanza la excepción si la base no está disponible."""
+        with get_connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.fast_executemany = True
+                try:
+                    cur.executemany(_SQL_INSERTAR, eventos)
+                    escritos = len(eventos)
+                except _ERRORES_CONEXION:
+                    raise
+                except pyodbc.Error:
+                    # Alguna fila inválida: reintentar una por una
+                    conn.rollback()
+                    escritos = 0
+                    for ev in eventos:
+                        try:
+                            cur.execute(_SQL_INSERTAR, ev)
+                            escritos += 1
+                        except _ERRORES_CONEXION:
+                            raise
+                        except pyodbc.Error as e:
+                            print(f"Evento de auditoría rechazado: {e}")
+                            self._contar("rechazados")
+            finally:
+                cur.close()
+        self._contar("escritos", escritos)
+        self._contar("lotes")
+
+
+# =============================
+# Archivo mensual (tiering)
+# Auditoria solo guarda los meses recientes; lo anterior se mueve a una tabla por mes
+# (AuditoriaArchivo_AAAAMM) registrada en AuditoriaArchivoMeses.
+# =============================
+_SQL_CREAR_ARCHIVO = """
+    IF OBJECT_ID('{tabla}', 'U') IS NULL
+    BEGIN
+        CREATE TABLE {tabla} (
+            IdLog INT NOT NULL,
+            IdUsuario INT NULL,
+            NombreUsuario VARCHAR(50) NULL,
+            Accion VARCHAR(100) NOT NULL,
+            Modulo VARCHAR(50) NULL,
+            Detalles VARCHAR(500) NULL,
+            FechaHora DATETIME2(7) NOT NULL,
+            DireccionIP VARCHAR(45) NULL,
+            CONSTRAINT PK_{tabla} PRIMARY KEY CLUSTERED (FechaHora DESC, IdLog DESC)
+        ){opciones};
+        CREATE NONCLUSTERED INDEX IX_{tabla}_Usuario ON {tabla} (IdUsuario){opciones};
+    END
+"""
+
+# Mueve un lote en una sola sentencia: lo que se borra de Auditoria se inserta en el archivo
+_SQL_MOVER_LOTE = """
+    SET NOCOUNT ON;
+    DELETE TOP (?) FROM Auditoria
+    OUTPUT deleted.IdLog, deleted.IdUsuario, deleted.NombreUsuario, deleted.Accion,
+           deleted.Modulo, deleted.Detalles, deleted.FechaHora, deleted.DireccionIP
+    INTO {tabla} (IdLog, IdUsuario, NombreUsuario, Accion, Modulo, Detalles, FechaHora, DireccionIP)
+    WHERE FechaHora >= ? AND FechaHora < ?;
+    SELECT @@ROWCOUNT;
+"""
+
+_SQL_REGISTRAR_MES = """
+    SET NOCOUNT ON;
+    DECLARE @filas INT = (SELECT COUNT(*) FROM {tabla});
+    UPDATE AuditoriaArchivoMeses SET Filas = @filas, ArchivadoEn = SYSDATETIME() WHERE Mes = ?;
+    IF @@ROWCOUNT = 0
+        INSERT INTO AuditoriaArchivoMeses (Mes, Filas, ArchivadoEn) VALUES (?, @filas, SYSDATETIME());
+"""
+
+
+def nombre_tabla_archivo(mes: int) -> str:
+    """Nombre de la tabla de archivo de un mes AAAAMM (siempre armado desde el entero)."""
+    return f"AuditoriaArchivo_{int(mes):06d}"
+
+
+def _mes(fecha) -> int:
+    return fecha.year * 100 + fecha.month
+
+
+def _rango_mes(mes: int) -> tuple:
+    anio, m = divmod(mes, 100)
+    inicio = datetime(anio, m, 1)
+    fin = datetime(anio + 1, 1, 1) if m == 12 else datetime(anio, m + 1, 1)
+    return inicio, fin
+
+
+def corte_retencion(meses_retencion: int, hoy=None) -> datetime:
+    """Primer día del mes más antiguo que se conserva en Auditoria."""
+    hoy = hoy or datetime.now()
+    total = hoy.year * 12 + (hoy.month - 1) - max(0, meses_retencion)
+    return datetime(total // 12, total % 12 + 1, 1)
+
+
+def tablas_archivo(cur, desde=None, hasta=None) -> list:
+    """Tablas de archivo que pueden tener filas en [desde, hasta), de la más nueva a la más vieja."""
+    condiciones, params = [], []
+    if desde:
+        condiciones.append("Mes >= ?")
+        params.append(_mes(desde))
+    if hasta:
+        condiciones.append("Mes <= ?")
+        params.append(_mes(hasta))
+    where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+    cur.execute(f"SELECT Mes FROM AuditoriaArchivoMeses {where} ORDER BY Mes DESC", params)
+    return [nombre_tabla_archivo(r[0]) for r in cur.fetchall()]
+
+
+def _crear_tabla_archivo(conn, cur, tabla: str, compresion: str) -> None:
+    opciones = f" WITH (DATA_COMPRESSION = {compresion})" if compresion else ""
+    try:
+        cur.execute(_SQL_CREAR_ARCHIVO.format(tabla=tabla, opciones=opciones))
+    except pyodbc.Error as e:
+        if not compresion:
+            raise
+        # Ediciones sin compresión de datos: crear la tabla sin ella
+        print(f"No se pudo crear {tabla} con compresión {compresion}, se crea sin compresión: {e}")
+        conn.rollback()
+        cur.execute(_SQL_CREAR_ARCHIVO.format(tabla=tabla, opciones=""))
+    conn.commit()
+
+
+def compactar_auditoria(meses_retencion: int, tamano_lote: int = 5000, compresion: str = "PAGE",
+                        informar=print) -> dict:
+    """Mueve a las tablas mensuales de archivo las filas de Auditoria anteriores al corte.
+
+    Cada lote es un DELETE ... OUTPUT INTO con su propio commit, así el log de
+    transacciones y los bloqueos sobre Auditoria se mantienen chicos. Se puede
+    ejecutar las veces que haga falta: si se interrumpe, la siguiente corrida continúa.
+    """
+    corte = corte_retencion(meses_retencion)
+    movidos = {}
+    with get_connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+                SELECT DISTINCT YEAR(FechaHora) * 100 + MONTH(FechaHora)
+                FROM Auditoria WHERE FechaHora < ?
+                """,
+                (corte,),
+            )
+            meses = sorted(r[0] for r in cur.fetchall())
+            for mes in meses:
+                tabla = nombre_tabla_archivo(mes)
+                inicio, fin = _rango_mes(mes)
+                _crear_tabla_archivo(conn, cur, tabla, compresion)
+                total = 0
+                while True:
+                    cur.execute(_SQL_MOVER_LOTE.format(tabla=tabla), (tamano_lote, inicio, fin))
+                    filas = cur.fetchone()[0]
+                    conn.commit()
+                    total += filas
+                    if filas < tamano_lote:
+                        break
+                cur.execute(_SQL_REGISTRAR_MES.format(tabla=tabla), (mes, mes))
+                conn.commit()
+                movidos[mes] = total
+                informar(f"{tabla}: {total} fila(s) movidas")
+        finally:
+            cur.close()
+    return {"corte": corte, "movidos": movidos}
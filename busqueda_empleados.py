@@ -0,0 +1,152 @@
+import re
+import threading
+import time
+import unicodedata
+
+
+_NO_ALFANUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalizar(texto) -> str:
+    """Minúsculas, sin tildes ni signos: 'Pérez-Ñuñez' -> 'perez nunez'."""
+    if not texto:
+        return ""
+    descompuesto = unicodedata.normalize("NFKD", str(texto))
+    sin_tildes = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return _NO_ALFANUM.sub(" ", sin_tildes.casefold()).strip()
+
+
+def _trigramas(texto: str) -> set:
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceEmpleados:
+    """Índice de búsqueda de empleados en memoria (trigramas) por proceso.
+
+    - Cada empleado se indexa como un texto normalizado con código, nombres,
+      apellidos, DPI e IGSS; el DPI y el IGSS también sin espacios ni guiones.
+    - `buscar("juan perez")` devuelve el set de IdEmpleado cuyo texto contiene
+      todos los términos (en cualquier orden, sin importar tildes ni mayúsculas).
+    - Los términos de 3+ caracteres usan el índice de trigramas y se confirman
+      sobre el texto; los más cortos se comparan contra los candidatos.
+    - Las altas/ediciones/bajas de este proceso se aplican al momento con
+      `actualizar()`/`eliminar()`, que además suben la versión del backend para
+      que los demás workers reconstruyan su índice en la siguiente búsqueda.
+      Sin cambios, el índice se reconstruye cada `max_antiguedad` segundos para
+      recoger cambios hechos fuera de la aplicación.
+    """
+
+    def __init__(self, backend, cargar, max_antiguedad: int = 600):
+        self.backend = backend
+        self._cargar = cargar
+        self.max_antiguedad = max_antiguedad
+        self._textos = {}  # IdEmpleado -> texto normalizado
+        self._trigramas = {}  # trigrama -> set(IdEmpleado)
+        self._version = None
+        self._construido = None  # time.monotonic() de la última carga
+        self._lock = threading.RLock()
+        self._stats = {"busquedas": 0, "reconstrucciones": 0, "ultima_duracion": None}
+
+    # -----------------------------
+    # Construcción
+    # -----------------------------
+    @staticmethod
+    def _texto(codigo, nombres, apellidos, dpi, igss) -> str:
+        partes = [codigo, nombres, apellidos, dpi, igss]
+        texto = " ".join(normalizar(p) for p in partes if p)
+        compactos = [normalizar(p).replace(" ", "") for p in (dpi, igss) if p]
+        return " ".join([texto] + [c for c in compactos if c and c not in texto])
+
+    def _agregar(self, id_empleado: int, texto: str) -> None:
+        self._textos[id_empleado] = texto
+        for tri in _trigramas(texto):
+            self._trigramas.setdefault(tri, set()).add(id_empleado)
+
+    def _quitar(self, id_empleado: int) -> None:
+        texto = self._textos.pop(id_empleado, None)
+        if texto is None:
+            return
+        for tri in _trigramas(texto):
+            ids = self._trigramas.get(tri)
+            if ids is not None:
+                ids.discard(id_empleado)
+                if not ids:
+                    del self._trigramas[tri]
+
+    def _reconstruir(self, version) -> None:
+        inicio = time.monotonic()
+        filas = self._cargar()
+        self._textos = {}
+        self._trigramas = {}
+        for id_empleado, *campos in filas:
+            self._agregar(id_empleado, self._texto(*campos))
+        self._version = version
+        self._construido = time.monotonic()
+        self._stats["reconstrucciones"] += 1
+        self._stats["ultima_duracion"] = round(self._construido - inicio, 3)
+
+    def _asegurar(self) -> None:
+        version = self.backend.actual()
+        vencido = self._construido is None or time.monotonic() - self._construido > self.max_antiguedad
+        if vencido or version != self._version:
+            self._reconstruir(version)
+
+    # -----------------------------
+    # Consulta
+    # -----------------------------
+    def buscar(self, termino: str) -> set:
+        """IdEmpleado que coinciden con todos los términos de la búsqueda."""
+        terminos = normalizar(termino).split()
+        if not terminos:
+            return set()
+        # Los términos largos primero: reducen más los candidatos
+        terminos.sort(key=len, reverse=True)
+        with self._lock:
+            self._asegurar()
+            self._stats["busquedas"] += 1
+            candidatos = None
+            for t in terminos:
+                if len(t) < 3:
+                    continue
+                for tri in _trigramas(t):
+                    ids = self._trigramas.get(tri)
+                    if not ids:
+                        return set()
+                    candidatos = set(ids) if candidatos is None else candidatos & ids
+                    if not candidatos:
+                        return set()
+            if candidatos is None:
+                candidatos = self._textos.keys()
+            return {i for i in candidatos if all(t in self._textos[i] for t in terminos)}
+
+    # -----------------------------
+    # Mantenimiento desde las vistas de empleados
+    # -----------------------------
+    def _publicar(self, cambio) -> None:
+        with self._lock:
+            # (anterior, nueva) de la misma operación: si otro proceso subió la versión
+            # antes o después de leerla aquí, no se da por vista su modificación
+            anterior, nueva = self.backend.incrementar()
+            if self._construido is None or self._version != anterior:
+                # El índice ya estaba viejo: se reconstruye completo en la siguiente búsqueda
+                return
+            cambio()
+            self._version = nueva
+
+    def actualizar(self, id_empleado: int, codigo, nombres, apellidos, dpi, igss) -> None:
+        texto = self._texto(codigo, nombres, apellidos, dpi, igss)
+
+        def cambio():
+            self._quitar(id_empleado)
+            self._agregar(id_empleado, texto)
+
+        self._publicar(cambio)
+
+    def eliminar(self, id_empleado: int) -> None:
+        self._publicar(lambda: self._quitar(id_empleado))
+
+    def stats(self) -> dict:
+        with self._lock:
+            datos = dict(self._stats)
+            datos.update({"empleados": len(self._textos), "trigramas": len(self._trigramas)})
+        return datos
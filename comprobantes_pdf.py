@@ -0,0 +1,534 @@
+import glob
+import hashlib
+import io
+import json
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Table, Paragraph, Spacer
+
+from exportar import SalidaStream
+from reportes_pdf import (
+    ANCHOS_COMPROBANTE_DETALLE, ANCHOS_COMPROBANTE_EMPLEADO, ANCHOS_COMPROBANTE_RESUMEN, COMPROBANTE_DETALLE,
+    COMPROBANTE_EMPLEADO, COMPROBANTE_RESUMEN, MARGENES_COMPROBANTE, PIE, SUBTITULO, TITULO_COMPROBANTE,
+    documento_comprobante,
+)
+
+# Renderizadores disponibles para COMPROBANTES_RENDER
+RENDERIZADORES = ("canvas", "platypus")
+
+
+# =============================
+# Render de un comprobante
+# =============================
+def renderizador_configurado() -> str:
+    """COMPROBANTES_RENDER: "canvas" (por defecto) o "platypus"."""
+    valor = (os.getenv("COMPROBANTES_RENDER") or "canvas").strip().lower()
+    return valor if valor in RENDERIZADORES else "canvas"
+
+
+def renderizar_comprobante(datos: dict) -> bytes:
+    """Dibuja el comprobante de pago y devuelve el PDF en bytes.
+
+    `datos` tiene las llaves empleado, periodo, nomina (dicts) e items
+    (lista de tuplas (nombre, tipo_item, monto)). Solo usa tipos simples para
+    poder enviarse a otro proceso. El renderizador se elige con COMPROBANTES_RENDER.
+    """
+    if renderizador_configurado() == "platypus":
+        return renderizar_comprobante_platypus(datos)
+    return renderizar_comprobante_canvas(datos)
+
+
+def renderizar_comprobante_platypus(datos: dict) -> bytes:
+    """Comprobante armado con SimpleDocTemplate, Paragraphs y Tables."""
+    empleado = datos["empleado"]
+    periodo = datos["periodo"]
+    nomina = datos["nomina"]
+    items = datos["items"]
+
+    buffer = io.BytesIO()
+    doc = documento_comprobante(buffer)
+
+    # Contenido del PDF (estilos y anchos compartidos de reportes_pdf)
+    story = []
+
+    # Encabezado
+    story.append(Paragraph("COMPROBANTE DE PAGO", TITULO_COMPROBANTE))
+    story.append(Paragraph(f"Periodo: {periodo['inicio']} - {periodo['fin']}", SUBTITULO))
+    story.append(Spacer(1, 0.3*inch))
+
+    # Información del empleado
+    emp_data = [
+        ["Código:", empleado['codigo'], "Nombre:", f"{empleado['nombres']} {empleado['apellidos']}"],
+        ["DPI:", empleado['dpi'], "IGSS:", empleado['igss'] or 'N/A']
+    ]
+    emp_table = Table(emp_data, colWidths=ANCHOS_COMPROBANTE_EMPLEADO)
+    emp_table.setStyle(COMPROBANTE_EMPLEADO)
+    story.append(emp_table)
+    story.append(Spacer(1, 0.3*inch))
+
+    # Detalle de nómina
+    detail_data = [["Concepto", "Tipo", "Monto"]]
+    detail_data.append(["Salario Base", "Base", f"Q {nomina['salario_base']:.2f}"])
+
+    for item in items:
+        tipo_label = "Prestación" if item[1] == "prestacion" else "Deducción"
+        detail_data.append([item[0], tipo_label, f"Q {item[2]:.2f}"])
+
+    detail_table = Table(detail_data, colWidths=ANCHOS_COMPROBANTE_DETALLE)
+    detail_table.setStyle(COMPROBANTE_DETALLE)
+    story.append(detail_table)
+    story.append(Spacer(1, 0.2*inch))
+
+    # Resumen
+    summary_data = [
+        ["Total Prestaciones:", f"Q {nomina['prestaciones']:.2f}"],
+        ["Total Deducciones:", f"Q {nomina['deducciones']:.2f}"],
+        ["SALARIO NETO:", f"Q {nomina['neto']:.2f}"]
+    ]
+    summary_table = Table(summary_data, colWidths=ANCHOS_COMPROBANTE_RESUMEN)
+    summary_table.setStyle(COMPROBANTE_RESUMEN)
+    story.append(summary_table)
+    story.append(Spacer(1, 0.5*inch))
+
+    # Pie de página
+    story.append(Paragraph(f"Generado el {datetime.now().strftime('%d/%m/%Y %H:%M')}", PIE))
+
+    # Construir PDF
+    doc.build(story)
+    return buffer.getvalue()
+
+
+# =============================
+# Render directo en el canvas
+# =============================
+# Mismo diseño que renderizar_comprobante_platypus, pero dibujado en el canvas con
+# coordenadas calculadas una vez aquí en lugar de que platypus mida y ubique cada
+# Paragraph y Table en cada llamada. Las posiciones son las que produce ese
+# layout: página carta, MARGENES_COMPROBANTE y 6 pt de padding del Frame; las
+# tablas (6") van centradas; cada fila mide 18 pt (3 pt de padding arriba y abajo
+# + leading 12) y el texto de una celda va en fila + 3 + 12 - tamaño de letra.
+_PADDING = 6
+_ALTO_FILA = 18
+_CENTRO = MARGENES_COMPROBANTE["leftMargin"] + (
+    letter[0] - MARGENES_COMPROBANTE["leftMargin"] - MARGENES_COMPROBANTE["rightMargin"]) / 2
+_X_TABLA = _CENTRO - sum(ANCHOS_COMPROBANTE_DETALLE) / 2
+_Y_TOPE = letter[1] - MARGENES_COMPROBANTE["topMargin"] - _PADDING
+_Y_MINIMO = MARGENES_COMPROBANTE["bottomMargin"] + _PADDING
+
+
+def _bordes_columnas(anchos) -> tuple:
+    bordes = [_X_TABLA]
+    for ancho in anchos:
+        bordes.append(bordes[-1] + ancho)
+    return tuple(bordes)
+
+
+_COLUMNAS_EMPLEADO = _bordes_columnas(ANCHOS_COMPROBANTE_EMPLEADO)
+_COLUMNAS_DETALLE = _bordes_columnas(ANCHOS_COMPROBANTE_DETALLE)
+_COLUMNAS_RESUMEN = _bordes_columnas(ANCHOS_COMPROBANTE_RESUMEN)
+
+# Líneas base del título y subtítulo, y bordes superiores de las tablas
+_Y_TITULO = _Y_TOPE - TITULO_COMPROBANTE.fontSize
+_Y_SUBTITULO = _Y_TOPE - TITULO_COMPROBANTE.leading - TITULO_COMPROBANTE.spaceAfter - SUBTITULO.fontSize
+_Y_EMPLEADO = (_Y_TOPE - TITULO_COMPROBANTE.leading - TITULO_COMPROBANTE.spaceAfter
+               - SUBTITULO.leading - 0.3*inch)
+_Y_DETALLE = _Y_EMPLEADO - 2 * _ALTO_FILA - 0.3*inch
+# Lo que va debajo del detalle: espacio, resumen (3 filas), espacio y pie
+_BAJO_DETALLE = 0.2*inch + 3 * _ALTO_FILA + 0.5*inch + PIE.leading
+# Ítems que caben en una página; con más, platypus parte el detalle y se usa ese renderizador
+MAX_ITEMS_CANVAS = int((_Y_DETALLE - _BAJO_DETALLE - _Y_MINIMO) // _ALTO_FILA) - 2
+
+# Colores de COMPROBANTE_EMPLEADO, COMPROBANTE_DETALLE y COMPROBANTE_RESUMEN
+_AZUL = colors.HexColor('#1e40af')
+_FONDO_ETIQUETA = colors.HexColor('#e5e7eb')
+_FONDO_ALTERNO = colors.HexColor('#f3f4f6')
+
+
+def _con_saltos(datos: dict) -> bool:
+    """True si algún texto de tabla trae saltos de línea (la Table los parte en varias líneas)."""
+    empleado = datos["empleado"]
+    textos = [empleado['codigo'], empleado['nombres'], empleado['apellidos'], empleado['dpi'], empleado['igss']]
+    textos.extend(item[0] for item in datos["items"])
+    return any("\n" in str(t) for t in textos if t)
+
+
+def _grilla(c, columnas: tuple, y_tope: float, filas: int) -> None:
+    """GRID de 0.5 pt gris de una tabla con bordes de columna `columnas`."""
+    y_base = y_tope - filas * _ALTO_FILA
+    lineas = [(columnas[0], y_tope - i * _ALTO_FILA, columnas[-1], y_tope - i * _ALTO_FILA)
+              for i in range(filas + 1)]
+    lineas.extend((x, y_base, x, y_tope) for x in columnas)
+    c.lines(lineas)
+
+
+def renderizar_comprobante_canvas(datos: dict) -> bytes:
+    """Comprobante dibujado directamente en el canvas (visualmente igual al de platypus).
+
+    Si el detalle no cabe en una página o algún texto trae saltos de línea se
+    usa renderizar_comprobante_platypus, que sabe partir tablas y celdas.
+    """
+    items = datos["items"]
+    if len(items) > MAX_ITEMS_CANVAS or _con_saltos(datos):
+        return renderizar_comprobante_platypus(datos)
+    empleado = datos["empleado"]
+    periodo = datos["periodo"]
+    nomina = datos["nomina"]
+
+    filas_detalle = len(items) + 2
+    y_resumen = _Y_DETALLE - filas_detalle * _ALTO_FILA - 0.2*inch
+    y_pie = y_resumen - 3 * _ALTO_FILA - 0.5*inch - PIE.fontSize
+
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+
+    # Fondos: etiquetas del empleado, encabezado del detalle y filas alternas
+    c.setFillColor(_FONDO_ETIQUETA)
+    for col in (0, 2):
+        c.rect(_COLUMNAS_EMPLEADO[col], _Y_EMPLEADO - 2 * _ALTO_FILA,
+               ANCHOS_COMPROBANTE_EMPLEADO[col], 2 * _ALTO_FILA, stroke=0, fill=1)
+    ancho_detalle = _COLUMNAS_DETALLE[-1] - _X_TABLA
+    c.setFillColor(_AZUL)
+    c.rect(_X_TABLA, _Y_DETALLE - _ALTO_FILA, ancho_detalle, _ALTO_FILA, stroke=0, fill=1)
+    c.setFillColor(_FONDO_ALTERNO)
+    for fila in range(2, filas_detalle, 2):
+        c.rect(_X_TABLA, _Y_DETALLE - (fila + 1) * _ALTO_FILA, ancho_detalle, _ALTO_FILA, stroke=0, fill=1)
+
+    # Textos (un solo objeto de texto para toda la página)
+    t = c.beginText()
+
+    def centrado(texto, y, estilo):
+        t.setFont(estilo.fontName, estilo.fontSize, estilo.leading)
+        t.setFillColor(estilo.textColor)
+        t.setTextOrigin(_CENTRO - stringWidth(texto, estilo.fontName, estilo.fontSize) / 2, y)
+        t.textOut(texto)
+
+    def celda(texto, x, y_fila, fuente, tamano, derecha=False):
+        if derecha:
+            x -= stringWidth(texto, fuente, tamano) + _PADDING
+        else:
+            x += _PADDING
+        t.setTextOrigin(x, y_fila + 15 - tamano)
+        t.textOut(texto)
+
+    centrado("COMPROBANTE DE PAGO", _Y_TITULO, TITULO_COMPROBANTE)
+    centrado(f"Periodo: {periodo['inicio']} - {periodo['fin']}", _Y_SUBTITULO, SUBTITULO)
+
+    # Información del empleado
+    t.setFillColor(colors.black)
+    filas_empleado = [
+        ["Código:", empleado['codigo'], "Nombre:", f"{empleado['nombres']} {empleado['apellidos']}"],
+        ["DPI:", empleado['dpi'], "IGSS:", empleado['igss'] or 'N/A']
+    ]
+    for i, fila in enumerate(filas_empleado):
+        y_fila = _Y_EMPLEADO - (i + 1) * _ALTO_FILA
+        for col, valor in enumerate(fila):
+            fuente = 'Helvetica-Bold' if col in (0, 2) else 'Helvetica'
+            t.setFont(fuente, 9, 12)
+            celda(str(valor), _COLUMNAS_EMPLEADO[col], y_fila, fuente, 9)
+
+    # Detalle de nómina
+    y_fila = _Y_DETALLE - _ALTO_FILA
+    t.setFillColor(colors.whitesmoke)
+    t.setFont('Helvetica-Bold', 10, 12)
+    celda("Concepto", _COLUMNAS_DETALLE[0], y_fila, 'Helvetica-Bold', 10)
+    celda("Tipo", _COLUMNAS_DETALLE[1], y_fila, 'Helvetica-Bold', 10)
+    celda("Monto", _COLUMNAS_DETALLE[3], y_fila, 'Helvetica-Bold', 10, derecha=True)
+    t.setFillColor(colors.black)
+    t.setFont('Helvetica', 9, 12)
+    detalle = [("Salario Base", "Base", nomina['salario_base'])]
+    detalle.extend((item[0], "Prestación" if item[1] == "prestacion" else "Deducción", item[2]) for item in items)
+    for concepto, tipo_label, monto in detalle:
+        y_fila -= _ALTO_FILA
+        celda(str(concepto), _COLUMNAS_DETALLE[0], y_fila, 'Helvetica', 9)
+        celda(tipo_label, _COLUMNAS_DETALLE[1], y_fila, 'Helvetica', 9)
+        celda(f"Q {monto:.2f}", _COLUMNAS_DETALLE[3], y_fila, 'Helvetica', 9, derecha=True)
+
+    # Resumen
+    t.setFont('Helvetica', 10, 12)
+    for i, (etiqueta, monto) in enumerate((("Total Prestaciones:", nomina['prestaciones']),
+                                           ("Total Deducciones:", nomina['deducciones']))):
+        y_fila = y_resumen - (i + 1) * _ALTO_FILA
+        celda(etiqueta, _COLUMNAS_RESUMEN[1], y_fila, 'Helvetica', 10, derecha=True)
+        celda(f"Q {monto:.2f}", _COLUMNAS_RESUMEN[2], y_fila, 'Helvetica', 10, derecha=True)
+    y_fila = y_resumen - 3 * _ALTO_FILA
+    t.setFillColor(_AZUL)
+    t.setFont('Helvetica-Bold', 12, 12)
+    celda("SALARIO NETO:", _COLUMNAS_RESUMEN[1], y_fila, 'Helvetica-Bold', 12, derecha=True)
+    celda(f"Q {nomina['neto']:.2f}", _COLUMNAS_RESUMEN[2], y_fila, 'Helvetica-Bold', 12, derecha=True)
+
+    # Pie de página
+    centrado(f"Generado el {datetime.now().strftime('%d/%m/%Y %H:%M')}", y_pie, PIE)
+    c.drawText(t)
+
+    # Líneas: grillas del empleado y del detalle, y la línea sobre el neto
+    c.setLineCap(1)
+    c.setLineJoin(1)
+    c.setStrokeColor(colors.grey)
+    c.setLineWidth(0.5)
+    _grilla(c, _COLUMNAS_EMPLEADO, _Y_EMPLEADO, 2)
+    _grilla(c, _COLUMNAS_DETALLE, _Y_DETALLE, filas_detalle)
+    c.setStrokeColor(_AZUL)
+    c.setLineWidth(2)
+    y_neto = y_resumen - 2 * _ALTO_FILA
+    c.line(_X_TABLA, y_neto, _COLUMNAS_RESUMEN[-1], y_neto)
+
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def _renderizar_lote(lote: list) -> list:
+    """Tarea de un proceso del pool: renderiza varios comprobantes seguidos."""
+    return [renderizar_comprobante(datos) for datos in lote]
+
+
+# =============================
+# Caché de PDFs renderizados
+# =============================
+def huella_comprobante(datos: dict) -> str:
+    """Hash del contenido del comprobante (registro, empleado, periodo e ítems) y del renderizador.
+
+    Cambia si cambia cualquier dato impreso o COMPROBANTES_RENDER, así que un PDF
+    guardado con la misma huella siempre es válido aunque otro worker no haya
+    invalidado su caché, y el ETag cambia al pasar de un renderizador a otro.
+    """
+    contenido = json.dumps(
+        [renderizador_configurado(), datos["empleado"], datos["periodo"], datos["nomina"],
+         [list(it) for it in datos["items"]]],
+        default=str, sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()[:32]
+
+
+class CacheComprobantes:
+    """LRU de PDFs por (IdNomina, huella), acotada en bytes.
+
+    Si se indica `directorio`, los PDF también se guardan en disco
+    (<IdNomina>-<huella>.pdf) y se comparten entre workers y reinicios.
+    Por cada IdNomina solo se conserva la huella más reciente.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, directorio: str = None):
+        self.max_bytes = max_bytes
+        self.directorio = directorio
+        self._datos = OrderedDict()  # (id_nomina, huella) -> pdf
+        self._huellas = {}  # id_nomina -> huella guardada
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"aciertos": 0, "aciertos_disco": 0, "fallos": 0, "invalidaciones": 0}
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+    def _ruta(self, id_nomina, huella) -> str:
+        return os.path.join(self.directorio, f"{int(id_nomina)}-{huella}.pdf")
+
+    def _guardar_memoria(self, id_nomina, huella, pdf: bytes) -> None:
+        """Debe llamarse con el lock tomado."""
+        anterior = self._huellas.get(id_nomina)
+        if anterior is not None and anterior != huella:
+            viejo = self._datos.pop((id_nomina, anterior), None)
+            if viejo is not None:
+                self._bytes -= len(viejo)
+        if len(pdf) > self.max_bytes:
+            return
+        if (id_nomina, huella) not in self._datos:
+            self._bytes += len(pdf)
+        self._datos[(id_nomina, huella)] = pdf
+        self._datos.move_to_end((id_nomina, huella))
+        self._huellas[id_nomina] = huella
+        while self._bytes > self.max_bytes and self._datos:
+            (id_viejo, _), viejo = self._datos.popitem(last=False)
+            self._huellas.pop(id_viejo, None)
+            self._bytes -= len(viejo)
+
+    def obtener(self, id_nomina, huella: str, renderizar) -> bytes:
+        """Devuelve el PDF guardado o lo genera con `renderizar()` y lo guarda."""
+        with self._lock:
+            pdf = self._datos.get((id_nomina, huella))
+            if pdf is not None:
+                self._datos.move_to_end((id_nomina, huella))
+                self._stats["aciertos"] += 1
+                return pdf
+
+        if self.directorio:
+            try:
+                with open(self._ruta(id_nomina, huella), "rb") as fh:
+                    pdf = fh.read()
+                with self._lock:
+                    self._stats["aciertos_disco"] += 1
+                    self._guardar_memoria(id_nomina, huella, pdf)
+                return pdf
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Error leyendo comprobante en caché: {e}")
+
+        pdf = renderizar()
+        with self._lock:
+            self._stats["fallos"] += 1
+            self._guardar_memoria(id_nomina, huella, pdf)
+
+        if self.directorio:
+            try:
+                self._borrar_disco(id_nomina)
+                ruta = self._ruta(id_nomina, huella)
+                tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as fh:
+                    fh.write(pdf)
+                os.replace(tmp, ruta)
+            except OSError as e:
+                print(f"Error guardando comprobante en caché: {e}")
+        return pdf
+
+    def _borrar_disco(self, id_nomina) -> None:
+        for ruta in glob.glob(os.path.join(self.directorio, f"{int(id_nomina)}-*.pdf")):
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+    def invalidar(self, ids_nomina) -> None:
+        """Quita de la caché (memoria y disco) los comprobantes de esas nóminas."""
+        ids = list(ids_nomina)
+        with self._lock:
+            for id_nomina in ids:
+                huella = self._huellas.pop(id_nomina, None)
+                if huella is not None:
+                    pdf = self._datos.pop((id_nomina, huella), None)
+                    if pdf is not None:
+                        self._bytes -= len(pdf)
+            self._stats["invalidaciones"] += len(ids)
+        if self.directorio:
+            for id_nomina in ids:
+                self._borrar_disco(id_nomina)
+
+    def stats(self) -> dict:
+        with self._lock:
+            datos = dict(self._stats)
+            datos.update({
+                "comprobantes": len(self._datos),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disco": bool(self.directorio),
+            })
+        return datos
+
+
+# =============================
+# Render masivo (pool de procesos)
+# =============================
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _procesos_configurados() -> int:
+    try:
+        return max(1, int(os.getenv("COMPROBANTES_PROCESOS", os.cpu_count() or 1)))
+    except (TypeError, ValueError):
+        return max(1, os.cpu_count() or 1)
+
+
+def _obtener_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=_procesos_configurados())
+        return _executor
+
+
+def _reiniciar_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def renderizar_comprobantes(lista: list, lote: int = 25):
+    """Renderiza los comprobantes de `lista` y los entrega en el mismo orden: (datos, pdf).
+
+    Con COMPROBANTES_PROCESOS > 1 y más de un lote de trabajo se reparte en un pool
+    de procesos (reutilizado entre llamadas); si no, o si el pool falla, se
+    renderiza en el proceso actual. Es un generador: cada resultado puede enviarse
+    al cliente en cuanto está listo.
+    """
+    if not lista:
+        return
+    if _procesos_configurados() <= 1 or len(lista) <= lote:
+        for datos in lista:
+            yield datos, renderizar_comprobante(datos)
+        return
+
+    lotes = [lista[i:i + lote] for i in range(0, len(lista), lote)]
+    entregados = 0
+    try:
+        for pdfs in _obtener_executor().map(_renderizar_lote, lotes):
+            for pdf in pdfs:
+                yield lista[entregados], pdf
+                entregados += 1
+    except BrokenProcessPool as e:
+        print(f"Pool de comprobantes caído, se continúa en el proceso actual: {e}")
+        _reiniciar_executor()
+        for datos in lista[entregados:]:
+            yield datos, renderizar_comprobante(datos)
+
+
+def nombre_archivo_comprobante(datos: dict) -> str:
+    empleado = datos["empleado"]
+    codigo = str(empleado["codigo"] or empleado["id"]).replace("/", "-").replace("\\", "-")
+    return f"comprobante_{codigo}_{datos['id_nomina']}.pdf"
+
+
+# =============================
+# Salidas: ZIP en streaming o PDF unido
+# =============================
+def generar_zip(resultados):
+    """Genera un ZIP (bytes por bloques) con un PDF por comprobante, sin armarlo en memoria."""
+    salida = SalidaStream()
+    # Los PDF ya vienen comprimidos: ZIP_STORED evita trabajo inútil
+    with zipfile.ZipFile(salida, mode="w", compression=zipfile.ZIP_STORED) as zf:
+        for datos, pdf in resultados:
+            zf.writestr(nombre_archivo_comprobante(datos), pdf)
+            bloque = salida.vaciar()
+            if bloque:
+                yield bloque
+    bloque = salida.vaciar()
+    if bloque:
+        yield bloque
+
+
+def unir_pdfs(resultados, tamano_bloque: int = 256 * 1024):
+    """Une los PDF en un solo documento y lo entrega por bloques.
+
+    Requiere pypdf. El documento final se arma al terminar de renderizar, así que
+    los bytes empiezan a salir después del último comprobante.
+    """
+    # Importar aquí (y no dentro del generador) para fallar antes de empezar la respuesta
+    from pypdf import PdfReader, PdfWriter
+
+    def _bloques():
+        writer = PdfWriter()
+        for _, pdf in resultados:
+            writer.append(PdfReader(io.BytesIO(pdf)))
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        writer.close()
+        buffer.seek(0)
+        while True:
+            bloque = buffer.read(tamano_bloque)
+            if not bloque:
+                break
+            yield bloque
+
+    return _bloques()
@@ -1,7 +1,12 @@
 import os
-import pyodbc
+import threading
+import time
+from collections import deque
 from typing import Optional
 
+import pyodbc
+from flask import g, has_app_context
+
 
 def _get_driver() -> str:
     # Intenta drivers comunes en Windows. Puedes cambiar por tu versión instalada.
@@ -43,6 +48,336 @@ def _build_connection_string() -> str:
     )
     return conn_str
 
-def get_connection() -> pyodbc.Connection:
-    conn_str = _build_connection_string()
-    return pyodbc.connect(conn_str)
+
+def _env_int(nombre: str, default: int) -> int:
+    try:
+        return int(os.getenv(nombre, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# =============================
+# Pool de conexiones
+# =============================
+class PoolTimeout(Exception):
+    """No se obtuvo una conexión libre dentro del tiempo de espera del pool."""
+
+
+class ConnectionPool:
+    """Pool acotado de conexiones pyodbc.
+
+    - Como máximo `max_size` conexiones abiertas (libres + en uso).
+    - Las conexiones libres más de `idle_timeout` segundos se cierran.
+    - Al entregar una conexión que estuvo libre más de `ping_interval` segundos
+      se valida con `SELECT 1`; si falla se descarta y se abre otra.
+    """
+
+    def __init__(self, factory, max_size: int = 10, idle_timeout: int = 300,
+                 checkout_timeout: int = 30, ping_interval: int = 30):
+        self._factory = factory
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.ping_interval = ping_interval
+        self._idle = deque()  # (conexion, ultimo_uso)
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            "creadas": 0,
+            "reutilizadas": 0,
+            "descartadas": 0,
+            "expiradas": 0,
+            "esperas": 0,
+            "timeouts": 0,
+        }
+
+    def _expirar_libres(self) -> list:
+        """Saca del pool las conexiones libres vencidas. Debe llamarse con el lock tomado."""
+        if self.idle_timeout <= 0:
+            return []
+        limite = time.monotonic() - self.idle_timeout
+        vencidas = []
+        # Las más antiguas quedan a la izquierda (se reutiliza por la derecha)
+        while self._idle and self._idle[0][1] < limite:
+            vencidas.append(self._idle.popleft()[0])
+        self._stats["expiradas"] += len(vencidas)
+        return vencidas
+
+    @staticmethod
+    def _cerrar(conexiones) -> None:
+        for raw in conexiones:
+            try:
+                raw.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _esta_viva(raw) -> bool:
+        try:
+            cur = raw.cursor()
+            try:
+                cur.execute("SELECT 1")
+                cur.fetchone()
+            finally:
+                cur.close()
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        deadline = time.monotonic() + self.checkout_timeout
+        raw = None
+        ultimo_uso = None
+        with self._cond:
+            while True:
+                vencidas = self._expirar_libres()
+                if vencidas:
+                    self._cerrar(vencidas)
+                if self._idle:
+                    raw, ultimo_uso = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._in_use < self.max_size:
+                    # Reservamos el cupo; la conexión se abre fuera del lock
+                    self._in_use += 1
+                    break
+                restante = deadline - time.monotonic()
+                if restante <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"No hay conexiones libres (máximo {self.max_size}) después de {self.checkout_timeout}s"
+                    )
+                self._stats["esperas"] += 1
+                self._cond.wait(restante)
+
+        try:
+            if raw is not None and time.monotonic() - ultimo_uso >= self.ping_interval:
+                if not self._esta_viva(raw):
+                    self._cerrar([raw])
+                    raw = None
+                    with self._cond:
+                        self._stats["descartadas"] += 1
+            if raw is None:
+                raw = self._factory()
+                with self._cond:
+                    self._stats["creadas"] += 1
+            else:
+                with self._cond:
+                    self._stats["reutilizadas"] += 1
+            return raw
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, raw, broken: bool = False) -> None:
+        with self._cond:
+            self._in_use -= 1
+            if broken:
+                self._stats["descartadas"] += 1
+            else:
+                self._idle.append((raw, time.monotonic()))
+            self._cond.notify()
+        if broken:
+            self._cerrar([raw])
+
+    def close_all(self) -> None:
+        with self._cond:
+            libres = [raw for raw, _ in self._idle]
+            self._idle.clear()
+        self._cerrar(libres)
+
+    def stats(self) -> dict:
+        with self._cond:
+            datos = dict(self._stats)
+            datos.update({
+                "max": self.max_size,
+                "en_uso": self._in_use,
+                "libres": len(self._idle),
+                "abiertas": self._in_use + len(self._idle),
+            })
+        return datos
+
+
+class TransaccionRevertida(Exception):
+    """Un bloque `with get_connection()` anidado falló y la transacción de la petición se revirtió."""
+
+
+class PooledConnection:
+    """Envoltura de pyodbc.Connection entregada por `get_connection()`.
+
+    Conserva la semántica de `with conn:` de pyodbc (commit si el bloque termina
+    bien, rollback si hay excepción) y al salir devuelve la conexión al pool.
+    Cuando la conexión pertenece a la petición Flask actual (`owned=False`) no se
+    devuelve al salir del bloque: se libera en el teardown de la petición.
+
+    Los bloques `with` anidados dentro de una petición comparten la transacción:
+    solo el más externo hace commit o rollback. Si un bloque interno termina con
+    excepción (o llama a rollback()), la transacción queda marcada para revertirse;
+    el bloque externo hace rollback al salir y, si él terminó bien, lanza
+    TransaccionRevertida para que el error no pase inadvertido. commit() dentro de
+    un bloque anidado no hace nada: se confirma al salir del externo.
+    """
+
+    def __init__(self, pool: ConnectionPool, raw, owned: bool = True):
+        self._pool = pool
+        self._raw = raw
+        self._owned = owned
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        if not self._owned:
+            g._db_nivel = g.get("_db_nivel", 0) + 1
+        return self
+
+    def _anidada(self) -> bool:
+        return not self._owned and g.get("_db_nivel", 0) > 1
+
+    def commit(self):
+        if not self._anidada():
+            self._raw.commit()
+
+    def rollback(self):
+        if self._anidada():
+            g._db_solo_rollback = True
+        else:
+            self._raw.rollback()
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self._owned:
+            return self._salir_compartida(exc_type)
+        broken = False
+        try:
+            if exc_type is None:
+                self._raw.commit()
+            else:
+                self._raw.rollback()
+        except pyodbc.Error:
+            broken = True
+            if exc_type is None:
+                raise
+        finally:
+            self._devolver(broken)
+        return False
+
+    def _salir_compartida(self, exc_type) -> bool:
+        """Salida de un bloque sobre la conexión de la petición (solo el externo termina la transacción)."""
+        nivel = g.get("_db_nivel", 1) - 1
+        g._db_nivel = nivel
+        if nivel > 0:
+            if exc_type is not None:
+                g._db_solo_rollback = True
+            return False
+        revertir = g.pop("_db_solo_rollback", False) or exc_type is not None
+        try:
+            if revertir:
+                self._raw.rollback()
+            else:
+                self._raw.commit()
+        except pyodbc.Error:
+            _descartar_conexion_peticion()
+            if exc_type is None:
+                raise
+            return False
+        if revertir and exc_type is None:
+            raise TransaccionRevertida("Un bloque anidado falló; se revirtió la transacción completa.")
+        return False
+
+    def _devolver(self, broken: bool) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._pool.release(self._raw, broken=broken)
+
+    def close(self) -> None:
+        """Devuelve la conexión al pool descartando cualquier transacción abierta."""
+        if not self._owned or self._closed:
+            return
+        broken = False
+        try:
+            self._raw.rollback()
+        except pyodbc.Error:
+            broken = True
+        self._devolver(broken)
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+_conn_str: Optional[str] = None
+
+
+def _open_raw_connection() -> pyodbc.Connection:
+    global _conn_str
+    if _conn_str is None:
+        _conn_str = _build_connection_string()
+    return pyodbc.connect(_conn_str)
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    _open_raw_connection,
+                    max_size=_env_int("DB_POOL_SIZE", 10),
+                    idle_timeout=_env_int("DB_POOL_IDLE_TIMEOUT", 300),
+                    checkout_timeout=_env_int("DB_POOL_TIMEOUT", 30),
+                    ping_interval=_env_int("DB_POOL_PING_INTERVAL", 30),
+                )
+    return _pool
+
+
+def _descartar_conexion_peticion() -> None:
+    g.pop("_db_nivel", None)
+    g.pop("_db_solo_rollback", None)
+    raw = g.pop("_db_conn", None)
+    if raw is not None:
+        get_pool().release(raw, broken=True)
+
+
+def _liberar_conexion_peticion(exc=None) -> None:
+    """Teardown de Flask: devuelve al pool la conexión usada durante la petición."""
+    g.pop("_db_nivel", None)
+    g.pop("_db_solo_rollback", None)
+    raw = g.pop("_db_conn", None)
+    if raw is None:
+        return
+    broken = False
+    try:
+        raw.rollback()
+    except pyodbc.Error:
+        broken = True
+    get_pool().release(raw, broken=broken)
+
+
+def init_app(app) -> None:
+    app.teardown_appcontext(_liberar_conexion_peticion)
+
+
+def get_connection() -> PooledConnection:
+    """Entrega una conexión del pool.
+
+    Dentro de una petición Flask todas las llamadas comparten la misma conexión
+    (guardada en `g`), por lo que decoradores, context processors, la vista y la
+    auditoría no abren conexiones adicionales; los `with` anidados comparten
+    también la transacción (ver PooledConnection). Fuera de una petición (scripts,
+    hilos en segundo plano) cada llamada toma su propia conexión del pool.
+    """
+    pool = get_pool()
+    if has_app_context():
+        raw = g.get("_db_conn")
+        if raw is None:
+            raw = pool.acquire()
+            g._db_conn = raw
+        return PooledConnection(pool, raw, owned=False)
+    return PooledConnection(pool, pool.acquire(), owned=True)
+
+
+def pool_stats() -> dict:
+    """Métricas del pool (conexiones abiertas, en uso, reutilizadas, esperas, timeouts...)."""
+    return get_pool().stats()
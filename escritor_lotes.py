@@ -0,0 +1,240 @@
+import atexit
+import glob
+import json
+import os
+import queue
+import threading
+import time
+
+
+class EscritorPorLotes:
+    """Base para escribir eventos a SQL Server en segundo plano, por lotes.
+
+    - `encolar()` solo deja el evento en la cola y regresa.
+    - Un hilo vacía la cola llamando `_insertar(lote)` cuando hay `tamano_lote`
+      eventos, cada `intervalo` segundos, o al terminar el proceso (atexit).
+    - Si la base no responde, el lote se agrega al archivo de respaldo (`ruta_spill`,
+      JSON por línea) y se reintenta después de la siguiente escritura exitosa.
+    - Política de desborde: la cola admite `max_cola` eventos. Si está llena, el evento
+      se escribe directo al archivo de respaldo; solo si eso también falla se descarta
+      (contador `descartados`). Nunca se bloquea la petición.
+
+    Las subclases implementan `_insertar(eventos)` (lanza la excepción si la base no
+    está disponible) y, si sus eventos no son JSON directo, `_a_json`/`_de_json`.
+    """
+
+    nombre_hilo = "escritor-lotes"
+
+    def __init__(self, ruta_spill: str, tamano_lote: int = 200, intervalo: float = 2.0, max_cola: int = 10000):
+        self.ruta_spill = ruta_spill
+        self.tamano_lote = max(1, tamano_lote)
+        self.intervalo = intervalo
+        # Segundos sin reintentar el respaldo después de un fallo de la base (si no hay tráfico)
+        self.espera_reintento = 30.0
+        self._proximo_reintento = 0.0
+        self._cola = queue.Queue(maxsize=max(1, max_cola))
+        self._lock_spill = threading.Lock()
+        self._lock_stats = threading.Lock()
+        self._hilo = None
+        self._lock_hilo = threading.Lock()
+        self._detener = threading.Event()
+        self._stats = {
+            "encolados": 0,
+            "escritos": 0,
+            "lotes": 0,
+            "derramados": 0,
+            "recuperados": 0,
+            "rechazados": 0,
+            "descartados": 0,
+            "errores": 0,
+        }
+        directorio = os.path.dirname(ruta_spill)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+    def _contar(self, clave: str, n: int = 1) -> None:
+        with self._lock_stats:
+            self._stats[clave] += n
+
+    # -----------------------------
+    # Productor (petición)
+    # -----------------------------
+    def encolar(self, evento: tuple) -> bool:
+        """Deja el evento para escritura. False solo si no entró ni a la cola ni al respaldo."""
+        self.iniciar()
+        try:
+            self._cola.put_nowait(evento)
+            self._contar("encolados")
+            return True
+        except queue.Full:
+            if self._derramar([evento]):
+                return True
+            self._contar("descartados")
+            return False
+
+    # -----------------------------
+    # Hooks de la subclase
+    # -----------------------------
+    def _insertar(self, eventos: list) -> None:
+        raise NotImplementedError
+
+    def _a_json(self, evento: tuple) -> list:
+        return list(evento)
+
+    def _de_json(self, fila: list) -> tuple:
+        return tuple(fila)
+
+    # -----------------------------
+    # Archivo de respaldo (spill)
+    # -----------------------------
+    def _derramar(self, eventos: list) -> bool:
+        try:
+            with self._lock_spill:
+                with open(self.ruta_spill, "a", encoding="utf-8") as fh:
+                    for ev in eventos:
+                        fh.write(json.dumps(self._a_json(ev), ensure_ascii=False) + "\n")
+            self._contar("derramados", len(eventos))
+            return True
+        except Exception as e:
+            print(f"Error escribiendo respaldo de {self.nombre_hilo}: {e}")
+            return False
+
+    def _reclamar_spill(self):
+        """Toma (renombrando) un archivo de respaldo pendiente; None si no hay."""
+        propio = f"{self.ruta_spill}.{os.getpid()}.reintento"
+        if os.path.exists(propio):
+            return propio
+        # Archivos de otro proceso que terminó sin recuperarlos
+        for ruta in glob.glob(f"{glob.escape(self.ruta_spill)}.*.reintento"):
+            try:
+                os.replace(ruta, propio)
+                return propio
+            except OSError:
+                continue
+        with self._lock_spill:
+            if not os.path.exists(self.ruta_spill):
+                return None
+            try:
+                os.replace(self.ruta_spill, propio)
+            except OSError:
+                return None
+        return propio
+
+    def _recuperar_spill(self) -> None:
+        ruta = self._reclamar_spill()
+        if not ruta:
+            return
+        eventos = []
+        with open(ruta, "r", encoding="utf-8") as fh:
+            for linea in fh:
+                linea = linea.strip()
+                if not linea:
+                    continue
+                try:
+                    eventos.append(self._de_json(json.loads(linea)))
+                except Exception:
+                    self._contar("rechazados")
+        for i in range(0, len(eventos), self.tamano_lote):
+            try:
+                self._insertar(eventos[i:i + self.tamano_lote])
+            except Exception:
+                # Dejar en el archivo solo lo que no se escribió (evita duplicados al reintentar)
+                self._reescribir(ruta, eventos[i:])
+                self._contar("recuperados", i)
+                raise
+        self._contar("recuperados", len(eventos))
+        os.remove(ruta)
+
+    def _reescribir(self, ruta: str, eventos: list) -> None:
+        tmp = f"{ruta}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            for ev in eventos:
+                fh.write(json.dumps(self._a_json(ev), ensure_ascii=False) + "\n")
+        os.replace(tmp, ruta)
+
+    # -----------------------------
+    # Escritura en la base
+    # -----------------------------
+    def _escribir(self, eventos: list) -> None:
+        try:
+            self._insertar(eventos)
+        except Exception as e:
+            print(f"{self.nombre_hilo} sin base de datos, se guarda en respaldo: {e}")
+            self._contar("errores")
+            self._proximo_reintento = time.monotonic() + self.espera_reintento
+            if not self._derramar(eventos):
+                self._contar("descartados", len(eventos))
+            return
+        self._intentar_recuperar()
+
+    def _tomar_lote(self) -> list:
+        """Espera hasta `tamano_lote` eventos o hasta que pase `intervalo` desde el primero."""
+        try:
+            lote = [self._cola.get(timeout=self.intervalo)]
+        except queue.Empty:
+            return []
+        limite = time.monotonic() + self.intervalo
+        while len(lote) < self.tamano_lote:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(self._cola.get(timeout=restante))
+            except queue.Empty:
+                break
+        return lote
+
+    def _vaciar_cola(self) -> list:
+        lote = []
+        while True:
+            try:
+                lote.append(self._cola.get_nowait())
+            except queue.Empty:
+                return lote
+
+    def _bucle(self) -> None:
+        while not self._detener.is_set():
+            lote = self._tomar_lote()
+            if lote:
+                self._escribir(lote)
+            elif time.monotonic() >= self._proximo_reintento:
+                # Sin tráfico: aprovechar para recuperar lo pendiente
+                self._intentar_recuperar()
+
+    def _intentar_recuperar(self) -> None:
+        try:
+            self._recuperar_spill()
+        except Exception as e:
+            print(f"Error recuperando respaldo de {self.nombre_hilo}: {e}")
+            self._contar("errores")
+            self._proximo_reintento = time.monotonic() + self.espera_reintento
+
+    def iniciar(self) -> None:
+        with self._lock_hilo:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._bucle, name=self.nombre_hilo, daemon=True)
+            self._hilo.start()
+            atexit.register(self.cerrar)
+
+    def cerrar(self, timeout: float = 5.0) -> None:
+        """Detiene el hilo y escribe lo que quede en la cola (o lo manda al respaldo)."""
+        self._detener.set()
+        hilo = self._hilo
+        if hilo is not None and hilo.is_alive():
+            hilo.join(timeout)
+        pendientes = self._vaciar_cola()
+        for i in range(0, len(pendientes), self.tamano_lote):
+            self._escribir(pendientes[i:i + self.tamano_lote])
+
+    def stats(self) -> dict:
+        with self._lock_stats:
+            datos = dict(self._stats)
+        datos.update({
+            "en_cola": self._cola.qsize(),
+            "max_cola": self._cola.maxsize,
+            "spill_pendiente": os.path.exists(self.ruta_spill),
+            "hilo_activo": bool(self._hilo and self._hilo.is_alive()),
+        })
+        return datos
@@ -0,0 +1,152 @@
+import csv
+import io
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+
+class SalidaStream(io.RawIOBase):
+    """Destino de escritura que acumula bytes hasta que el generador los entrega."""
+
+    def __init__(self):
+        self._partes = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._partes.append(bytes(b))
+        return len(b)
+
+    def vaciar(self) -> bytes:
+        datos = b"".join(self._partes)
+        self._partes.clear()
+        return datos
+
+
+def leer_por_lotes(cur, tamano_lote: int = 1000):
+    """Recorre el cursor con fetchmany (un lote en memoria a la vez) y lo cierra al final."""
+    try:
+        while True:
+            filas = cur.fetchmany(tamano_lote)
+            if not filas:
+                break
+            yield filas
+    finally:
+        cur.close()
+
+
+# =============================
+# CSV
+# =============================
+def generar_csv(encabezados: list, lotes):
+    """CSV en bytes UTF-8 (con BOM para que Excel respete los acentos), un bloque por lote."""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    output.write("\ufeff")
+    writer.writerow(encabezados)
+    try:
+        for filas in lotes:
+            writer.writerows(filas)
+            yield output.getvalue().encode("utf-8")
+            output.seek(0)
+            output.truncate(0)
+        resto = output.getvalue()
+        if resto:
+            yield resto.encode("utf-8")
+    except Exception as e:
+        # Los encabezados ya se enviaron: solo queda cortar el archivo
+        print(f"Error exportando CSV: {e}")
+    finally:
+        output.close()
+
+
+# =============================
+# XLSX (sin dependencias: Office Open XML mínimo escrito en streaming)
+# =============================
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{hoja}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+# Caracteres de control que XML 1.0 no admite
+_NO_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _celda(valor) -> str:
+    if valor is None:
+        return "<c/>"
+    if isinstance(valor, bool):
+        return f'<c t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float, Decimal)):
+        return f"<c><v>{valor}</v></c>"
+    if isinstance(valor, datetime):
+        valor = valor.strftime("%Y-%m-%d %H:%M:%S")
+    elif isinstance(valor, date):
+        valor = valor.isoformat()
+    texto = escape(_NO_XML.sub("", str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _fila_xml(valores) -> str:
+    return "<row>" + "".join(_celda(v) for v in valores) + "</row>"
+
+
+def generar_xlsx(encabezados: list, lotes, hoja: str = "Datos"):
+    """Libro XLSX de una hoja escrito en streaming: un bloque comprimido por lote de filas."""
+    salida = SalidaStream()
+    with zipfile.ZipFile(salida, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        zf.writestr("_rels/.rels", _RELS)
+        zf.writestr("xl/workbook.xml", _WORKBOOK.format(hoja=escape(hoja, {'"': "&quot;"})))
+        zf.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        with zf.open("xl/worksheets/sheet1.xml", mode="w", force_zip64=True) as hoja_xml:
+            hoja_xml.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            hoja_xml.write(_fila_xml(encabezados).encode("utf-8"))
+            try:
+                for filas in lotes:
+                    hoja_xml.write("".join(_fila_xml(f) for f in filas).encode("utf-8"))
+                    bloque = salida.vaciar()
+                    if bloque:
+                        yield bloque
+            except Exception as e:
+                print(f"Error exportando XLSX: {e}")
+            hoja_xml.write(b"</sheetData></worksheet>")
+    bloque = salida.vaciar()
+    if bloque:
+        yield bloque
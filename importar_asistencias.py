@@ -0,0 +1,296 @@
+import csv
+import itertools
+from datetime import datetime
+
+from asistencia_diaria import recalcular_sql
+
+
+# =============================
+# Formato de los archivos de los relojes
+# =============================
+# Ancho fijo por defecto: "<código 10><fecha y hora 19><tipo 1..>", p. ej.
+# "0000001234" "2025-03-01 07:58:12" "0"
+ANCHO_FIJO_DEFAULT = {"codigo": (0, 10), "fecha_hora": (10, 29), "tipo": (29, 32)}
+
+# Nombres de columna aceptados en la fila de encabezados de un CSV
+_ENCABEZADOS = {
+    "codigo": {"codigo", "codigoempleado", "code", "id", "no", "enrollnumber", "userid", "usuario", "ac-no"},
+    "fecha_hora": {"fechahora", "fecha_hora", "datetime", "timestamp", "time", "checktime", "marca"},
+    "fecha": {"fecha", "date"},
+    "hora": {"hora"},
+    "tipo": {"tipo", "type", "estado", "state", "status", "checktype", "inout"},
+}
+
+# Códigos de tipo de marca que usan los relojes -> Tipo de Asistencias
+TIPOS_MARCA = {
+    "entrada": "entrada", "e": "entrada", "i": "entrada", "in": "entrada", "0": "entrada",
+    "checkin": "entrada", "c/in": "entrada",
+    "salida": "salida", "s": "salida", "o": "salida", "out": "salida", "1": "salida",
+    "checkout": "salida", "c/out": "salida",
+}
+
+_FORMATOS_FECHA = (
+    "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M",
+    "%d-%m-%Y %H:%M:%S", "%d-%m-%Y %H:%M", "%Y%m%d%H%M%S",
+)
+
+
+def parsear_ancho_fijo(texto: str) -> dict:
+    """'codigo:0-10,fecha_hora:10-29,tipo:29-32' -> {"codigo": (0, 10), ...}"""
+    campos = {}
+    for parte in (texto or "").split(","):
+        nombre, _, rango = parte.strip().partition(":")
+        inicio, _, fin = rango.partition("-")
+        campos[nombre.strip()] = (int(inicio), int(fin))
+    if "codigo" not in campos or "fecha_hora" not in campos:
+        raise ValueError("El formato de ancho fijo necesita al menos codigo y fecha_hora")
+    return campos
+
+
+class _LectorFecha:
+    """Convierte textos de fecha; recuerda el último formato que funcionó (suele ser uno por archivo)."""
+
+    def __init__(self):
+        self._formato = None
+
+    def __call__(self, texto: str) -> datetime:
+        texto = texto.strip()
+        if self._formato is None:
+            try:
+                return datetime.fromisoformat(texto)
+            except ValueError:
+                pass
+        else:
+            try:
+                return datetime.strptime(texto, self._formato)
+            except ValueError:
+                pass
+        for formato in _FORMATOS_FECHA:
+            try:
+                valor = datetime.strptime(texto, formato)
+            except ValueError:
+                continue
+            self._formato = formato
+            return valor
+        return datetime.fromisoformat(texto)
+
+
+class MapaEmpleados:
+    """Código del reloj -> IdEmpleado, cargado una sola vez con todos los CodigoEmpleado.
+
+    Los relojes suelen rellenar con ceros ("0001234"): si el código exacto no
+    existe y es numérico, se prueba sin los ceros a la izquierda.
+    """
+
+    def __init__(self, filas):
+        self._ids = {}
+        for id_empleado, codigo in filas:
+            clave = str(codigo).strip().upper()
+            self._ids[clave] = id_empleado
+            if clave.isdigit():
+                self._ids.setdefault(clave.lstrip("0") or "0", id_empleado)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def get(self, codigo: str):
+        clave = codigo.strip().upper()
+        id_empleado = self._ids.get(clave)
+        if id_empleado is None and clave.isdigit():
+            id_empleado = self._ids.get(clave.lstrip("0") or "0")
+        return id_empleado
+
+
+# =============================
+# Lectura (streaming)
+# =============================
+def _filas_csv(lineas):
+    """(numero_linea, texto, dict de campos) de un CSV con o sin encabezados."""
+    lineas = iter(lineas)
+    muestra = list(itertools.islice(lineas, 5))
+    try:
+        dialecto = csv.Sniffer().sniff("".join(muestra), delimiters=",;\t|")
+    except csv.Error:
+        dialecto = csv.excel
+    lector = csv.reader(itertools.chain(muestra, lineas), dialecto)
+
+    columnas = {"codigo": 0, "fecha_hora": 1, "tipo": 2}
+    for numero, fila in enumerate(lector, start=1):
+        if numero == 1:
+            nombres = [c.strip().lower().replace(" ", "") for c in fila]
+            encontradas = {}
+            for campo, sinonimos in _ENCABEZADOS.items():
+                for i, nombre in enumerate(nombres):
+                    if nombre in sinonimos:
+                        encontradas[campo] = i
+                        break
+            if "codigo" in encontradas and ("fecha_hora" in encontradas or "fecha" in encontradas):
+                columnas = encontradas
+                continue
+        if not fila or not any(c.strip() for c in fila):
+            continue
+        campos = {}
+        for campo, i in columnas.items():
+            campos[campo] = fila[i] if i < len(fila) else ""
+        if "fecha_hora" not in campos:
+            campos["fecha_hora"] = f"{campos.get('fecha', '')} {campos.get('hora', '')}"
+        yield numero, ",".join(fila), campos
+
+
+def _filas_ancho_fijo(lineas, layout: dict):
+    for numero, linea in enumerate(lineas, start=1):
+        linea = linea.rstrip("\r\n")
+        if not linea.strip():
+            continue
+        yield numero, linea, {campo: linea[i:f] for campo, (i, f) in layout.items()}
+
+
+def leer_marcas(lineas, formato: str, mapa: MapaEmpleados, rechazar, layout: dict = None):
+    """Genera (IdEmpleado, FechaHora, Tipo) por cada marca válida.
+
+    Las filas inválidas se informan con `rechazar(numero_linea, texto, motivo)`.
+    Si el archivo no trae tipo, se alterna entrada/salida por empleado y día
+    en el orden en que vienen las marcas.
+    """
+    if formato == "fijo":
+        filas = _filas_ancho_fijo(lineas, layout or ANCHO_FIJO_DEFAULT)
+    else:
+        filas = _filas_csv(lineas)
+    leer_fecha = _LectorFecha()
+    ultimo_tipo = {}  # IdEmpleado -> (fecha, tipo) para alternar cuando no hay tipo
+
+    for numero, texto, campos in filas:
+        codigo = (campos.get("codigo") or "").strip()
+        if not codigo:
+            rechazar(numero, texto, "Sin código de empleado")
+            continue
+        id_empleado = mapa.get(codigo)
+        if id_empleado is None:
+            rechazar(numero, texto, f"Código no registrado: {codigo}")
+            continue
+        try:
+            fecha_hora = leer_fecha(campos.get("fecha_hora") or "")
+        except ValueError:
+            rechazar(numero, texto, "Fecha/hora inválida")
+            continue
+
+        tipo_texto = (campos.get("tipo") or "").strip().lower()
+        if tipo_texto:
+            tipo = TIPOS_MARCA.get(tipo_texto)
+            if tipo is None:
+                rechazar(numero, texto, f"Tipo de marca desconocido: {tipo_texto}")
+                continue
+        else:
+            anterior = ultimo_tipo.get(id_empleado)
+            if anterior and anterior[0] == fecha_hora.date() and anterior[1] == "entrada":
+                tipo = "salida"
+            else:
+                tipo = "entrada"
+        ultimo_tipo[id_empleado] = (fecha_hora.date(), tipo)
+        yield id_empleado, fecha_hora.replace(microsecond=0), tipo
+
+
+# =============================
+# Escritura en SQL Server
+# =============================
+_SQL_CREAR_STAGING = """
+    IF OBJECT_ID('tempdb..#ImportAsistencias') IS NOT NULL DROP TABLE #ImportAsistencias;
+    CREATE TABLE #ImportAsistencias (
+        IdEmpleado INT NOT NULL,
+        FechaHora DATETIME2(0) NOT NULL,
+        Tipo VARCHAR(20) NOT NULL
+    );
+"""
+
+# Una sola sentencia quita duplicados del archivo y marcas que ya existen;
+# luego se recalculan en AsistenciaDiaria los días que trae el archivo
+_SQL_PASAR_STAGING = """
+    SET NOCOUNT ON;
+    DECLARE @insertadas INT;
+    INSERT INTO Asistencias (IdEmpleado, FechaHora, Tipo, Observacion)
+    SELECT s.IdEmpleado, s.FechaHora, s.Tipo, ?
+    FROM (SELECT DISTINCT IdEmpleado, FechaHora, Tipo FROM #ImportAsistencias) s
+    WHERE NOT EXISTS (
+        SELECT 1 FROM Asistencias a
+        WHERE a.IdEmpleado = s.IdEmpleado AND a.FechaHora = s.FechaHora AND a.Tipo = s.Tipo
+    );
+    SET @insertadas = @@ROWCOUNT;
+    IF @insertadas > 0
+    BEGIN
+""" + recalcular_sql("SELECT IdEmpleado, CAST(FechaHora AS DATE) AS Fecha FROM #ImportAsistencias") + """
+    END
+    SELECT @insertadas;
+"""
+
+
+def importar_asistencias(conn, lineas, formato: str = "csv", nombre: str = "archivo",
+                         tamano_lote: int = 5000, max_rechazos: int = 1000, layout: dict = None,
+                         progreso=None) -> dict:
+    """Importa un archivo de marcas y devuelve el resumen.
+
+    - Los empleados se cargan una vez en un dict (código -> IdEmpleado).
+    - Las marcas válidas se envían en lotes de `tamano_lote` con fast_executemany a
+      una tabla temporal; luego un INSERT ... SELECT DISTINCT ... WHERE NOT EXISTS
+      las pasa a Asistencias sin duplicados y actualiza AsistenciaDiaria de los
+      días del archivo. Todo en una transacción.
+    - Se guardan hasta `max_rechazos` filas rechazadas (el total se cuenta siempre).
+    - `progreso(hechos, total=None, etapa=None)`, si se indica, se llama tras cada
+      lote con las filas leídas (mismo contrato que los trabajos de ColaTrabajos).
+    """
+    resultado = {"leidas": 0, "validas": 0, "insertadas": 0, "duplicadas": 0,
+                 "rechazadas": 0, "rechazos": []}
+
+    def rechazar(numero, texto, motivo):
+        resultado["rechazadas"] += 1
+        if len(resultado["rechazos"]) < max_rechazos:
+            resultado["rechazos"].append((numero, texto[:200], motivo))
+
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT IdEmpleado, CodigoEmpleado FROM Empleados")
+        mapa = MapaEmpleados(cur.fetchall())
+
+        cur.execute(_SQL_CREAR_STAGING)
+        cur.fast_executemany = True
+        marcas = leer_marcas(lineas, formato, mapa, rechazar, layout)
+        tamano_lote = max(1, tamano_lote)  # con 0, islice no avanzaría y no se importaría nada
+        while True:
+            lote = list(itertools.islice(marcas, tamano_lote))
+            if not lote:
+                break
+            cur.executemany("INSERT INTO #ImportAsistencias (IdEmpleado, FechaHora, Tipo) VALUES (?, ?, ?)", lote)
+            resultado["validas"] += len(lote)
+            if progreso:
+                progreso(resultado["validas"] + resultado["rechazadas"], etapa="Leyendo marcas")
+
+        if resultado["validas"]:
+            if progreso:
+                progreso(resultado["validas"] + resultado["rechazadas"], etapa="Guardando en Asistencias")
+            cur.execute(_SQL_PASAR_STAGING, (f"Importado de {nombre}"[:255],))
+            resultado["insertadas"] = cur.fetchone()[0]
+        resultado["duplicadas"] = resultado["validas"] - resultado["insertadas"]
+        resultado["leidas"] = resultado["validas"] + resultado["rechazadas"]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        try:
+            cur.execute("IF OBJECT_ID('tempdb..#ImportAsistencias') IS NOT NULL DROP TABLE #ImportAsistencias")
+            conn.commit()
+        except Exception:
+            pass
+        cur.close()
+    return resultado
+
+
+def escribir_rechazos(ruta: str, rechazos: list) -> None:
+    with open(ruta, "w", encoding="utf-8", newline="") as fh:
+        escribir_rechazos_csv(fh, rechazos)
+
+
+def escribir_rechazos_csv(fh, rechazos: list) -> None:
+    """Filas rechazadas como CSV en un archivo de texto ya abierto."""
+    writer = csv.writer(fh)
+    writer.writerow(["Linea", "Contenido", "Motivo"])
+    writer.writerows(rechazos)
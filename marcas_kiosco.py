@@ -0,0 +1,144 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import pyodbc
+
+from asistencia_diaria import recalcular_sql
+from db import get_connection
+from escritor_lotes import EscritorPorLotes
+
+
+_ERRORES_CONEXION = (pyodbc.OperationalError, pyodbc.InterfaceError)
+
+_SQL_CREAR_STAGING = """
+    IF OBJECT_ID('tempdb..#MarcasKiosco') IS NOT NULL DROP TABLE #MarcasKiosco;
+    CREATE TABLE #MarcasKiosco (
+        IdEmpleado INT NOT NULL,
+        FechaHora DATETIME2(0) NOT NULL,
+        Tipo VARCHAR(20) NOT NULL,
+        Observacion VARCHAR(255) NULL,
+        Clave VARCHAR(64) NULL
+    );
+"""
+
+# Pasa el lote a Asistencias omitiendo claves ya registradas y marcas idénticas
+# (mismo empleado, fecha/hora y tipo), tanto dentro del lote como en la tabla,
+# y recalcula en AsistenciaDiaria los días del lote
+_SQL_PASAR_STAGING = """
+    SET NOCOUNT ON;
+    DECLARE @insertadas INT;
+    WITH s AS (
+        SELECT IdEmpleado, FechaHora, Tipo, Observacion, Clave,
+               ROW_NUMBER() OVER (PARTITION BY IdEmpleado, FechaHora, Tipo ORDER BY Clave) AS n,
+               ROW_NUMBER() OVER (PARTITION BY Clave ORDER BY FechaHora) AS n_clave
+        FROM #MarcasKiosco
+    )
+    INSERT INTO Asistencias (IdEmpleado, FechaHora, Tipo, Observacion, ClaveIdempotencia)
+    SELECT s.IdEmpleado, s.FechaHora, s.Tipo, s.Observacion, s.Clave
+    FROM s
+    WHERE s.n = 1
+      AND (s.Clave IS NULL OR (s.n_clave = 1 AND NOT EXISTS (
+            SELECT 1 FROM Asistencias a WHERE a.ClaveIdempotencia = s.Clave)))
+      AND NOT EXISTS (
+            SELECT 1 FROM Asistencias a
+            WHERE a.IdEmpleado = s.IdEmpleado AND a.FechaHora = s.FechaHora AND a.Tipo = s.Tipo);
+    SET @insertadas = @@ROWCOUNT;
+    IF @insertadas > 0
+    BEGIN
+""" + recalcular_sql("SELECT IdEmpleado, CAST(FechaHora AS DATE) AS Fecha FROM #MarcasKiosco") + """
+    END
+    DROP TABLE #MarcasKiosco;
+    SELECT @insertadas;
+"""
+
+
+class EscritorMarcas(EscritorPorLotes):
+    """Búfer de marcas de los kioscos: la petición solo encola y el hilo escribe por lotes.
+
+    Evento: (IdEmpleado, FechaHora, Tipo, Observacion, Clave). La clave de
+    idempotencia la genera el kiosco por marca y llega ya separada por kiosco
+    (ver _clave_kiosco en app.py); si reintenta el envío, la marca
+    no se duplica (se recuerdan las claves recientes en memoria y la base tiene
+    un índice único filtrado sobre Asistencias.ClaveIdempotencia).
+    """
+
+    nombre_hilo = "kiosco-writer"
+
+    def __init__(self, *args, claves_recientes: int = 50000, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._claves = OrderedDict()
+        self._max_claves = claves_recientes
+        self._lock_claves = threading.Lock()
+        self._stats["duplicadas"] = 0
+
+    def registrar(self, id_empleado: int, fecha_hora: datetime, tipo: str, observacion=None, clave=None):
+        """Devuelve "aceptada", "duplicada" (clave ya recibida) o "descartada" (cola y respaldo llenos)."""
+        if clave:
+            with self._lock_claves:
+                if clave in self._claves:
+                    self._claves.move_to_end(clave)
+                    self._contar("duplicadas")
+                    return "duplicada"
+                self._claves[clave] = True
+                if len(self._claves) > self._max_claves:
+                    self._claves.popitem(last=False)
+        evento = (id_empleado, fecha_hora.replace(microsecond=0), tipo,
+                  (observacion or "")[:255] or None, clave)
+        if self.encolar(evento):
+            return "aceptada"
+        if clave:
+            # No quedó guardada: que el reintento del kiosco sí se acepte
+            with self._lock_claves:
+                self._claves.pop(clave, None)
+        return "descartada"
+
+    def _a_json(self, evento: tuple) -> list:
+        fila = list(evento)
+        fila[1] = fila[1].isoformat()
+        return fila
+
+    def _de_json(self, fila: list) -> tuple:
+        fila[1] = datetime.fromisoformat(fila[1])
+        return tuple(fila)
+
+    def _pasar(self, cur, eventos: list) -> int:
+        cur.execute(_SQL_CREAR_STAGING)
+        cur.executemany(
+            "INSERT INTO #MarcasKiosco (IdEmpleado, FechaHora, Tipo, Observacion, Clave) VALUES (?, ?, ?, ?, ?)",
+            eventos,
+        )
+        cur.execute(_SQL_PASAR_STAGING)
+        return cur.fetchone()[0]
+
+    def _insertar(self, eventos: list) -> None:
+        """Inserta el lote. Lanza la excepción si la base no está disponible."""
+        with get_connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.fast_executemany = True
+                rechazados = 0
+                try:
+                    escritos = self._pasar(cur, eventos)
+                except _ERRORES_CONEXION:
+                    raise
+                except pyodbc.Error:
+                    # Alguna marca inválida (p. ej. empleado eliminado): una por una
+                    conn.rollback()
+                    escritos = rechazados = 0
+                    for ev in eventos:
+                        try:
+                            escritos += self._pasar(cur, [ev])
+                            conn.commit()
+                        except _ERRORES_CONEXION:
+                            raise
+                        except pyodbc.Error as e:
+                            conn.rollback()
+                            print(f"Marca de kiosco rechazada: {e}")
+                            rechazados += 1
+            finally:
+                cur.close()
+        self._contar("escritos", escritos)
+        self._contar("rechazados", rechazados)
+        self._contar("duplicadas", len(eventos) - escritos - rechazados)
+        self._contar("lotes")
@@ -0,0 +1,15 @@
+-- ======================================================
+-- Índice de cobertura para contar días laborados por periodo
+-- (generar_nomina agrupa Asistencias por empleado en un rango de FechaHora)
+-- ======================================================
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Asistencias_Tipo_FechaHora' AND object_id = OBJECT_ID('Asistencias'))
+BEGIN
+    CREATE NONCLUSTERED INDEX IX_Asistencias_Tipo_FechaHora
+        ON Asistencias (Tipo, FechaHora)
+        INCLUDE (IdEmpleado);
+END
+GO
+
+PRINT 'Índice IX_Asistencias_Tipo_FechaHora creado.';
+GO
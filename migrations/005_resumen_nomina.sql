@@ -0,0 +1,103 @@
+-- ======================================================
+-- Totales materializados de nómina
+-- - RegistrosNomina guarda los totales de cada nómina (prestaciones, deducciones,
+--   IGSS, ISR, bruto, neto y días laborados).
+-- - ResumenPeriodosNomina guarda los totales de cada periodo.
+-- Ambos se actualizan desde la aplicación al generar, recalcular o eliminar
+-- registros (ver _actualizar_resumen_nomina en app.py).
+-- ======================================================
+
+IF COL_LENGTH('RegistrosNomina', 'IGSSMonto') IS NULL
+    ALTER TABLE RegistrosNomina ADD IGSSMonto DECIMAL(12,2) NOT NULL CONSTRAINT DF_RegistrosNomina_IGSSMonto DEFAULT 0;
+IF COL_LENGTH('RegistrosNomina', 'ISRMonto') IS NULL
+    ALTER TABLE RegistrosNomina ADD ISRMonto DECIMAL(12,2) NOT NULL CONSTRAINT DF_RegistrosNomina_ISRMonto DEFAULT 0;
+IF COL_LENGTH('RegistrosNomina', 'SalarioBruto') IS NULL
+    ALTER TABLE RegistrosNomina ADD SalarioBruto DECIMAL(12,2) NOT NULL CONSTRAINT DF_RegistrosNomina_SalarioBruto DEFAULT 0;
+IF COL_LENGTH('RegistrosNomina', 'DiasLaborados') IS NULL
+    ALTER TABLE RegistrosNomina ADD DiasLaborados INT NOT NULL CONSTRAINT DF_RegistrosNomina_DiasLaborados DEFAULT 0;
+GO
+
+IF OBJECT_ID('ResumenPeriodosNomina', 'U') IS NULL
+BEGIN
+    CREATE TABLE ResumenPeriodosNomina (
+        IdPeriodo INT NOT NULL PRIMARY KEY,
+        Registros INT NOT NULL DEFAULT 0,
+        TotalSalarioBase DECIMAL(14,2) NOT NULL DEFAULT 0,
+        TotalPrestaciones DECIMAL(14,2) NOT NULL DEFAULT 0,
+        TotalDeducciones DECIMAL(14,2) NOT NULL DEFAULT 0,
+        TotalIGSS DECIMAL(14,2) NOT NULL DEFAULT 0,
+        TotalISR DECIMAL(14,2) NOT NULL DEFAULT 0,
+        TotalBruto DECIMAL(14,2) NOT NULL DEFAULT 0,
+        TotalNeto DECIMAL(14,2) NOT NULL DEFAULT 0,
+        TotalDiasLaborados INT NOT NULL DEFAULT 0,
+        FechaActualizacion DATETIME2 NOT NULL DEFAULT SYSDATETIME(),
+        FOREIGN KEY (IdPeriodo) REFERENCES PeriodosNomina(IdPeriodo) ON DELETE CASCADE
+    );
+END
+GO
+
+-- Lectura del detalle del periodo sin tocar la tabla base
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_RegistrosNomina_Periodo' AND object_id = OBJECT_ID('RegistrosNomina'))
+BEGIN
+    CREATE NONCLUSTERED INDEX IX_RegistrosNomina_Periodo
+        ON RegistrosNomina (IdPeriodo)
+        INCLUDE (IdEmpleado, SalarioBase, TotalPrestaciones, TotalDeducciones, IGSSMonto, ISRMonto,
+                 SalarioBruto, SalarioNeto, DiasLaborados);
+END
+GO
+
+-- ======================================================
+-- Carga inicial de totales para los registros existentes
+-- ======================================================
+;WITH Totales AS (
+    SELECT i.IdNomina,
+           SUM(CASE WHEN b.Tipo = 'deduccion' THEN i.Monto END) AS TotalDeducciones,
+           SUM(CASE WHEN b.Tipo = 'prestacion' THEN i.Monto END) AS TotalPrestaciones,
+           SUM(CASE WHEN i.TipoItem = 'deduccion' AND b.Nombre = 'IGSS' THEN i.Monto END) AS IGSSMonto,
+           SUM(CASE WHEN i.TipoItem = 'deduccion' AND b.Nombre = 'ISR' THEN i.Monto END) AS ISRMonto
+    FROM ItemsNomina i
+    JOIN BeneficiosDeducciones b ON b.IdBeneficioDeduccion = i.IdBeneficioDeduccion
+    GROUP BY i.IdNomina
+),
+Dias AS (
+    SELECT p.IdPeriodo, a.IdEmpleado, COUNT(DISTINCT CAST(a.FechaHora AS date)) AS DiasLaborados
+    FROM PeriodosNomina p
+    JOIN Asistencias a
+      ON a.FechaHora >= p.FechaInicio
+     AND a.FechaHora < DATEADD(DAY, 1, p.FechaFin)
+    WHERE a.Tipo = 'entrada'
+    GROUP BY p.IdPeriodo, a.IdEmpleado
+)
+UPDATE rn
+SET rn.TotalPrestaciones = ISNULL(t.TotalPrestaciones, 0),
+    rn.TotalDeducciones = ISNULL(t.TotalDeducciones, 0),
+    rn.IGSSMonto = ISNULL(t.IGSSMonto, 0),
+    rn.ISRMonto = ISNULL(t.ISRMonto, 0),
+    rn.SalarioBruto = rn.SalarioBase + ISNULL(t.TotalPrestaciones, 0),
+    rn.SalarioNeto = rn.SalarioBase + ISNULL(t.TotalPrestaciones, 0) - ISNULL(t.TotalDeducciones, 0),
+    rn.DiasLaborados = ISNULL(d.DiasLaborados, 0)
+FROM RegistrosNomina rn
+LEFT JOIN Totales t ON t.IdNomina = rn.IdNomina
+LEFT JOIN Dias d ON d.IdPeriodo = rn.IdPeriodo AND d.IdEmpleado = rn.IdEmpleado;
+GO
+
+DELETE FROM ResumenPeriodosNomina;
+INSERT INTO ResumenPeriodosNomina (IdPeriodo, Registros, TotalSalarioBase, TotalPrestaciones, TotalDeducciones,
+                                   TotalIGSS, TotalISR, TotalBruto, TotalNeto, TotalDiasLaborados)
+SELECT p.IdPeriodo,
+       COUNT(rn.IdNomina),
+       ISNULL(SUM(rn.SalarioBase), 0),
+       ISNULL(SUM(rn.TotalPrestaciones), 0),
+       ISNULL(SUM(rn.TotalDeducciones), 0),
+       ISNULL(SUM(rn.IGSSMonto), 0),
+       ISNULL(SUM(rn.ISRMonto), 0),
+       ISNULL(SUM(rn.SalarioBruto), 0),
+       ISNULL(SUM(rn.SalarioNeto), 0),
+       ISNULL(SUM(rn.DiasLaborados), 0)
+FROM PeriodosNomina p
+LEFT JOIN RegistrosNomina rn ON rn.IdPeriodo = p.IdPeriodo
+GROUP BY p.IdPeriodo;
+GO
+
+PRINT 'Totales de nómina materializados (RegistrosNomina + ResumenPeriodosNomina).';
+GO
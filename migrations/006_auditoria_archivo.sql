@@ -0,0 +1,37 @@
+-- ======================================================
+-- Archivo mensual de auditoría
+-- - Auditoria conserva solo los meses recientes (AUDITORIA_RETENCION_MESES).
+-- - `flask --app app auditoria-compactar` mueve los meses anteriores a tablas
+--   AuditoriaArchivo_AAAAMM (comprimidas por página) y las registra aquí.
+-- - La búsqueda de /seguridad/auditoria recorre Auditoria y luego los meses
+--   archivados que caen en el rango filtrado.
+-- ======================================================
+
+IF OBJECT_ID('AuditoriaArchivoMeses', 'U') IS NULL
+BEGIN
+    CREATE TABLE AuditoriaArchivoMeses (
+        Mes INT NOT NULL PRIMARY KEY,          -- AAAAMM
+        Filas INT NOT NULL DEFAULT 0,
+        ArchivadoEn DATETIME2(0) NOT NULL DEFAULT SYSDATETIME()
+    );
+END
+GO
+
+-- La paginación por cursor ordena por (FechaHora DESC, IdLog DESC): con IdLog en la
+-- clave el listado es un seek + TOP, sin ordenar los empates.
+IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Auditoria_FechaHora' AND object_id = OBJECT_ID('Auditoria'))
+   AND NOT EXISTS (
+       SELECT 1 FROM sys.index_columns ic
+       JOIN sys.indexes i ON i.object_id = ic.object_id AND i.index_id = ic.index_id
+       WHERE i.name = 'IX_Auditoria_FechaHora' AND ic.object_id = OBJECT_ID('Auditoria')
+         AND COL_NAME(ic.object_id, ic.column_id) = 'IdLog' AND ic.key_ordinal > 0
+   )
+    DROP INDEX IX_Auditoria_FechaHora ON Auditoria;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Auditoria_FechaHora' AND object_id = OBJECT_ID('Auditoria'))
+    CREATE NONCLUSTERED INDEX IX_Auditoria_FechaHora ON Auditoria (FechaHora DESC, IdLog DESC);
+GO
+
+PRINT 'Archivo de auditoría listo.';
+GO
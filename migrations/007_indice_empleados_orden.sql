@@ -0,0 +1,14 @@
+-- ======================================================
+-- Índice para el listado de empleados paginado por cursor
+-- (orden por defecto: Apellidos, Nombres, IdEmpleado)
+-- ======================================================
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Empleados_Apellidos_Nombres' AND object_id = OBJECT_ID('Empleados'))
+BEGIN
+    CREATE NONCLUSTERED INDEX IX_Empleados_Apellidos_Nombres
+        ON Empleados (Apellidos, Nombres, IdEmpleado);
+END
+GO
+
+PRINT 'Índice IX_Empleados_Apellidos_Nombres creado.';
+GO
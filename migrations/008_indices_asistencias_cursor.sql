@@ -0,0 +1,39 @@
+-- ======================================================
+-- Índices de Asistencias para el listado paginado por cursor
+-- El listado ordena por (FechaHora DESC, IdAsistencia DESC), solo o filtrando por
+-- empleado: con IdAsistencia en la clave cada página es un seek + TOP sin ordenar,
+-- y el tiempo no depende del tamaño de la tabla.
+-- ======================================================
+
+IF NOT EXISTS (
+    SELECT 1 FROM sys.index_columns ic
+    JOIN sys.indexes i ON i.object_id = ic.object_id AND i.index_id = ic.index_id
+    WHERE i.name = 'IX_Asistencias_FechaHora' AND ic.object_id = OBJECT_ID('Asistencias')
+      AND COL_NAME(ic.object_id, ic.column_id) = 'IdAsistencia' AND ic.key_ordinal > 0
+)
+BEGIN
+    IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Asistencias_FechaHora' AND object_id = OBJECT_ID('Asistencias'))
+        DROP INDEX IX_Asistencias_FechaHora ON Asistencias;
+    CREATE NONCLUSTERED INDEX IX_Asistencias_FechaHora
+        ON Asistencias (FechaHora DESC, IdAsistencia DESC)
+        INCLUDE (IdEmpleado, Tipo);
+END
+GO
+
+IF NOT EXISTS (
+    SELECT 1 FROM sys.index_columns ic
+    JOIN sys.indexes i ON i.object_id = ic.object_id AND i.index_id = ic.index_id
+    WHERE i.name = 'IX_Asistencias_IdEmpleado' AND ic.object_id = OBJECT_ID('Asistencias')
+      AND COL_NAME(ic.object_id, ic.column_id) = 'FechaHora' AND ic.key_ordinal > 0
+)
+BEGIN
+    IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Asistencias_IdEmpleado' AND object_id = OBJECT_ID('Asistencias'))
+        DROP INDEX IX_Asistencias_IdEmpleado ON Asistencias;
+    CREATE NONCLUSTERED INDEX IX_Asistencias_IdEmpleado
+        ON Asistencias (IdEmpleado, FechaHora DESC, IdAsistencia DESC)
+        INCLUDE (Tipo);
+END
+GO
+
+PRINT 'Índices de Asistencias para paginación por cursor listos.';
+GO
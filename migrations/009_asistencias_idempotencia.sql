@@ -0,0 +1,23 @@
+-- ======================================================
+-- Clave de idempotencia de las marcas enviadas por kioscos
+-- (POST /api/asistencia/marcas). El kiosco genera una clave por marca;
+-- si reintenta el envío, la misma clave no se inserta dos veces.
+-- La aplicación no guarda la clave tal cual sino un SHA-256 de
+-- (token del kiosco, dispositivo, clave), así el índice único no mezcla
+-- claves iguales generadas por kioscos distintos.
+-- ======================================================
+
+IF COL_LENGTH('Asistencias', 'ClaveIdempotencia') IS NULL
+    ALTER TABLE Asistencias ADD ClaveIdempotencia VARCHAR(64) NULL;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_Asistencias_ClaveIdempotencia' AND object_id = OBJECT_ID('Asistencias'))
+BEGIN
+    CREATE UNIQUE NONCLUSTERED INDEX UX_Asistencias_ClaveIdempotencia
+        ON Asistencias (ClaveIdempotencia)
+        WHERE ClaveIdempotencia IS NOT NULL;
+END
+GO
+
+PRINT 'Clave de idempotencia de Asistencias lista.';
+GO
@@ -0,0 +1,69 @@
+-- ======================================================
+-- Resumen diario de asistencia
+-- Una fila por empleado y día con marcas (primera entrada, última salida y
+-- conteos). Nómina y dashboard cuentan días laborados sobre esta tabla en vez de
+-- COUNT(DISTINCT CAST(FechaHora AS DATE)) sobre Asistencias.
+-- La mantiene la aplicación al insertar marcas (ver asistencia_diaria.py);
+-- para revisarla o reconstruirla:
+--   flask --app app asistencia-diaria-verificar [--corregir]
+--   flask --app app asistencia-diaria-backfill [--desde AAAA-MM-DD --hasta AAAA-MM-DD]
+-- ======================================================
+
+IF OBJECT_ID('AsistenciaDiaria', 'U') IS NULL
+BEGIN
+    CREATE TABLE AsistenciaDiaria (
+        IdEmpleado INT NOT NULL,
+        Fecha DATE NOT NULL,
+        PrimeraEntrada DATETIME2 NULL,
+        UltimaSalida DATETIME2 NULL,
+        Entradas INT NOT NULL DEFAULT 0,
+        Salidas INT NOT NULL DEFAULT 0,
+        Marcas INT NOT NULL DEFAULT 0,
+        CONSTRAINT PK_AsistenciaDiaria PRIMARY KEY (IdEmpleado, Fecha),
+        FOREIGN KEY (IdEmpleado) REFERENCES Empleados(IdEmpleado) ON DELETE CASCADE
+    );
+END
+GO
+
+-- Conteos por rango de fechas (dashboard y nómina del periodo)
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_AsistenciaDiaria_Fecha' AND object_id = OBJECT_ID('AsistenciaDiaria'))
+BEGIN
+    CREATE NONCLUSTERED INDEX IX_AsistenciaDiaria_Fecha
+        ON AsistenciaDiaria (Fecha)
+        INCLUDE (IdEmpleado, Entradas);
+END
+GO
+
+-- ======================================================
+-- Carga inicial desde Asistencias (por meses, para acotar el log)
+-- ======================================================
+SET NOCOUNT ON;
+DECLARE @inicio DATE, @fin DATE, @ultimo DATE;
+SELECT @inicio = DATEFROMPARTS(YEAR(MIN(FechaHora)), MONTH(MIN(FechaHora)), 1),
+       @ultimo = CAST(MAX(FechaHora) AS DATE)
+FROM Asistencias;
+
+WHILE @inicio IS NOT NULL AND @inicio <= @ultimo
+BEGIN
+    SET @fin = DATEADD(MONTH, 1, @inicio);
+
+    DELETE FROM AsistenciaDiaria WHERE Fecha >= @inicio AND Fecha < @fin;
+
+    INSERT INTO AsistenciaDiaria (IdEmpleado, Fecha, PrimeraEntrada, UltimaSalida, Entradas, Salidas, Marcas)
+    SELECT a.IdEmpleado,
+           CAST(a.FechaHora AS DATE),
+           MIN(CASE WHEN a.Tipo = 'entrada' THEN a.FechaHora END),
+           MAX(CASE WHEN a.Tipo = 'salida' THEN a.FechaHora END),
+           COUNT(CASE WHEN a.Tipo = 'entrada' THEN 1 END),
+           COUNT(CASE WHEN a.Tipo = 'salida' THEN 1 END),
+           COUNT(*)
+    FROM Asistencias a
+    WHERE a.FechaHora >= @inicio AND a.FechaHora < @fin
+    GROUP BY a.IdEmpleado, CAST(a.FechaHora AS DATE);
+
+    SET @inicio = @fin;
+END
+GO
+
+PRINT 'Resumen diario de asistencia (AsistenciaDiaria) listo.';
+GO
@@ -0,0 +1,49 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+
+def condicion_keyset(columnas: list, descendente: bool = False) -> tuple:
+    """WHERE que continúa después de una fila para ORDER BY columnas (todas en el mismo sentido).
+
+    Devuelve (sql, indices): `indices` dice qué valor del cursor va en cada `?`.
+    Para (a, b, c) ascendente:  a > ? OR (a = ? AND b > ?) OR (a = ? AND b = ? AND c > ?)
+    """
+    op = "<" if descendente else ">"
+    partes, indices = [], []
+    for i, col in enumerate(columnas):
+        iguales = [f"{c} = ?" for c in columnas[:i]]
+        partes.append("(" + " AND ".join(iguales + [f"{col} {op} ?"]) + ")")
+        indices.extend(list(range(i)) + [i])
+    return "(" + " OR ".join(partes) + ")", indices
+
+
+def _valor_json(v):
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return str(v)
+    return v
+
+
+def codificar_cursor(valores) -> str:
+    """Valores de la clave de orden de una fila -> texto seguro para el querystring."""
+    texto = json.dumps([_valor_json(v) for v in valores], separators=(",", ":"))
+    return base64.urlsafe_b64encode(texto.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(texto: str, cantidad: int):
+    """Inverso de codificar_cursor; None si el cursor no es válido para `cantidad` columnas."""
+    if not texto:
+        return None
+    try:
+        relleno = "=" * (-len(texto) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(texto + relleno).decode("utf-8"))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(valores, list) or len(valores) != cantidad:
+        return None
+    if any(isinstance(v, (list, dict)) for v in valores):
+        return None
+    return valores
@@ -0,0 +1,202 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+# =============================
+# Backends de versión (invalidación)
+# =============================
+class VersionMemoria:
+    """Contador de versión dentro del proceso (un solo worker)."""
+
+    def __init__(self):
+        self._valor = 0
+        self._lock = threading.Lock()
+
+    def actual(self):
+        return self._valor
+
+    def incrementar(self):
+        """Sube la versión y devuelve (anterior, nueva)."""
+        with self._lock:
+            anterior = self._valor
+            self._valor += 1
+            return anterior, self._valor
+
+
+class VersionArchivo:
+    """Versión compartida entre workers mediante un archivo.
+
+    El contenido es un token opaco que se reemplaza de forma atómica
+    (os.replace). Leer la versión cuesta un stat() mientras el archivo no cambie.
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._mtime = None
+        self._valor = None
+        self._lock = threading.Lock()
+
+    def actual(self):
+        try:
+            mtime = os.stat(self.ruta).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if mtime != self._mtime:
+                with open(self.ruta, "r", encoding="utf-8") as fh:
+                    self._valor = fh.read().strip()
+                self._mtime = mtime
+            return self._valor
+
+    def incrementar(self):
+        """Escribe un token nuevo y devuelve (anterior, nueva).
+
+        `anterior` es el contenido leído justo antes del reemplazo: sin bloqueo
+        entre procesos, otro worker puede escribir en ese intervalo mínimo.
+        """
+        token = f"{time.time_ns()}-{os.getpid()}-{threading.get_ident()}"
+        tmp = f"{self.ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write(token)
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as fh:
+                anterior = fh.read().strip()
+        except FileNotFoundError:
+            anterior = None
+        os.replace(tmp, self.ruta)
+        return anterior, token
+
+
+class VersionSQLite:
+    """Versión compartida entre workers en una tabla SQLite."""
+
+    def __init__(self, ruta: str, clave: str = "permisos"):
+        self.ruta = ruta
+        self.clave = clave
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        with self._conectar() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS VersionCache (Clave TEXT PRIMARY KEY, Valor INTEGER NOT NULL)"
+            )
+
+    def _conectar(self):
+        return sqlite3.connect(self.ruta, timeout=5)
+
+    def actual(self):
+        conn = self._conectar()
+        try:
+            row = conn.execute("SELECT Valor FROM VersionCache WHERE Clave = ?", (self.clave,)).fetchone()
+            return row[0] if row else 0
+        finally:
+            conn.close()
+
+    def incrementar(self):
+        """Sube la versión y devuelve (anterior, nueva), leídas en la misma transacción."""
+        conn = self._conectar()
+        conn.isolation_level = None
+        try:
+            # IMMEDIATE toma el bloqueo de escritura antes de leer: nadie sube la versión en medio
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT Valor FROM VersionCache WHERE Clave = ?", (self.clave,)).fetchone()
+                anterior = row[0] if row else 0
+                conn.execute(
+                    """
+                    INSERT INTO VersionCache (Clave, Valor) VALUES (?, 1)
+                    ON CONFLICT(Clave) DO UPDATE SET Valor = Valor + 1
+                    """,
+                    (self.clave,),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return anterior, anterior + 1
+        finally:
+            conn.close()
+
+
+def crear_backend_version(clave: str = "permisos"):
+    """Crea el backend según PERMISOS_CACHE_BACKEND: memoria (default), archivo o sqlite.
+
+    `clave` separa versiones independientes (p. ej. permisos y el índice de empleados)
+    dentro del mismo backend compartido.
+    """
+    tipo = (os.getenv("PERMISOS_CACHE_BACKEND") or "memoria").strip().lower()
+    if tipo == "archivo":
+        ruta = os.getenv("PERMISOS_CACHE_RUTA", os.path.join("instance", "permisos.version"))
+        if clave != "permisos":
+            ruta = os.path.join(os.path.dirname(ruta), f"{clave}.version")
+        return VersionArchivo(ruta)
+    if tipo == "sqlite":
+        return VersionSQLite(os.getenv("PERMISOS_CACHE_RUTA", os.path.join("instance", "cache.sqlite3")), clave=clave)
+    return VersionMemoria()
+
+
+# =============================
+# Caché de matrices de permisos
+# =============================
+class PermisosCache:
+    """Caché por proceso: IdUsuario -> matriz {modulo: {ver, crear, editar, eliminar}}.
+
+    Cada entrada vence a los `ttl` segundos o cuando cambia la versión del backend,
+    lo que ocurre al llamar `invalidar()` desde cualquier worker.
+    Las matrices devueltas son compartidas: no deben modificarse.
+    """
+
+    def __init__(self, backend, ttl: int = 60, max_usuarios: int = 5000):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_usuarios = max_usuarios
+        self._datos = OrderedDict()  # id_usuario -> (version, expira, matriz)
+        self._lock = threading.Lock()
+        self._stats = {"aciertos": 0, "fallos": 0, "invalidaciones": 0}
+
+    def obtener(self, id_usuario, cargar):
+        try:
+            version = self.backend.actual()
+        except Exception as e:
+            # Sin backend no podemos garantizar frescura: vamos directo a la BD
+            print(f"Error leyendo versión de caché de permisos: {e}")
+            return cargar(id_usuario)
+
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(id_usuario)
+            if entrada and entrada[0] == version and entrada[1] > ahora:
+                self._datos.move_to_end(id_usuario)
+                self._stats["aciertos"] += 1
+                return entrada[2]
+            self._stats["fallos"] += 1
+
+        matriz = cargar(id_usuario)
+        with self._lock:
+            self._datos[id_usuario] = (version, ahora + self.ttl, matriz)
+            self._datos.move_to_end(id_usuario)
+            while len(self._datos) > self.max_usuarios:
+                self._datos.popitem(last=False)
+        return matriz
+
+    def invalidar(self):
+        try:
+            self.backend.incrementar()
+        except Exception as e:
+            print(f"Error incrementando versión de caché de permisos: {e}")
+        with self._lock:
+            self._datos.clear()
+            self._stats["invalidaciones"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            datos = dict(self._stats)
+            datos["usuarios"] = len(self._datos)
+            datos["ttl"] = self.ttl
+        return datos
@@ -0,0 +1,151 @@
+import json
+
+
+ACCIONES = ("ver", "crear", "editar", "eliminar")
+
+# Filas actuales de los usuarios a guardar; UPDLOCK/HOLDLOCK las retiene hasta el
+# commit para que otro guardado simultáneo no calcule su diferencia sobre lo mismo
+_SQL_ACTUALES = """
+    SELECT IdUsuario, IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar
+    FROM PermisosUsuarios WITH (UPDLOCK, HOLDLOCK)
+    WHERE IdUsuario IN (SELECT CAST(value AS INT) FROM OPENJSON(?))
+"""
+
+
+def permisos_formulario(formulario, usuarios, modulos) -> dict:
+    """Permisos marcados en el formulario de la matriz: {(usuario, módulo): (ver, crear, editar, eliminar)}.
+
+    Solo incluye las celdas con "ver" marcado: sin acceso no se guarda fila.
+    """
+    deseados = {}
+    for id_usuario in usuarios:
+        for id_modulo in modulos:
+            if not formulario.get(f"ver_{id_usuario}_{id_modulo}"):
+                continue
+            deseados[(id_usuario, id_modulo)] = (1,) + tuple(
+                1 if formulario.get(f"{accion}_{id_usuario}_{id_modulo}") else 0 for accion in ACCIONES[1:]
+            )
+    return deseados
+
+
+def diferencias(actuales: dict, deseados: dict) -> tuple:
+    """(insertar, actualizar, borrar) para pasar de `actuales` a `deseados` (mismos dicts que permisos_formulario).
+
+    Las listas ya vienen en el orden de parámetros de las sentencias de guardar_permisos.
+    """
+    insertar, actualizar = [], []
+    for clave, valores in deseados.items():
+        anterior = actuales.get(clave)
+        if anterior is None:
+            insertar.append(clave + valores)
+        elif anterior != valores:
+            actualizar.append(valores + clave)
+    borrar = [clave for clave in actuales if clave not in deseados]
+    return insertar, actualizar, borrar
+
+
+def guardar_permisos(conn, usuarios, deseados: dict) -> dict:
+    """Deja los permisos de `usuarios` como `deseados` aplicando solo lo que cambia.
+
+    Lee las filas actuales de esos usuarios, calcula la diferencia y la aplica con
+    un executemany (fast_executemany) por tipo de cambio, todo en una transacción:
+    los demás usuarios no se tocan y la tabla nunca queda vacía para las
+    verificaciones de permisos concurrentes. Las filas de `usuarios` que no están
+    en `deseados` (sin acceso o de módulos inactivos) se borran.
+    Devuelve {"insertados", "actualizados", "borrados"}.
+    """
+    usuarios = sorted(set(usuarios))
+    resultado = {"insertados": 0, "actualizados": 0, "borrados": 0}
+    if not usuarios:
+        return resultado
+
+    cur = conn.cursor()
+    try:
+        cur.execute(_SQL_ACTUALES, (json.dumps(usuarios),))
+        actuales = {(fila[0], fila[1]): tuple(int(v) for v in fila[2:]) for fila in cur.fetchall()}
+        insertar, actualizar, borrar = diferencias(actuales, deseados)
+
+        cur.fast_executemany = True
+        if borrar:
+            cur.executemany("DELETE FROM PermisosUsuarios WHERE IdUsuario = ? AND IdModulo = ?", borrar)
+        if actualizar:
+            cur.executemany("""
+                UPDATE PermisosUsuarios
+                SET TieneAcceso = ?, PuedeCrear = ?, PuedeEditar = ?, PuedeEliminar = ?
+                WHERE IdUsuario = ? AND IdModulo = ?
+            """, actualizar)
+        if insertar:
+            cur.executemany("""
+                INSERT INTO PermisosUsuarios (IdUsuario, IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, insertar)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    resultado.update(insertados=len(insertar), actualizados=len(actualizar), borrados=len(borrar))
+    return resultado
+
+
+# Deja los permisos de cada usuario de la lista igual a la plantilla en una sola
+# sentencia: MERGE de (usuarios × detalle de la plantilla) contra los permisos
+# actuales de esos usuarios. Solo escribe las filas que cambian.
+_SQL_APLICAR_PLANTILLA = """
+    SET NOCOUNT ON;
+    DECLARE @usuarios TABLE (IdUsuario INT PRIMARY KEY);
+    INSERT INTO @usuarios (IdUsuario)
+    SELECT DISTINCT u.IdUsuario
+    FROM OPENJSON(?) j
+    JOIN Usuarios u ON u.IdUsuario = CAST(j.value AS INT);
+
+    WITH Destino AS (
+        SELECT p.IdUsuario, p.IdModulo, p.TieneAcceso, p.PuedeCrear, p.PuedeEditar, p.PuedeEliminar
+        FROM PermisosUsuarios p WITH (UPDLOCK, HOLDLOCK)
+        WHERE p.IdUsuario IN (SELECT IdUsuario FROM @usuarios)
+    ),
+    Origen AS (
+        SELECT u.IdUsuario, d.IdModulo, d.TieneAcceso, d.PuedeCrear, d.PuedeEditar, d.PuedeEliminar
+        FROM @usuarios u
+        CROSS JOIN PlantillasPermisosDetalle d
+        WHERE d.IdPlantilla = ?
+    )
+    MERGE Destino AS t
+    USING Origen AS s ON t.IdUsuario = s.IdUsuario AND t.IdModulo = s.IdModulo
+    WHEN MATCHED AND (t.TieneAcceso <> s.TieneAcceso OR t.PuedeCrear <> s.PuedeCrear
+                      OR t.PuedeEditar <> s.PuedeEditar OR t.PuedeEliminar <> s.PuedeEliminar) THEN
+        UPDATE SET TieneAcceso = s.TieneAcceso, PuedeCrear = s.PuedeCrear,
+                   PuedeEditar = s.PuedeEditar, PuedeEliminar = s.PuedeEliminar
+    WHEN NOT MATCHED BY TARGET THEN
+        INSERT (IdUsuario, IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar)
+        VALUES (s.IdUsuario, s.IdModulo, s.TieneAcceso, s.PuedeCrear, s.PuedeEditar, s.PuedeEliminar)
+    WHEN NOT MATCHED BY SOURCE THEN
+        DELETE;
+
+    SELECT @@ROWCOUNT;
+"""
+
+
+def aplicar_plantilla(conn, id_plantilla: int, usuarios) -> int:
+    """Aplica la plantilla `id_plantilla` a `usuarios` y devuelve cuántas filas cambiaron.
+
+    Cada usuario queda con exactamente los permisos de la plantilla (se quitan los
+    módulos que la plantilla no incluye). Los ids viajan como un solo parámetro
+    JSON, sin el límite de 2100 parámetros; los que no existen se ignoran.
+    """
+    usuarios = sorted(set(int(u) for u in usuarios))
+    if not usuarios:
+        return 0
+    cur = conn.cursor()
+    try:
+        cur.execute(_SQL_APLICAR_PLANTILLA, (json.dumps(usuarios), id_plantilla))
+        cambios = cur.fetchone()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    return cambios
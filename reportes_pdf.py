@@ -0,0 +1,273 @@
+from typing import NamedTuple
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import letter, landscape
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+
+# Filas que se piden a la base en cada fetchmany
+FILAS_LOTE = 1000
+
+# Padding superior + inferior del Frame de SimpleDocTemplate (6pt por lado)
+_PADDING_FRAME = 12
+
+
+# =============================
+# Estilos y plantillas compartidos
+# =============================
+# Se arman una sola vez al importar el módulo (una vez por proceso) y los usan
+# todos los reportes; por eso no se pueden modificar.
+class EstiloParrafoFijo(ParagraphStyle):
+    """ParagraphStyle de solo lectura; copia los atributos de `parent` al crearse."""
+
+    def __init__(self, name, parent=None, **kw):
+        atributos = {k: v for k, v in (parent.__dict__ if parent else {}).items() if k not in ("name", "parent")}
+        atributos.update(kw)
+        super().__init__(name, **atributos)
+        self.__dict__["_fijo"] = True
+
+    def __setattr__(self, nombre, valor):
+        if self.__dict__.get("_fijo"):
+            raise AttributeError(f"El estilo compartido '{self.name}' no se puede modificar")
+        super().__setattr__(nombre, valor)
+
+
+class EstiloTablaFijo(TableStyle):
+    """TableStyle de solo lectura: `add` falla y `getCommands` devuelve una copia."""
+
+    def __init__(self, cmds):
+        super().__init__(cmds)
+        self._cmds = tuple(self._cmds)
+
+    def add(self, *cmd):
+        raise TypeError("El estilo de tabla compartido no se puede modificar")
+
+    def getCommands(self):
+        return list(self._cmds)
+
+
+_ESTILOS_BASE = getSampleStyleSheet()
+
+NORMAL = EstiloParrafoFijo("Normal", _ESTILOS_BASE["Normal"])
+SUBTITULO = EstiloParrafoFijo("Subtitle", _ESTILOS_BASE["Normal"],
+                              fontSize=10, textColor=colors.grey, alignment=TA_CENTER)
+PIE = EstiloParrafoFijo("Footer", _ESTILOS_BASE["Normal"],
+                        fontSize=8, textColor=colors.grey, alignment=TA_CENTER)
+
+
+def _estilo_titulo(color: str) -> EstiloParrafoFijo:
+    return EstiloParrafoFijo("CustomTitle", _ESTILOS_BASE["Heading1"], fontSize=18,
+                             textColor=colors.HexColor(color), spaceAfter=6, alignment=TA_CENTER)
+
+
+def _estilo_listado(color: str, *alineacion) -> EstiloTablaFijo:
+    """Estilo de las tablas de los reportes: encabezado de color y filas alternadas."""
+    return EstiloTablaFijo([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(color)),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        *alineacion,
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('FONTSIZE', (0, 1), (-1, -1), 8),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('TOPPADDING', (0, 1), (-1, -1), 6),
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')])
+    ])
+
+
+class PlantillaReporte(NamedTuple):
+    """Diseño fijo de un reporte de listado."""
+    titulo: str
+    estilo_titulo: EstiloParrafoFijo
+    pagina: tuple
+    encabezado: tuple
+    anchos: tuple
+    estilo_tabla: EstiloTablaFijo
+
+
+MARGENES_REPORTE = {"rightMargin": 30, "leftMargin": 30, "topMargin": 40, "bottomMargin": 30}
+
+REPORTE_EMPLEADOS = PlantillaReporte(
+    "REPORTE DE EMPLEADOS", _estilo_titulo('#1e40af'), landscape(letter),
+    ('Código', 'Nombre Completo', 'Puesto', 'Salario Base', 'Fecha Inicio', 'Estado'),
+    (0.8*inch, 2.2*inch, 1.8*inch, 1.2*inch, 1.2*inch, 1*inch),
+    _estilo_listado('#1e40af', ('ALIGN', (3, 0), (3, -1), 'RIGHT')),
+)
+REPORTE_NOMINA_PERIODO = PlantillaReporte(
+    "REPORTE DE NÓMINA POR PERIODO", _estilo_titulo('#059669'), landscape(letter),
+    ('Código', 'Empleado', 'Salario Base', 'Prestaciones', 'Deducciones', 'Salario Neto'),
+    (0.9*inch, 2.5*inch, 1.3*inch, 1.3*inch, 1.3*inch, 1.3*inch),
+    _estilo_listado('#059669', ('ALIGN', (2, 0), (-1, -1), 'RIGHT')),
+)
+REPORTE_ASISTENCIA = PlantillaReporte(
+    "REPORTE DE ASISTENCIA", _estilo_titulo('#7c3aed'), landscape(letter),
+    ('Código', 'Empleado', 'Fecha', 'Hora', 'Tipo', 'Observación'),
+    (0.8*inch, 2.2*inch, 1*inch, 0.8*inch, 0.9*inch, 2.5*inch),
+    _estilo_listado('#7c3aed', ('ALIGN', (2, 0), (4, -1), 'CENTER')),
+)
+REPORTE_USUARIOS = PlantillaReporte(
+    "REPORTE DE USUARIOS ACTIVOS", _estilo_titulo('#dc2626'), letter,
+    ('Usuario', 'Rol', 'Empleado Asociado', 'Estado', 'Fecha Creación'),
+    (1.5*inch, 1.3*inch, 2*inch, 1*inch, 1.2*inch),
+    _estilo_listado('#dc2626', ('ALIGN', (3, 0), (3, -1), 'CENTER')),
+)
+
+# Fila de totales del reporte de nómina (mismas columnas que el detalle)
+TOTALES_NOMINA = EstiloTablaFijo([
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
+    ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ('TOPPADDING', (0, 0), (-1, -1), 6),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#d1fae5')),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold')
+])
+
+# Comprobante de pago
+MARGENES_COMPROBANTE = {"rightMargin": 72, "leftMargin": 72, "topMargin": 72, "bottomMargin": 18}
+TITULO_COMPROBANTE = _estilo_titulo('#1e40af')
+ANCHOS_COMPROBANTE_EMPLEADO = (1*inch, 1.5*inch, 1*inch, 2.5*inch)
+ANCHOS_COMPROBANTE_DETALLE = (3*inch, 1.5*inch, 1.5*inch)
+ANCHOS_COMPROBANTE_RESUMEN = (4*inch, 2*inch)
+COMPROBANTE_EMPLEADO = EstiloTablaFijo([
+    ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#e5e7eb')),
+    ('BACKGROUND', (2, 0), (2, -1), colors.HexColor('#e5e7eb')),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+])
+COMPROBANTE_DETALLE = EstiloTablaFijo([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('ALIGN', (2, 0), (2, -1), 'RIGHT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('FONTSIZE', (0, 1), (-1, -1), 9),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f3f4f6')])
+])
+COMPROBANTE_RESUMEN = EstiloTablaFijo([
+    ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+    ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, -1), (-1, -1), 12),
+    ('TEXTCOLOR', (0, -1), (-1, -1), colors.HexColor('#1e40af')),
+    ('LINEABOVE', (0, -1), (-1, -1), 2, colors.HexColor('#1e40af')),
+    ('FONTSIZE', (0, 0), (-1, -2), 10),
+])
+
+
+def documento(salida, plantilla: PlantillaReporte) -> SimpleDocTemplate:
+    """SimpleDocTemplate del reporte `plantilla` que escribe en `salida`."""
+    return SimpleDocTemplate(salida, pagesize=plantilla.pagina, **MARGENES_REPORTE)
+
+
+def documento_comprobante(salida) -> SimpleDocTemplate:
+    return SimpleDocTemplate(salida, pagesize=letter, **MARGENES_COMPROBANTE)
+
+
+def encabezado(plantilla: PlantillaReporte, *lineas: str) -> list:
+    """Título del reporte, una línea de subtítulo por cada texto de `lineas` y un espacio."""
+    elementos = [Paragraph(plantilla.titulo, plantilla.estilo_titulo)]
+    elementos.extend(Paragraph(linea, SUBTITULO) for linea in lineas)
+    elementos.append(Spacer(1, 20))
+    return elementos
+
+
+def filas_cursor(cur, convertir, lote: int = FILAS_LOTE):
+    """Recorre el cursor con fetchmany y entrega cada fila ya convertida para la tabla."""
+    while True:
+        filas = cur.fetchmany(lote)
+        if not filas:
+            break
+        for fila in filas:
+            yield convertir(fila)
+
+
+def alto_disponible(doc) -> float:
+    """Alto útil de una página de `doc` (SimpleDocTemplate) para las tablas."""
+    return doc.height - _PADDING_FRAME
+
+
+def alto_flowables(flowables, doc) -> float:
+    """Alto que ocupan `flowables` (título, subtítulos...) al inicio de la primera página."""
+    total = 0
+    for f in flowables:
+        total += f.wrap(doc.width, doc.height)[1] + f.getSpaceBefore() + f.getSpaceAfter()
+    return total
+
+
+def _medir(encabezado, fila, col_widths, estilo) -> tuple:
+    """(alto del encabezado, alto de una fila) con el estilo de la tabla."""
+    altos = []
+    for datos in ([encabezado, fila], [encabezado, fila, fila]):
+        t = Table(datos, colWidths=col_widths)
+        t.setStyle(estilo)
+        altos.append(t.wrap(0, 0)[1])
+    alto_fila = altos[1] - altos[0]
+    return altos[0] - alto_fila, alto_fila
+
+
+def tablas_por_pagina(filas, encabezado, col_widths, estilo, doc, alto_usado: float = 0):
+    """Parte `filas` en Tables de tamaño fijo, una por página, cada una con el encabezado.
+
+    ReportLab parte una tabla grande con un costo que crece más que lineal con las
+    filas; con tablas que ya caben en una página no hay nada que partir y el tiempo
+    y la memoria crecen en proporción a las filas. El alto de fila se mide una vez
+    con la primera fila (las celdas son texto de una línea). `alto_usado` es lo que
+    ocupa el encabezado del reporte en la primera página.
+    """
+    filas = iter(filas)
+    primera = next(filas, None)
+    if primera is None:
+        t = Table([encabezado], colWidths=col_widths, repeatRows=1)
+        t.setStyle(estilo)
+        yield t
+        return
+
+    alto_encabezado, alto_fila = _medir(encabezado, primera, col_widths, estilo)
+    alto_pagina = alto_disponible(doc)
+    por_pagina = max(1, int((alto_pagina - alto_encabezado) // alto_fila))
+    en_primera = int((alto_pagina - alto_usado - alto_encabezado) // alto_fila)
+    cantidad = en_primera if en_primera > 0 else por_pagina
+
+    bloque = [encabezado, primera]
+    for fila in filas:
+        if len(bloque) > cantidad:
+            t = Table(bloque, colWidths=col_widths, repeatRows=1)
+            t.setStyle(estilo)
+            yield t
+            bloque = [encabezado]
+            cantidad = por_pagina
+        bloque.append(fila)
+    t = Table(bloque, colWidths=col_widths, repeatRows=1)
+    t.setStyle(estilo)
+    yield t
+
+
+def construir(doc, elementos: list, progreso=None) -> None:
+    """doc.build(elementos) informando `progreso(página, total, "Generando PDF")` por página.
+
+    El total es la cantidad de tablas (una por página) y es aproximado si el
+    reporte trae otros elementos al final.
+    """
+    if progreso is None:
+        doc.build(elementos)
+        return
+    paginas = max(1, sum(1 for e in elementos if isinstance(e, Table)))
+
+    def al_dibujar_pagina(canvas, documento):
+        progreso(documento.page, max(paginas, documento.page), "Generando PDF")
+
+    doc.build(elementos, onFirstPage=al_dibujar_pagina, onLaterPages=al_dibujar_pagina)
@@ -0,0 +1,135 @@
+"""Comprobantes por segundo con cada renderizador (canvas y platypus).
+
+Uso (desde la raíz del proyecto):
+    python scripts/bench_comprobantes.py --cantidad 500
+
+Renderiza comprobantes sintéticos (con 0 a MAX_ITEMS_CANVAS ítems) en el proceso
+actual con renderizar_comprobante_canvas y renderizar_comprobante_platypus e
+informa comprobantes por segundo de cada uno. Antes verifica que ambos dibujen lo
+mismo: interpreta los operadores de la página (textos con su fuente, color y
+posición; rectángulos de color; líneas con su grosor y color) y los compara con
+una tolerancia de 0.01 pt. Los rellenos blancos se ignoran porque no se ven
+sobre la página. Termina con código 1 si algún comprobante difiere.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reportlab import rl_config  # noqa: E402
+
+import comprobantes_pdf  # noqa: E402
+
+_TOKEN = re.compile(rb"\((?:\\.|[^\\)])*\)|/[^\s/\[\]()<>]+|[-+]?\d*\.?\d+|[A-Za-z*']+")
+
+
+def datos_sinteticos(i: int) -> dict:
+    items = [(f"Concepto {j}", "prestacion" if j % 3 == 0 else "deduccion", 100 + j * 12.5)
+             for j in range(i % (comprobantes_pdf.MAX_ITEMS_CANVAS + 1))]
+    return {
+        "id_nomina": i,
+        "empleado": {"id": i, "codigo": f"EMP{i:05d}", "nombres": "María José", "apellidos": f"Pérez {i}",
+                     "dpi": f"{2500000000000 + i}", "igss": None if i % 4 == 0 else f"{100000 + i}"},
+        "periodo": {"inicio": "01/01/2025", "fin": "15/01/2025"},
+        "nomina": {"salario_base": 5000.0 + i, "prestaciones": 250.0, "deducciones": 300.5, "neto": 4949.5 + i},
+        "items": items,
+    }
+
+
+def operaciones(pdf: bytes) -> list:
+    """Lo que se dibuja en la página: textos, rellenos y líneas en coordenadas absolutas."""
+    fuentes = {m.group(2).decode(): m.group(1).decode()
+               for m in re.finditer(rb"/BaseFont /(\S+) .*?/Name /(\S+)", pdf)}
+    contenido = b"".join(m.group(1) for m in re.finditer(rb"stream\r?\n(.*?)endstream", pdf, re.S)
+                         if b" Tj" in m.group(1))
+    pila, origen = [], (0.0, 0.0)
+    relleno = trazo = None
+    grosor, fuente, texto_x, texto_y, punto = 1.0, None, 0.0, 0.0, None
+    ops, args = [], []
+    for token in _TOKEN.findall(contenido):
+        if token[:1] in b"(/" or re.fullmatch(rb"[-+]?\d*\.?\d+", token):
+            args.append(token)
+            continue
+        op = token.decode()
+        n = [float(a) for a in args if a[:1] not in b"(/"]
+        if op == "q":
+            pila.append((origen, relleno, trazo, grosor))
+        elif op == "Q":
+            origen, relleno, trazo, grosor = pila.pop()
+        elif op == "cm":
+            origen = (origen[0] + n[4], origen[1] + n[5])
+        elif op == "rg":
+            relleno = tuple(round(v, 3) for v in n)
+        elif op == "RG":
+            trazo = tuple(round(v, 3) for v in n)
+        elif op == "w":
+            grosor = n[0]
+        elif op == "Tf":
+            fuente = (fuentes[args[0][1:].decode()], n[0])
+        elif op == "Tm":
+            texto_x, texto_y = origen[0] + n[4], origen[1] + n[5]
+        elif op == "Td":
+            texto_x, texto_y = texto_x + n[0], texto_y + n[1]
+        elif op == "Tj":
+            ops.append(("texto", args[0], fuente, relleno, round(texto_x, 2), round(texto_y, 2)))
+        elif op == "re":
+            x, y, w, h = n
+            rect = (origen[0] + min(x, x + w), origen[1] + min(y, y + h), abs(w), abs(h))
+        elif op in ("f", "f*") and relleno != (1.0, 1.0, 1.0):
+            ops.append(("relleno", relleno) + tuple(round(v, 2) for v in rect))
+        elif op == "m":
+            punto = (origen[0] + n[0], origen[1] + n[1])
+        elif op == "l":
+            fin = (origen[0] + n[0], origen[1] + n[1])
+            extremos = sorted([punto, fin])
+            ops.append(("linea", trazo, grosor) + tuple(round(v, 2) for p in extremos for v in p))
+        args = []
+    return sorted(ops, key=repr)
+
+
+def diferencias(datos: dict) -> list:
+    a = operaciones(comprobantes_pdf.renderizar_comprobante_platypus(datos))
+    b = operaciones(comprobantes_pdf.renderizar_comprobante_canvas(datos))
+    return sorted(set(a) ^ set(b), key=repr) if a != b else []
+
+
+def medir(renderizar, lista: list) -> float:
+    """Comprobantes por segundo."""
+    inicio = time.perf_counter()
+    for datos in lista:
+        renderizar(datos)
+    return len(lista) / (time.perf_counter() - inicio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cantidad", type=int, default=500, help="Comprobantes por renderizador")
+    args = parser.parse_args()
+
+    # Verificación con el PDF sin comprimir para poder leer los operadores
+    rl_config.pageCompression = 0
+    for i in range(comprobantes_pdf.MAX_ITEMS_CANVAS + 1):
+        distinto = diferencias(datos_sinteticos(i))
+        if distinto:
+            print(f"ERROR: el comprobante con {i} ítems difiere entre renderizadores:")
+            for op in distinto[:10]:
+                print(f"  {op}")
+            sys.exit(1)
+    print(f"Ambos renderizadores dibujan lo mismo (0 a {comprobantes_pdf.MAX_ITEMS_CANVAS} ítems).")
+    rl_config.pageCompression = 1
+
+    lista = [datos_sinteticos(i) for i in range(args.cantidad)]
+    por_segundo = {}
+    for nombre in comprobantes_pdf.RENDERIZADORES:
+        renderizar = getattr(comprobantes_pdf, f"renderizar_comprobante_{nombre}")
+        medir(renderizar, lista[:20])  # calentamiento
+        por_segundo[nombre] = medir(renderizar, lista)
+        print(f"{nombre:9s} {por_segundo[nombre]:8.1f} comprobantes/s")
+    print(f"canvas es {por_segundo['canvas'] / por_segundo['platypus']:.1f}x más rápido")
+
+
+if __name__ == "__main__":
+    main()
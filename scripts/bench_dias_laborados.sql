@@ -0,0 +1,119 @@
+-- ========================================
+-- BENCHMARK: días laborados en generar_nomina
+-- ========================================
+-- Compara la consulta anterior (4 subconsultas correlacionadas con CAST sobre FechaHora)
+-- con la nueva (un solo GROUP BY por empleado sobre un rango de fechas).
+--
+-- Requisitos: base de prueba cargada con SEED_100_EMPLEADOS.sql.
+-- El script escala los datos a @Empleados empleados y ~@Dias días de asistencia por
+-- empleado (2 marcas por día => millones de filas) DENTRO DE UNA TRANSACCIÓN y al final
+-- hace ROLLBACK, así que la base queda igual que antes.
+-- NO ejecutar en producción.
+-- ========================================
+
+USE proyecto;
+GO
+
+SET NOCOUNT ON;
+DECLARE @Empleados INT = 10000;   -- empleados totales tras escalar
+DECLARE @Dias INT = 180;          -- días hábiles de asistencia por empleado
+
+BEGIN TRANSACTION;
+
+-- 1) Clonar empleados del seed hasta llegar a @Empleados
+;WITH N AS (
+    SELECT TOP (@Empleados) ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS n
+    FROM sys.all_objects a CROSS JOIN sys.all_objects b
+)
+INSERT INTO Empleados (CodigoEmpleado, Nombres, Apellidos, DocumentoIdentidad, Correo,
+                       FechaContratacion, SalarioBase, IdPuesto)
+SELECT CONCAT('BENCH-', N.n), e.Nombres, e.Apellidos, CONCAT('BENCH', N.n), CONCAT('bench', N.n, '@bench.local'),
+       DATEADD(YEAR, -2, CAST(GETDATE() AS DATE)), e.SalarioBase, e.IdPuesto
+FROM N
+CROSS APPLY (
+    SELECT Nombres, Apellidos, SalarioBase, IdPuesto
+    FROM Empleados
+    ORDER BY IdEmpleado
+    OFFSET ((N.n - 1) % (SELECT COUNT(*) FROM Empleados WHERE CodigoEmpleado NOT LIKE 'BENCH-%')) ROWS
+    FETCH NEXT 1 ROWS ONLY
+) e
+WHERE N.n > (SELECT COUNT(*) FROM Empleados);
+
+-- 2) Generar entrada/salida para cada empleado en los últimos @Dias días
+;WITH D AS (
+    SELECT TOP (@Dias) CAST(DATEADD(DAY, -ROW_NUMBER() OVER (ORDER BY (SELECT NULL)), GETDATE()) AS DATE) AS Dia
+    FROM sys.all_objects
+)
+INSERT INTO Asistencias (IdEmpleado, FechaHora, Tipo, Observacion)
+SELECT e.IdEmpleado, DATEADD(HOUR, t.Hora, CAST(D.Dia AS DATETIME2)), t.Tipo, NULL
+FROM Empleados e
+CROSS JOIN D
+CROSS JOIN (VALUES ('entrada', 8), ('salida', 17)) t(Tipo, Hora)
+WHERE e.CodigoEmpleado LIKE 'BENCH-%';
+
+SELECT (SELECT COUNT(*) FROM Empleados) AS Empleados, (SELECT COUNT(*) FROM Asistencias) AS Asistencias;
+
+DECLARE @ff DATE = CAST(GETDATE() AS DATE);
+DECLARE @fi DATE = DATEADD(DAY, -29, @ff);
+DECLARE @diasPeriodo INT = DATEDIFF(DAY, @fi, @ff) + 1;
+DECLARE @desde DATETIME2 = CAST(@fi AS DATETIME2);
+DECLARE @hasta DATETIME2 = DATEADD(DAY, 1, CAST(@ff AS DATETIME2));
+DECLARE @t0 DATETIME2, @checksumAntes INT, @checksumDespues INT;
+
+DBCC DROPCLEANBUFFERS WITH NO_INFOMSGS;
+SET STATISTICS IO ON;
+SET STATISTICS TIME ON;
+
+-- 3) Consulta anterior
+PRINT '--- ANTES: subconsultas correlacionadas ---';
+SET @t0 = SYSDATETIME();
+SELECT @checksumAntes = CHECKSUM_AGG(CHECKSUM(x.IdEmpleado, x.SalarioCalculado))
+FROM (
+    SELECT e.IdEmpleado,
+           CASE
+             WHEN (SELECT COUNT(DISTINCT CAST(a.FechaHora AS DATE)) FROM Asistencias a
+                   WHERE a.IdEmpleado = e.IdEmpleado AND a.Tipo = 'entrada'
+                     AND CAST(a.FechaHora AS DATE) BETWEEN @fi AND @ff) > 26 THEN e.SalarioBase
+             WHEN @diasPeriodo > 0 THEN ROUND(e.SalarioBase * ISNULL(CAST((
+                   SELECT COUNT(DISTINCT CAST(a.FechaHora AS DATE)) FROM Asistencias a
+                   WHERE a.IdEmpleado = e.IdEmpleado AND a.Tipo = 'entrada'
+                     AND CAST(a.FechaHora AS DATE) BETWEEN @fi AND @ff) AS FLOAT) / @diasPeriodo, 0), 2)
+             ELSE e.SalarioBase
+           END AS SalarioCalculado
+    FROM Empleados e
+    WHERE e.FechaContratacion <= @ff AND (e.FechaFin IS NULL OR e.FechaFin >= @fi)
+) x;
+PRINT CONCAT('Antes: ', DATEDIFF(MILLISECOND, @t0, SYSDATETIME()), ' ms');
+
+DBCC DROPCLEANBUFFERS WITH NO_INFOMSGS;
+
+-- 4) Consulta nueva (la misma que usa generar_nomina)
+PRINT '--- DESPUÉS: agregado único por empleado ---';
+SET @t0 = SYSDATETIME();
+;WITH DiasAsistencia AS (
+    SELECT a.IdEmpleado, COUNT(DISTINCT CAST(a.FechaHora AS DATE)) AS Dias
+    FROM Asistencias a
+    WHERE a.Tipo = 'entrada' AND a.FechaHora >= @desde AND a.FechaHora < @hasta
+    GROUP BY a.IdEmpleado
+)
+SELECT @checksumDespues = CHECKSUM_AGG(CHECKSUM(e.IdEmpleado, s.SalarioCalculado))
+FROM Empleados e
+LEFT JOIN DiasAsistencia da ON da.IdEmpleado = e.IdEmpleado
+CROSS APPLY (
+    SELECT CASE
+             WHEN ISNULL(da.Dias, 0) > 26 THEN e.SalarioBase
+             WHEN @diasPeriodo > 0 THEN ROUND(e.SalarioBase * ISNULL(CAST(ISNULL(da.Dias, 0) AS FLOAT) / @diasPeriodo, 0), 2)
+             ELSE e.SalarioBase
+           END AS SalarioCalculado
+) s
+WHERE e.FechaContratacion <= @ff AND (e.FechaFin IS NULL OR e.FechaFin >= @fi);
+PRINT CONCAT('Después: ', DATEDIFF(MILLISECOND, @t0, SYSDATETIME()), ' ms');
+
+SET STATISTICS TIME OFF;
+SET STATISTICS IO OFF;
+
+SELECT @checksumAntes AS ChecksumAntes, @checksumDespues AS ChecksumDespues,
+       CASE WHEN @checksumAntes = @checksumDespues THEN 'IGUALES' ELSE 'DIFERENTES' END AS Resultado;
+
+ROLLBACK TRANSACTION;
+GO
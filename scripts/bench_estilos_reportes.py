@@ -0,0 +1,184 @@
+"""Costo de preparar cada reporte PDF: estilos armados en cada llamada vs. compartidos.
+
+Uso (desde la raíz del proyecto):
+    python scripts/bench_estilos_reportes.py --repeticiones 2000
+
+Mide solo la preparación (documento, título, subtítulos y estilo de tabla), sin
+datos ni doc.build, para los cuatro reportes de listado y el comprobante:
+"antes" repite lo que hacía cada función en cada llamada (imports locales,
+getSampleStyleSheet(), ParagraphStyle y TableStyle nuevos) y "después" usa los
+objetos de reportes_pdf, armados una vez por proceso. También arma un PDF de
+cada reporte de las dos formas y verifica que los bytes sean idénticos
+(rl_config.invariant). Termina con código 1 si algún PDF difiere.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reportlab import rl_config  # noqa: E402
+from reportlab.platypus import Paragraph, Spacer, Table  # noqa: E402
+
+import reportes_pdf  # noqa: E402
+
+rl_config.invariant = 1
+
+# (plantilla, color, alineación propia de la tabla) de cada reporte de listado
+LISTADOS = {
+    "empleados": (reportes_pdf.REPORTE_EMPLEADOS, '#1e40af', ('ALIGN', (3, 0), (3, -1), 'RIGHT')),
+    "nomina_periodo": (reportes_pdf.REPORTE_NOMINA_PERIODO, '#059669', ('ALIGN', (2, 0), (-1, -1), 'RIGHT')),
+    "asistencia": (reportes_pdf.REPORTE_ASISTENCIA, '#7c3aed', ('ALIGN', (2, 0), (4, -1), 'CENTER')),
+    "usuarios": (reportes_pdf.REPORTE_USUARIOS, '#dc2626', ('ALIGN', (3, 0), (3, -1), 'CENTER')),
+}
+
+
+def preparar_antes(nombre: str, salida):
+    """Preparación de un reporte de listado como se hacía dentro de cada función."""
+    from reportlab.lib.pagesizes import letter, landscape
+    from reportlab.lib import colors
+    from reportlab.lib.units import inch  # noqa: F401
+    from reportlab.platypus import SimpleDocTemplate, TableStyle
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.enums import TA_CENTER
+
+    plantilla, color, alineacion = LISTADOS[nombre]
+    pagina = letter if nombre == "usuarios" else landscape(letter)
+    doc = SimpleDocTemplate(salida, pagesize=pagina, rightMargin=30, leftMargin=30, topMargin=40, bottomMargin=30)
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=18,
+                                 textColor=colors.HexColor(color), spaceAfter=6, alignment=TA_CENTER)
+    subtitle_style = ParagraphStyle('Subtitle', parent=styles['Normal'],
+                                    fontSize=10, textColor=colors.grey, alignment=TA_CENTER)
+    elements = [Paragraph(plantilla.titulo, title_style), Paragraph("Generado: 01/01/2025 08:00", subtitle_style),
+                Spacer(1, 20)]
+    estilo = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(color)),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        alineacion,
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('FONTSIZE', (0, 1), (-1, -1), 8),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('TOPPADDING', (0, 1), (-1, -1), 6),
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')])
+    ])
+    return doc, elements, estilo, styles['Normal']
+
+
+def preparar_despues(nombre: str, salida):
+    plantilla = LISTADOS[nombre][0]
+    doc = reportes_pdf.documento(salida, plantilla)
+    elements = reportes_pdf.encabezado(plantilla, "Generado: 01/01/2025 08:00")
+    return doc, elements, plantilla.estilo_tabla, reportes_pdf.NORMAL
+
+
+def preparar_comprobante_antes(salida):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib import colors
+    from reportlab.platypus import SimpleDocTemplate, TableStyle
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.enums import TA_CENTER
+
+    doc = SimpleDocTemplate(salida, pagesize=letter, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
+    styles = getSampleStyleSheet()
+    estilos = [
+        ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=18,
+                       textColor=colors.HexColor('#1e40af'), alignment=TA_CENTER),
+        ParagraphStyle('CustomSubtitle', parent=styles['Normal'], fontSize=10,
+                       textColor=colors.grey, alignment=TA_CENTER),
+        ParagraphStyle('Footer', parent=styles['Normal'], fontSize=8, textColor=colors.grey, alignment=TA_CENTER),
+        TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#e5e7eb')),
+            ('BACKGROUND', (2, 0), (2, -1), colors.HexColor('#e5e7eb')),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ]),
+        TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('ALIGN', (2, 0), (2, -1), 'RIGHT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f3f4f6')])
+        ]),
+        TableStyle([
+            ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, -1), (-1, -1), 12),
+            ('TEXTCOLOR', (0, -1), (-1, -1), colors.HexColor('#1e40af')),
+            ('LINEABOVE', (0, -1), (-1, -1), 2, colors.HexColor('#1e40af')),
+            ('FONTSIZE', (0, 0), (-1, -2), 10),
+        ]),
+    ]
+    return doc, estilos
+
+
+def preparar_comprobante_despues(salida):
+    return reportes_pdf.documento_comprobante(salida), [
+        reportes_pdf.TITULO_COMPROBANTE, reportes_pdf.SUBTITULO, reportes_pdf.PIE,
+        reportes_pdf.COMPROBANTE_EMPLEADO, reportes_pdf.COMPROBANTE_DETALLE, reportes_pdf.COMPROBANTE_RESUMEN,
+    ]
+
+
+def pdf_listado(preparar, nombre: str) -> bytes:
+    """PDF de muestra (30 filas) del reporte `nombre` con la preparación dada."""
+    salida = io.BytesIO()
+    doc, elements, estilo, normal = preparar(nombre, salida)
+    columnas = len(LISTADOS[nombre][0].encabezado)
+    filas = [[f"Dato {i}-{c}" for c in range(columnas)] for i in range(30)]
+    tabla = Table([list(LISTADOS[nombre][0].encabezado)] + filas, colWidths=LISTADOS[nombre][0].anchos,
+                  repeatRows=1)
+    tabla.setStyle(estilo)
+    elements.extend([tabla, Spacer(1, 20), Paragraph("<b>Total:</b> 30", normal)])
+    doc.build(elements)
+    return salida.getvalue()
+
+
+def medir(funcion, repeticiones: int) -> float:
+    """Microsegundos promedio por llamada."""
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion(io.BytesIO())
+    return (time.perf_counter() - inicio) * 1e6 / repeticiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=2000, help="Llamadas por medición")
+    args = parser.parse_args()
+
+    casos = [(nombre, lambda s, n=nombre: preparar_antes(n, s), lambda s, n=nombre: preparar_despues(n, s))
+             for nombre in LISTADOS]
+    casos.append(("comprobante", preparar_comprobante_antes, preparar_comprobante_despues))
+    for nombre, antes, despues in casos:
+        # Una vuelta de calentamiento para que los imports ya estén cargados
+        medir(antes, 10)
+        medir(despues, 10)
+        t_antes = medir(antes, args.repeticiones)
+        t_despues = medir(despues, args.repeticiones)
+        print(f"{nombre:15s} antes={t_antes:8.1f} µs  después={t_despues:8.1f} µs  "
+              f"({t_antes / t_despues:.1f}x)")
+
+    distintos = [n for n in LISTADOS if pdf_listado(preparar_antes, n) != pdf_listado(preparar_despues, n)]
+    if distintos:
+        print(f"ERROR: el PDF cambia con los estilos compartidos: {', '.join(distintos)}")
+        sys.exit(1)
+    print("PDFs idénticos con ambas formas. OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Memoria pico de la exportación CSV de un periodo (streaming con fetchmany).
+
+Uso (desde la raíz del proyecto):
+    python scripts/bench_periodo_csv.py --sintetico 100000
+    python scripts/bench_periodo_csv.py --periodo 12 --gzip
+
+--sintetico N genera N filas en memoria (no necesita base de datos); --periodo lee
+el periodo real. Termina con código 1 si la memoria pico supera --limite-mb.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, _SQL_DETALLE_PERIODO, _comprimir_gzip, _generar_csv_periodo  # noqa: E402
+from db import get_connection  # noqa: E402
+
+
+class CursorSintetico:
+    """Cursor mínimo (fetchmany/close) que fabrica filas como las del detalle del periodo."""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.entregadas = 0
+
+    def fetchmany(self, n: int):
+        filas = []
+        fin = min(self.total, self.entregadas + n)
+        for i in range(self.entregadas, fin):
+            filas.append((
+                i + 1, f"Apellido{i}", f"Nombre{i}", Decimal("5500.00"), 22, f"IGSS{i:09d}",
+                Decimal("465.65"), Decimal("250.00"), Decimal("265.65"), Decimal("0.00"),
+                Decimal("5750.00"), Decimal("5284.35"), i + 1,
+            ))
+        self.entregadas = fin
+        return filas
+
+    def close(self):
+        pass
+
+
+def medir(cur, comprimir: bool):
+    partes = _generar_csv_periodo(cur)
+    if comprimir:
+        partes = _comprimir_gzip(partes)
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    total_bytes = 0
+    for parte in partes:
+        total_bytes += len(parte)
+    segundos = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return total_bytes, pico, segundos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    origen = parser.add_mutually_exclusive_group(required=True)
+    origen.add_argument("--sintetico", type=int, help="Número de filas generadas en memoria")
+    origen.add_argument("--periodo", type=int, help="IdPeriodo a exportar desde la base de datos")
+    parser.add_argument("--gzip", action="store_true", help="Medir también la compresión gzip")
+    parser.add_argument("--limite-mb", type=float, default=20.0, help="Memoria pico permitida (MB)")
+    args = parser.parse_args()
+
+    if args.sintetico:
+        total_bytes, pico, segundos = medir(CursorSintetico(args.sintetico), args.gzip)
+        filas = args.sintetico
+    else:
+        with app.app_context():
+            conn = get_connection()
+            cur = conn.cursor()
+            cur.execute(_SQL_DETALLE_PERIODO, (args.periodo,))
+            total_bytes, pico, segundos = medir(cur, args.gzip)
+            filas = "?"
+
+    pico_mb = pico / (1024 * 1024)
+    print(f"[{datetime.now():%H:%M:%S}] filas={filas} bytes={total_bytes} "
+          f"pico={pico_mb:.2f} MB tiempo={segundos:.2f}s gzip={'sí' if args.gzip else 'no'}")
+    if pico_mb > args.limite_mb:
+        print(f"ERROR: la memoria pico supera el límite de {args.limite_mb} MB")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
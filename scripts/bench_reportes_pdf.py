@@ -0,0 +1,131 @@
+"""Tiempo y memoria pico de los reportes PDF con tablas por página (reportes_pdf.py).
+
+Uso (desde la raíz del proyecto):
+    python scripts/bench_reportes_pdf.py --filas 100000
+    python scripts/bench_reportes_pdf.py --filas 5000 --tabla-unica
+
+Genera filas sintéticas con el formato del reporte de asistencia (no necesita base
+de datos) y arma el PDF con N/10 y con N filas, cada uno en un proceso aparte para
+medir su memoria pico (RSS). Si el costo es lineal, el cociente de tiempos y el de
+memoria adicional rondan 10. --tabla-unica mide además la forma anterior (una sola
+Table con todas las filas) para comparar; con muchas filas tarda mucho.
+Termina con código 1 si el cociente de tiempo supera --max-cociente.
+Solo Linux/macOS (usa el módulo resource).
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reportlab.platypus import Table  # noqa: E402
+
+from reportes_pdf import (  # noqa: E402
+    REPORTE_ASISTENCIA, alto_flowables, documento, encabezado, filas_cursor, tablas_por_pagina,
+)
+
+
+class CursorSintetico:
+    """Cursor mínimo (fetchmany) con filas como las del reporte de asistencia."""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.entregadas = 0
+        self.inicio = datetime(2025, 1, 1, 7, 0)
+
+    def fetchmany(self, n: int):
+        filas = []
+        fin = min(self.total, self.entregadas + n)
+        for i in range(self.entregadas, fin):
+            momento = self.inicio + timedelta(minutes=7 * i)
+            filas.append((
+                f"EMP{i % 5000:05d}", f"Nombre{i % 5000}", f"Apellido{i % 5000}",
+                momento.strftime("%d/%m/%Y"), momento.strftime("%H:%M"),
+                "entrada" if i % 2 == 0 else "salida", "Marca de reloj" if i % 3 == 0 else "",
+            ))
+        self.entregadas = fin
+        return filas
+
+
+def _fila(asist):
+    return [asist[0], f"{asist[1]} {asist[2]}", asist[3], asist[4], asist[5].capitalize(), asist[6][:30]]
+
+
+def construir(filas: int, tabla_unica: bool = False):
+    """Arma el PDF y devuelve (bytes, segundos)."""
+    inicio = time.perf_counter()
+    buffer = io.BytesIO()
+    plantilla = REPORTE_ASISTENCIA
+    doc = documento(buffer, plantilla)
+    elements = encabezado(plantilla)
+    cur = CursorSintetico(filas)
+    if tabla_unica:
+        datos = [plantilla.encabezado] + list(filas_cursor(cur, _fila))
+        tabla = Table(datos, colWidths=plantilla.anchos, repeatRows=1)
+        tabla.setStyle(plantilla.estilo_tabla)
+        elements.append(tabla)
+    else:
+        elements.extend(tablas_por_pagina(filas_cursor(cur, _fila), plantilla.encabezado, plantilla.anchos,
+                                          plantilla.estilo_tabla, doc, alto_usado=alto_flowables(elements, doc)))
+    doc.build(elements)
+    return len(buffer.getvalue()), time.perf_counter() - inicio
+
+
+def _rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _medir_en_proceso(filas: int, tabla_unica: bool) -> dict:
+    comando = [sys.executable, os.path.abspath(__file__), "--medir", str(filas)]
+    if tabla_unica:
+        comando.append("--tabla-unica")
+    salida = subprocess.run(comando, check=True, capture_output=True, text=True).stdout
+    return json.loads(salida.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=100000, help="Filas del reporte grande")
+    parser.add_argument("--tabla-unica", action="store_true", help="Medir también una sola Table (forma anterior)")
+    parser.add_argument("--max-cociente", type=float, default=15.0,
+                        help="Cociente de tiempo permitido entre N y N/10 filas")
+    parser.add_argument("--medir", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.medir is not None:
+        # Proceso hijo: una sola medición, resultado en JSON
+        base = _rss_mb()
+        tamano, segundos = construir(args.medir, args.tabla_unica)
+        print(json.dumps({"bytes": tamano, "segundos": segundos, "mb": _rss_mb() - base}))
+        return
+
+    resultados = {}
+    for filas in (args.filas // 10, args.filas):
+        modos = [False, True] if args.tabla_unica else [False]
+        for tabla_unica in modos:
+            r = _medir_en_proceso(filas, tabla_unica)
+            nombre = "tabla única" if tabla_unica else "por página"
+            print(f"[{datetime.now():%H:%M:%S}] {nombre}: filas={filas} bytes={r['bytes']} "
+                  f"memoria={r['mb']:.1f} MB tiempo={r['segundos']:.2f}s", flush=True)
+            if not tabla_unica:
+                resultados[filas] = r
+
+    chico, grande = resultados[args.filas // 10], resultados[args.filas]
+    cociente = grande["segundos"] / chico["segundos"] if chico["segundos"] else 0
+    memoria = grande["mb"] / chico["mb"] if chico["mb"] else 0
+    print(f"cociente tiempo={cociente:.1f} memoria={memoria:.1f} (lineal ~ 10)")
+    if cociente > args.max_cociente:
+        print(f"ERROR: el tiempo crece más que lineal (cociente > {args.max_cociente})")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+-- ========================================
+-- VERIFICACIÓN: detalle de periodo (consulta anterior vs. nueva)
+-- ========================================
+-- Compara, para TODOS los periodos, el resultado de la consulta anterior de
+-- _consultar_detalle_periodo (subconsultas correlacionadas) con la actual
+-- (_SQL_DETALLE_PERIODO: totales guardados en RegistrosNomina, sumados por
+-- empleado y periodo; días laborados en vivo sobre AsistenciaDiaria, que debe
+-- estar al día: flask --app app asistencia-diaria-verificar). Solo lectura.
+-- Si ambas devuelven lo mismo, las dos diferencias quedan vacías. Los totales
+-- guardados se refrescan al generar o recalcular el periodo: ejecutar
+-- "Recalcular" antes si hubo cambios después.
+-- Incluye el caso de empleados con más de un registro en el mismo periodo.
+-- ========================================
+
+USE proyecto;
+GO
+
+SET NOCOUNT ON;
+
+IF OBJECT_ID('tempdb..#Anterior') IS NOT NULL DROP TABLE #Anterior;
+IF OBJECT_ID('tempdb..#Nueva') IS NOT NULL DROP TABLE #Nueva;
+
+-- 1) Consulta anterior
+SELECT p.IdPeriodo, e.IdEmpleado, e.Apellidos, e.Nombres, e.SalarioBase,
+       ISNULL((SELECT COUNT(*) FROM (
+                  SELECT DISTINCT CAST(a.FechaHora AS date) AS Dia
+                  FROM Asistencias a
+                  WHERE a.IdEmpleado = e.IdEmpleado AND a.Tipo = 'entrada'
+                    AND CAST(a.FechaHora AS date) BETWEEN p.FechaInicio AND p.FechaFin) d), 0) AS DiasLaborados,
+       e.NumeroIGSS,
+       ISNULL((SELECT SUM(i.Monto) FROM RegistrosNomina rn
+               JOIN ItemsNomina i ON i.IdNomina = rn.IdNomina
+               JOIN BeneficiosDeducciones b ON b.IdBeneficioDeduccion = i.IdBeneficioDeduccion
+               WHERE rn.IdPeriodo = p.IdPeriodo AND rn.IdEmpleado = e.IdEmpleado AND b.Tipo = 'deduccion'), 0) AS TotalDeducciones,
+       ISNULL((SELECT SUM(i.Monto) FROM RegistrosNomina rn
+               JOIN ItemsNomina i ON i.IdNomina = rn.IdNomina
+               JOIN BeneficiosDeducciones b ON b.IdBeneficioDeduccion = i.IdBeneficioDeduccion
+               WHERE rn.IdPeriodo = p.IdPeriodo AND rn.IdEmpleado = e.IdEmpleado AND b.Tipo = 'prestacion'), 0) AS TotalBonificaciones,
+       ISNULL((SELECT SUM(i.Monto) FROM RegistrosNomina rn
+               JOIN ItemsNomina i ON i.IdNomina = rn.IdNomina
+               JOIN BeneficiosDeducciones b ON b.IdBeneficioDeduccion = i.IdBeneficioDeduccion
+               WHERE rn.IdPeriodo = p.IdPeriodo AND rn.IdEmpleado = e.IdEmpleado
+                 AND i.TipoItem = 'deduccion' AND b.Nombre = 'IGSS'), 0) AS IGSSMonto,
+       ISNULL((SELECT SUM(i.Monto) FROM RegistrosNomina rn
+               JOIN ItemsNomina i ON i.IdNomina = rn.IdNomina
+               JOIN BeneficiosDeducciones b ON b.IdBeneficioDeduccion = i.IdBeneficioDeduccion
+               WHERE rn.IdPeriodo = p.IdPeriodo AND rn.IdEmpleado = e.IdEmpleado
+                 AND i.TipoItem = 'deduccion' AND b.Nombre = 'ISR'), 0) AS DescuentoISR,
+       (rn0.SalarioBase + ISNULL((SELECT SUM(i.Monto) FROM RegistrosNomina rn
+               JOIN ItemsNomina i ON i.IdNomina = rn.IdNomina
+               JOIN BeneficiosDeducciones b ON b.IdBeneficioDeduccion = i.IdBeneficioDeduccion
+               WHERE rn.IdPeriodo = p.IdPeriodo AND rn.IdEmpleado = e.IdEmpleado AND b.Tipo = 'prestacion'), 0)) AS SalarioBruto,
+       (rn0.SalarioBase + ISNULL((SELECT SUM(i.Monto) FROM RegistrosNomina rn
+               JOIN ItemsNomina i ON i.IdNomina = rn.IdNomina
+               JOIN BeneficiosDeducciones b ON b.IdBeneficioDeduccion = i.IdBeneficioDeduccion
+               WHERE rn.IdPeriodo = p.IdPeriodo AND rn.IdEmpleado = e.IdEmpleado AND b.Tipo = 'prestacion'), 0)
+        - ISNULL((SELECT SUM(i.Monto) FROM RegistrosNomina rn
+               JOIN ItemsNomina i ON i.IdNomina = rn.IdNomina
+               JOIN BeneficiosDeducciones b ON b.IdBeneficioDeduccion = i.IdBeneficioDeduccion
+               WHERE rn.IdPeriodo = p.IdPeriodo AND rn.IdEmpleado = e.IdEmpleado AND b.Tipo = 'deduccion'), 0)) AS SalarioNeto,
+       (SELECT TOP 1 rn.IdNomina FROM RegistrosNomina rn
+        WHERE rn.IdPeriodo = p.IdPeriodo AND rn.IdEmpleado = e.IdEmpleado
+        ORDER BY rn.IdNomina DESC) AS IdNomina
+INTO #Anterior
+FROM Empleados e
+CROSS JOIN PeriodosNomina p
+LEFT JOIN RegistrosNomina rn0 ON rn0.IdEmpleado = e.IdEmpleado AND rn0.IdPeriodo = p.IdPeriodo
+WHERE e.FechaContratacion <= p.FechaFin
+  AND (e.FechaFin IS NULL OR e.FechaFin >= p.FechaInicio);
+
+-- 2) Consulta nueva (misma forma que app.py, sin filtrar por un solo periodo)
+SELECT p.IdPeriodo, e.IdEmpleado, e.Apellidos, e.Nombres, e.SalarioBase,
+       dias.DiasLaborados AS DiasLaborados,
+       e.NumeroIGSS,
+       ISNULL(r.TotalDeducciones, 0) AS TotalDeducciones,
+       ISNULL(r.TotalPrestaciones, 0) AS TotalBonificaciones,
+       ISNULL(r.IGSSMonto, 0) AS IGSSMonto,
+       ISNULL(r.ISRMonto, 0) AS DescuentoISR,
+       rn0.SalarioBase + ISNULL(r.TotalPrestaciones, 0) AS SalarioBruto,
+       rn0.SalarioBase + ISNULL(r.TotalPrestaciones, 0) - ISNULL(r.TotalDeducciones, 0) AS SalarioNeto,
+       r.IdNomina
+INTO #Nueva
+FROM PeriodosNomina p
+JOIN Empleados e
+  ON e.FechaContratacion <= p.FechaFin
+ AND (e.FechaFin IS NULL OR e.FechaFin >= p.FechaInicio)
+LEFT JOIN RegistrosNomina rn0 ON rn0.IdEmpleado = e.IdEmpleado AND rn0.IdPeriodo = p.IdPeriodo
+LEFT JOIN (
+    SELECT IdPeriodo, IdEmpleado,
+           SUM(TotalDeducciones) AS TotalDeducciones,
+           SUM(TotalPrestaciones) AS TotalPrestaciones,
+           SUM(IGSSMonto) AS IGSSMonto,
+           SUM(ISRMonto) AS ISRMonto,
+           MAX(IdNomina) AS IdNomina
+    FROM RegistrosNomina
+    GROUP BY IdPeriodo, IdEmpleado
+) r ON r.IdEmpleado = e.IdEmpleado AND r.IdPeriodo = p.IdPeriodo
+-- Días laborados en vivo (días con entrada en el resumen diario): incluye marcas
+-- registradas después de generar la nómina y empleados sin registro en el periodo
+OUTER APPLY (
+    SELECT COUNT(*) AS DiasLaborados
+    FROM AsistenciaDiaria d
+    WHERE d.IdEmpleado = e.IdEmpleado
+      AND d.Entradas > 0
+      AND d.Fecha >= p.FechaInicio
+      AND d.Fecha <= p.FechaFin
+) dias;
+
+-- 3) Diferencias (ambas deben devolver 0 filas)
+SELECT 'solo en anterior' AS Origen, * FROM (SELECT * FROM #Anterior EXCEPT SELECT * FROM #Nueva) x;
+SELECT 'solo en nueva' AS Origen, * FROM (SELECT * FROM #Nueva EXCEPT SELECT * FROM #Anterior) x;
+
+SELECT (SELECT COUNT(*) FROM #Anterior) AS FilasAnterior,
+       (SELECT COUNT(*) FROM #Nueva) AS FilasNueva;
+
+-- 4) Empleados con más de un registro de nómina en el mismo periodo: ambas
+--    consultas devuelven una fila por registro con los totales sumados de
+--    todos ellos y el último IdNomina. Se listan las filas de cada consulta
+--    para revisarlas; las diferencias ya aparecen en 3).
+;WITH Multiples AS (
+    SELECT IdPeriodo, IdEmpleado, COUNT(*) AS Registros
+    FROM RegistrosNomina
+    GROUP BY IdPeriodo, IdEmpleado
+    HAVING COUNT(*) > 1
+)
+SELECT 'anterior' AS Origen, m.Registros, a.*
+FROM Multiples m
+JOIN #Anterior a ON a.IdPeriodo = m.IdPeriodo AND a.IdEmpleado = m.IdEmpleado
+UNION ALL
+SELECT 'nueva', m.Registros, n.*
+FROM Multiples m
+JOIN #Nueva n ON n.IdPeriodo = m.IdPeriodo AND n.IdEmpleado = m.IdEmpleado
+ORDER BY 3, 4, 1;
+
+SELECT COUNT(*) AS EmpleadosConVariosRegistros
+FROM (
+    SELECT IdPeriodo, IdEmpleado
+    FROM RegistrosNomina
+    GROUP BY IdPeriodo, IdEmpleado
+    HAVING COUNT(*) > 1
+) x;
+
+DROP TABLE #Anterior;
+DROP TABLE #Nueva;
+GO
@@ -0,0 +1,244 @@
+-- ========================================
+-- VERIFICACIÓN: aplicar plantilla de permisos (MERGE vs. ciclo anterior)
+-- ========================================
+-- Aplica una plantilla a miles de usuarios con la sentencia de
+-- permisos_masivos._SQL_APLICAR_PLANTILLA (un solo MERGE) y compara el
+-- resultado con el ciclo anterior de permisos_aplicar_plantilla (por usuario:
+-- DELETE de sus permisos + INSERT de cada fila de la plantilla), ejecutado
+-- sobre una copia de la tabla. También comprueba que el número de cambios que
+-- devuelve el MERGE (el "cambios" de la respuesta JSON) sea igual a las filas
+-- que realmente cambiaron, y que aplicar la misma plantilla otra vez dé 0.
+--
+-- La lista de usuarios tiene más de 2100 ids (el límite de parámetros de
+-- SQL Server), ids repetidos, ids que no existen y usuarios que ya tienen
+-- módulos fuera de la plantilla. Los usuarios fuera de la lista tienen
+-- permisos que no deben cambiar.
+--
+-- Requisitos: SQL Server 2017+ (STRING_AGG, OPENJSON) y la tabla Modulos con
+-- al menos 4 módulos (migración 003).
+-- Todo corre DENTRO DE UNA TRANSACCIÓN y al final hace ROLLBACK, así que la
+-- base queda igual que antes. NO ejecutar en producción.
+-- ========================================
+
+USE proyecto;
+GO
+
+SET NOCOUNT ON;
+DECLARE @CantidadUsuarios INT = 3000;  -- usuarios de prueba (los últimos 100 quedan fuera de la lista)
+DECLARE @Repetidos INT = 200;          -- ids que se repiten en la lista
+DECLARE @Inexistentes INT = 50;        -- ids que no existen en Usuarios
+
+IF OBJECT_ID('tempdb..#Antes') IS NOT NULL DROP TABLE #Antes;
+IF OBJECT_ID('tempdb..#Ciclo') IS NOT NULL DROP TABLE #Ciclo;
+IF OBJECT_ID('tempdb..#Lista') IS NOT NULL DROP TABLE #Lista;
+
+BEGIN TRANSACTION;
+
+-- 1) Usuarios de prueba
+;WITH N AS (
+    SELECT TOP (@CantidadUsuarios) ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS n
+    FROM sys.all_objects a CROSS JOIN sys.all_objects b
+)
+INSERT INTO Usuarios (NombreUsuario, Correo, ClaveHash, Activo)
+SELECT CONCAT('VERIF-', n), CONCAT('verif', n, '@verif.local'), 'x', 1
+FROM N;
+
+DECLARE @Prueba TABLE (IdUsuario INT PRIMARY KEY, n INT NOT NULL);
+INSERT INTO @Prueba (IdUsuario, n)
+SELECT IdUsuario, CAST(SUBSTRING(NombreUsuario, 7, 10) AS INT)
+FROM Usuarios
+WHERE NombreUsuario LIKE 'VERIF-%';
+
+-- 2) Plantilla: la mitad de los módulos (los de IdModulo par) con permisos variados
+DECLARE @IdPlantilla INT;
+INSERT INTO PlantillasPermisos (Nombre, Descripcion) VALUES ('VERIF plantilla', 'Verificación de aplicar plantilla');
+SET @IdPlantilla = SCOPE_IDENTITY();
+
+INSERT INTO PlantillasPermisosDetalle (IdPlantilla, IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar)
+SELECT @IdPlantilla, IdModulo, 1, IdModulo % 4 / 2, 1, 0
+FROM Modulos
+WHERE IdModulo % 2 = 0;
+
+-- 3) Permisos previos según n % 4:
+--    0 = sin permisos
+--    1 = exactamente la plantilla (no debe cambiar nada)
+--    2 = la plantilla con banderas distintas + módulos fuera de la plantilla
+--    3 = solo módulos fuera de la plantilla
+INSERT INTO PermisosUsuarios (IdUsuario, IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar)
+SELECT u.IdUsuario, d.IdModulo, d.TieneAcceso, d.PuedeCrear,
+       CASE WHEN u.n % 4 = 2 AND d.IdModulo % 4 = 0 THEN 0 ELSE d.PuedeEditar END,
+       CASE WHEN u.n % 4 = 2 THEN 1 ELSE d.PuedeEliminar END
+FROM @Prueba u
+JOIN PlantillasPermisosDetalle d ON d.IdPlantilla = @IdPlantilla
+WHERE u.n % 4 IN (1, 2);
+
+INSERT INTO PermisosUsuarios (IdUsuario, IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar)
+SELECT u.IdUsuario, m.IdModulo, 1, 1, 0, 0
+FROM @Prueba u
+JOIN Modulos m ON m.IdModulo % 2 = 1
+WHERE u.n % 4 IN (2, 3);
+
+-- 4) Lista enviada: los usuarios de prueba menos los últimos 100, @Repetidos
+--    repetidos y @Inexistentes ids que no existen (mayores al máximo)
+DECLARE @Max INT = (SELECT MAX(IdUsuario) FROM Usuarios);
+CREATE TABLE #Lista (Orden INT IDENTITY(1,1) PRIMARY KEY, IdUsuario INT NOT NULL);
+INSERT INTO #Lista (IdUsuario)
+SELECT IdUsuario FROM @Prueba WHERE n <= @CantidadUsuarios - 100 ORDER BY n;
+INSERT INTO #Lista (IdUsuario)
+SELECT IdUsuario FROM @Prueba WHERE n <= @Repetidos ORDER BY n;
+INSERT INTO #Lista (IdUsuario)
+SELECT TOP (@Inexistentes) @Max + ROW_NUMBER() OVER (ORDER BY (SELECT NULL))
+FROM sys.all_objects;
+
+DECLARE @json NVARCHAR(MAX) = (
+    SELECT '[' + STRING_AGG(CAST(IdUsuario AS NVARCHAR(MAX)), ',') WITHIN GROUP (ORDER BY Orden) + ']'
+    FROM #Lista
+);
+
+SELECT COUNT(*) AS IdsEnLista, COUNT(DISTINCT IdUsuario) AS IdsDistintos,
+       SUM(CASE WHEN IdUsuario > @Max THEN 1 ELSE 0 END) AS IdsInexistentes
+FROM #Lista;
+
+SELECT IdUsuario, IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar
+INTO #Antes
+FROM PermisosUsuarios;
+
+-- 5) Ciclo anterior sobre una copia: por cada id de la lista (en orden, con
+--    repetidos) DELETE de sus permisos + INSERT de la plantilla. El código
+--    anterior fallaba por la FK con un id inexistente: aquí se omite.
+SELECT * INTO #Ciclo FROM #Antes;
+
+DECLARE @i INT = 1, @total INT = (SELECT COUNT(*) FROM #Lista), @id INT;
+WHILE @i <= @total
+BEGIN
+    SELECT @id = IdUsuario FROM #Lista WHERE Orden = @i;
+    IF EXISTS (SELECT 1 FROM Usuarios WHERE IdUsuario = @id)
+    BEGIN
+        DELETE FROM #Ciclo WHERE IdUsuario = @id;
+        INSERT INTO #Ciclo (IdUsuario, IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar)
+        SELECT @id, IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar
+        FROM PlantillasPermisosDetalle
+        WHERE IdPlantilla = @IdPlantilla;
+    END
+    SET @i += 1;
+END
+
+-- 6) Sentencia nueva (misma que _SQL_APLICAR_PLANTILLA, con @json y @IdPlantilla
+--    en lugar de los parámetros)
+DECLARE @cambios INT, @cambios_repetido INT;
+DECLARE @usuarios TABLE (IdUsuario INT PRIMARY KEY);
+
+INSERT INTO @usuarios (IdUsuario)
+SELECT DISTINCT u.IdUsuario
+FROM OPENJSON(@json) j
+JOIN Usuarios u ON u.IdUsuario = CAST(j.value AS INT);
+
+WITH Destino AS (
+    SELECT p.IdUsuario, p.IdModulo, p.TieneAcceso, p.PuedeCrear, p.PuedeEditar, p.PuedeEliminar
+    FROM PermisosUsuarios p WITH (UPDLOCK, HOLDLOCK)
+    WHERE p.IdUsuario IN (SELECT IdUsuario FROM @usuarios)
+),
+Origen AS (
+    SELECT u.IdUsuario, d.IdModulo, d.TieneAcceso, d.PuedeCrear, d.PuedeEditar, d.PuedeEliminar
+    FROM @usuarios u
+    CROSS JOIN PlantillasPermisosDetalle d
+    WHERE d.IdPlantilla = @IdPlantilla
+)
+MERGE Destino AS t
+USING Origen AS s ON t.IdUsuario = s.IdUsuario AND t.IdModulo = s.IdModulo
+WHEN MATCHED AND (t.TieneAcceso <> s.TieneAcceso OR t.PuedeCrear <> s.PuedeCrear
+                  OR t.PuedeEditar <> s.PuedeEditar OR t.PuedeEliminar <> s.PuedeEliminar) THEN
+    UPDATE SET TieneAcceso = s.TieneAcceso, PuedeCrear = s.PuedeCrear,
+               PuedeEditar = s.PuedeEditar, PuedeEliminar = s.PuedeEliminar
+WHEN NOT MATCHED BY TARGET THEN
+    INSERT (IdUsuario, IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar)
+    VALUES (s.IdUsuario, s.IdModulo, s.TieneAcceso, s.PuedeCrear, s.PuedeEditar, s.PuedeEliminar)
+WHEN NOT MATCHED BY SOURCE THEN
+    DELETE;
+
+SET @cambios = @@ROWCOUNT;
+
+-- 7) Filas que cambiaron de verdad (antes vs. después)
+DECLARE @insertadas INT, @borradas INT, @actualizadas INT;
+SELECT @insertadas = COUNT(*)
+FROM PermisosUsuarios p
+WHERE NOT EXISTS (SELECT 1 FROM #Antes a WHERE a.IdUsuario = p.IdUsuario AND a.IdModulo = p.IdModulo);
+SELECT @borradas = COUNT(*)
+FROM #Antes a
+WHERE NOT EXISTS (SELECT 1 FROM PermisosUsuarios p WHERE p.IdUsuario = a.IdUsuario AND p.IdModulo = a.IdModulo);
+SELECT @actualizadas = COUNT(*)
+FROM #Antes a
+JOIN PermisosUsuarios p ON p.IdUsuario = a.IdUsuario AND p.IdModulo = a.IdModulo
+WHERE p.TieneAcceso <> a.TieneAcceso OR p.PuedeCrear <> a.PuedeCrear
+   OR p.PuedeEditar <> a.PuedeEditar OR p.PuedeEliminar <> a.PuedeEliminar;
+
+-- 8) Diferencias con el ciclo anterior (ambas deben devolver 0 filas)
+SELECT 'solo en ciclo anterior' AS Origen, * FROM (
+    SELECT IdUsuario, IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar FROM #Ciclo
+    EXCEPT
+    SELECT IdUsuario, IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar FROM PermisosUsuarios
+) x;
+SELECT 'solo en MERGE' AS Origen, * FROM (
+    SELECT IdUsuario, IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar FROM PermisosUsuarios
+    EXCEPT
+    SELECT IdUsuario, IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar FROM #Ciclo
+) x;
+
+DECLARE @diferencias INT = (
+    SELECT COUNT(*) FROM (
+        (SELECT IdUsuario, IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar FROM #Ciclo
+         EXCEPT
+         SELECT IdUsuario, IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar FROM PermisosUsuarios)
+        UNION ALL
+        (SELECT IdUsuario, IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar FROM PermisosUsuarios
+         EXCEPT
+         SELECT IdUsuario, IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar FROM #Ciclo)
+    ) x
+);
+
+-- 9) Aplicar otra vez la misma plantilla: no debe cambiar nada
+WITH Destino AS (
+    SELECT p.IdUsuario, p.IdModulo, p.TieneAcceso, p.PuedeCrear, p.PuedeEditar, p.PuedeEliminar
+    FROM PermisosUsuarios p WITH (UPDLOCK, HOLDLOCK)
+    WHERE p.IdUsuario IN (SELECT IdUsuario FROM @usuarios)
+),
+Origen AS (
+    SELECT u.IdUsuario, d.IdModulo, d.TieneAcceso, d.PuedeCrear, d.PuedeEditar, d.PuedeEliminar
+    FROM @usuarios u
+    CROSS JOIN PlantillasPermisosDetalle d
+    WHERE d.IdPlantilla = @IdPlantilla
+)
+MERGE Destino AS t
+USING Origen AS s ON t.IdUsuario = s.IdUsuario AND t.IdModulo = s.IdModulo
+WHEN MATCHED AND (t.TieneAcceso <> s.TieneAcceso OR t.PuedeCrear <> s.PuedeCrear
+                  OR t.PuedeEditar <> s.PuedeEditar OR t.PuedeEliminar <> s.PuedeEliminar) THEN
+    UPDATE SET TieneAcceso = s.TieneAcceso, PuedeCrear = s.PuedeCrear,
+               PuedeEditar = s.PuedeEditar, PuedeEliminar = s.PuedeEliminar
+WHEN NOT MATCHED BY TARGET THEN
+    INSERT (IdUsuario, IdModulo, TieneAcceso, PuedeCrear, PuedeEditar, PuedeEliminar)
+    VALUES (s.IdUsuario, s.IdModulo, s.TieneAcceso, s.PuedeCrear, s.PuedeEditar, s.PuedeEliminar)
+WHEN NOT MATCHED BY SOURCE THEN
+    DELETE;
+
+SET @cambios_repetido = @@ROWCOUNT;
+
+-- 10) Resumen
+SELECT (SELECT COUNT(*) FROM @usuarios) AS UsuariosAplicados,
+       @cambios AS CambiosDevueltos,
+       @insertadas + @borradas + @actualizadas AS CambiosReales,
+       @insertadas AS Insertadas, @borradas AS Borradas, @actualizadas AS Actualizadas,
+       @diferencias AS DiferenciasConCiclo,
+       @cambios_repetido AS CambiosAlRepetir;
+
+IF @diferencias = 0 AND @cambios = @insertadas + @borradas + @actualizadas AND @cambios_repetido = 0
+    AND (SELECT COUNT(*) FROM @usuarios) = @CantidadUsuarios - 100
+    PRINT 'OK: el MERGE deja los mismos permisos que el ciclo anterior y "cambios" es exacto.';
+ELSE
+    PRINT 'ERROR: revisar las diferencias y el resumen.';
+
+ROLLBACK TRANSACTION;
+
+DROP TABLE #Antes;
+DROP TABLE #Ciclo;
+DROP TABLE #Lista;
+GO
@@ -0,0 +1,121 @@
+import threading
+import time
+from datetime import datetime
+
+
+class Snapshot:
+    """Resultado de una carga costosa guardado en memoria y refrescado en segundo plano.
+
+    - `cargar()` arma los datos (p. ej. varias consultas a SQL Server).
+    - Un hilo daemon vuelve a cargar cada `intervalo` segundos; si falla se conserva
+      el último resultado bueno.
+    - `obtener()` solo lee memoria. Carga en la misma petición únicamente si no hay
+      datos todavía o si tienen más de `max_antiguedad` segundos (hilo caído o
+      la base no responde).
+    - Tras una carga fallida las peticiones siguen sirviendo lo último que haya
+      (aunque esté vencido) y no vuelven a cargar hasta pasado `espera_error`
+      segundos, que se duplica con cada fallo seguido (tope: `max_antiguedad`).
+      Mientras una petición carga, las demás con datos no esperan el lock.
+    """
+
+    def __init__(self, nombre: str, cargar, intervalo: int = 60, max_antiguedad: int = 300,
+                 espera_error: int = 15):
+        self.nombre = nombre
+        self._cargar = cargar
+        self.intervalo = max(1, intervalo)
+        self.max_antiguedad = max(self.intervalo, max_antiguedad)
+        self.espera_error = max(1, espera_error)
+        self._datos = None
+        self._cargado = 0.0  # time.monotonic() de la última carga buena
+        self._actualizado = None  # datetime de la última carga buena
+        self._lock_carga = threading.Lock()
+        self._lock_hilo = threading.Lock()
+        self._lock_stats = threading.Lock()
+        self._hilo = None
+        self._detener = threading.Event()
+        self._fallos_seguidos = 0
+        self._reintentar = 0.0  # time.monotonic() desde el que una petición puede volver a cargar
+        self._stats = {"cargas": 0, "errores": 0, "cargas_en_peticion": 0, "cargas_omitidas": 0,
+                       "ultima_duracion": None, "ultimo_error": None}
+
+    def _contar(self, clave: str, n: int = 1) -> None:
+        with self._lock_stats:
+            self._stats[clave] += n
+
+    def _refrescar(self) -> bool:
+        inicio = time.monotonic()
+        try:
+            datos = self._cargar()
+        except Exception as e:
+            print(f"Error refrescando snapshot {self.nombre}: {e}")
+            self._fallos_seguidos += 1
+            espera = min(self.espera_error * 2 ** (self._fallos_seguidos - 1), self.max_antiguedad)
+            self._reintentar = time.monotonic() + espera
+            with self._lock_stats:
+                self._stats["errores"] += 1
+                self._stats["ultimo_error"] = str(e)
+            return False
+        self._datos = datos
+        self._cargado = time.monotonic()
+        self._actualizado = datetime.now()
+        self._fallos_seguidos = 0
+        self._reintentar = 0.0
+        with self._lock_stats:
+            self._stats["cargas"] += 1
+            self._stats["ultima_duracion"] = round(self._cargado - inicio, 3)
+        return True
+
+    def _vencido(self) -> bool:
+        return self._datos is None or time.monotonic() - self._cargado > self.max_antiguedad
+
+    def _bucle(self) -> None:
+        while not self._detener.is_set():
+            with self._lock_carga:
+                self._refrescar()
+            self._detener.wait(self.intervalo)
+
+    def iniciar(self) -> None:
+        """Arranca el hilo de refresco (una sola vez por proceso)."""
+        with self._lock_hilo:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._bucle, name=f"snapshot-{self.nombre}", daemon=True)
+            self._hilo.start()
+
+    def detener(self) -> None:
+        self._detener.set()
+
+    def obtener(self):
+        """Devuelve (datos, actualizado). `datos` es None si nunca se pudo cargar."""
+        self.iniciar()
+        if not self._vencido():
+            return self._datos, self._actualizado
+        if time.monotonic() < self._reintentar:
+            # La última carga falló hace poco: no insistir contra la base
+            self._contar("cargas_omitidas")
+            return self._datos, self._actualizado
+        # Solo una petición carga; sin datos las demás esperan y reutilizan el
+        # resultado, con datos vencidos los siguen sirviendo mientras tanto
+        if not self._lock_carga.acquire(blocking=self._datos is None):
+            return self._datos, self._actualizado
+        try:
+            if self._vencido() and time.monotonic() >= self._reintentar:
+                self._contar("cargas_en_peticion")
+                self._refrescar()
+        finally:
+            self._lock_carga.release()
+        return self._datos, self._actualizado
+
+    def stats(self) -> dict:
+        with self._lock_stats:
+            datos = dict(self._stats)
+        datos.update({
+            "intervalo": self.intervalo,
+            "max_antiguedad": self.max_antiguedad,
+            "espera_error": self.espera_error,
+            "fallos_seguidos": self._fallos_seguidos,
+            "actualizado": self._actualizado.isoformat(timespec="seconds") if self._actualizado else None,
+            "hilo_activo": bool(self._hilo and self._hilo.is_alive()),
+        })
+        return datos
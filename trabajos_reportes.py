@@ -0,0 +1,301 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+ACTIVOS = ("pendiente", "ejecutando")
+
+
+class LimiteTrabajos(Exception):
+    """El usuario ya tiene el máximo de trabajos en curso."""
+
+
+class ColaTrabajos:
+    """Reportes generados en segundo plano por un pool de hilos.
+
+    - `enviar(tipo, params, usuario)` devuelve el trabajo (dict) sin esperar el render.
+      Si ya hay un trabajo pendiente o en ejecución con el mismo tipo y parámetros,
+      devuelve ese (aunque lo haya pedido otro usuario).
+    - Cada usuario puede tener a lo sumo `max_por_usuario` trabajos en curso.
+    - El estado de cada trabajo vive en `<directorio>/<id>.json` y el resultado en
+      `<directorio>/<id>.dat`, así cualquier worker de la aplicación puede responder
+      el estado y la descarga. La deduplicación usa un archivo `activo_<clave>`
+      creado en exclusiva.
+    - Los resultados y estados se borran `expiracion` segundos después de terminar.
+      Un trabajo en curso que no informa avance en `timeout` segundos (p. ej. el
+      proceso que lo ejecutaba se reinició) se da por fallido.
+
+    Las funciones de cada tipo se registran con `registrar(tipo, funcion)` y se
+    llaman como `funcion(salida, params, progreso)`: escriben el resultado en el
+    archivo binario `salida`, informan avance con `progreso(hechos, total=None,
+    etapa=None)` y devuelven {"nombre": ..., "mimetype": ...} para la descarga
+    (con "resumen" opcional: texto que la página de avance muestra al terminar).
+    """
+
+    def __init__(self, directorio: str, trabajadores: int = 2, max_por_usuario: int = 2,
+                 expiracion: int = 3600, timeout: int = 1800):
+        self.directorio = directorio
+        self.trabajadores = max(1, trabajadores)
+        self.max_por_usuario = max(1, max_por_usuario)
+        self.expiracion = expiracion
+        self.timeout = timeout
+        self._tipos = {}
+        self._executor = None
+        self._lock = threading.Lock()
+        self._ultima_limpieza = 0.0
+        self._stats = {"enviados": 0, "deduplicados": 0, "rechazados": 0, "completados": 0,
+                       "fallidos": 0, "expirados": 0}
+
+    def registrar(self, tipo: str, funcion) -> None:
+        self._tipos[tipo] = funcion
+
+    # -----------------------------
+    # Archivos de estado
+    # -----------------------------
+    def _ruta(self, nombre: str) -> str:
+        return os.path.join(self.directorio, nombre)
+
+    def ruta_resultado(self, id_trabajo: str) -> str:
+        return self._ruta(f"{id_trabajo}.dat")
+
+    def _guardar(self, trabajo: dict) -> None:
+        trabajo["actualizado"] = time.time()
+        temporal = self._ruta(f"{trabajo['id']}.json.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temporal, "w", encoding="utf-8") as fh:
+            json.dump(trabajo, fh, ensure_ascii=False)
+        os.replace(temporal, self._ruta(f"{trabajo['id']}.json"))
+
+    def _leer(self, nombre: str):
+        try:
+            with open(self._ruta(nombre), "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def _vencido(self, trabajo: dict) -> bool:
+        return trabajo["estado"] in ACTIVOS and time.time() - trabajo["actualizado"] > self.timeout
+
+    def estado(self, id_trabajo: str):
+        """Estado del trabajo (dict) o None si no existe o ya expiró."""
+        if not id_trabajo or not id_trabajo.isalnum():
+            return None
+        trabajo = self._leer(f"{id_trabajo}.json")
+        if trabajo and self._vencido(trabajo):
+            trabajo.update(estado="error", error="El trabajo se interrumpió; vuelve a solicitarlo.")
+            self._guardar(trabajo)
+            self._soltar_clave(trabajo)
+        return trabajo
+
+    def listar(self, usuario=None, limite: int = 10) -> list:
+        """Trabajos (de `usuario`, si se indica) del más reciente al más antiguo."""
+        trabajos = []
+        try:
+            nombres = os.listdir(self.directorio)
+        except OSError:
+            return []
+        for nombre in nombres:
+            if nombre.endswith(".json"):
+                trabajo = self.estado(nombre[:-5])
+                if trabajo and (usuario is None or trabajo["usuario"] == usuario):
+                    trabajos.append(trabajo)
+        trabajos.sort(key=lambda t: t["creado"], reverse=True)
+        return trabajos[:limite]
+
+    # -----------------------------
+    # Envío y deduplicación
+    # -----------------------------
+    @staticmethod
+    def clave(tipo: str, params: dict) -> str:
+        texto = json.dumps([tipo, params], sort_keys=True, default=str)
+        return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:32]
+
+    def _tomar_clave(self, clave: str, id_trabajo: str) -> bool:
+        try:
+            fd = os.open(self._ruta(f"activo_{clave}"), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as fh:
+            fh.write(id_trabajo)
+        return True
+
+    def _soltar_clave(self, trabajo: dict) -> None:
+        ruta = self._ruta(f"activo_{trabajo['clave']}")
+        try:
+            with open(ruta, "r") as fh:
+                if fh.read().strip() != trabajo["id"]:
+                    return
+            os.remove(ruta)
+        except OSError:
+            pass
+
+    def _en_curso(self, clave: str):
+        """Trabajo activo con esa clave o None (suelta la marca si quedó huérfana)."""
+        try:
+            with open(self._ruta(f"activo_{clave}"), "r") as fh:
+                id_trabajo = fh.read().strip()
+        except OSError:
+            return None
+        trabajo = self.estado(id_trabajo)
+        if trabajo and trabajo["estado"] in ACTIVOS:
+            return trabajo
+        try:
+            os.remove(self._ruta(f"activo_{clave}"))
+        except OSError:
+            pass
+        return None
+
+    def enviar(self, tipo: str, params: dict, usuario, modulo: str, titulo: str) -> tuple:
+        """Devuelve (trabajo, nuevo). Lanza LimiteTrabajos si el usuario ya tiene el máximo en curso."""
+        if tipo not in self._tipos:
+            raise ValueError(f"Tipo de reporte desconocido: {tipo}")
+        os.makedirs(self.directorio, exist_ok=True)
+        self.limpiar()
+        clave = self.clave(tipo, params)
+        with self._lock:
+            for _ in range(3):
+                existente = self._en_curso(clave)
+                if existente:
+                    self._stats["deduplicados"] += 1
+                    return existente, False
+
+                en_curso = sum(1 for t in self.listar(usuario, limite=1000) if t["estado"] in ACTIVOS)
+                if en_curso >= self.max_por_usuario:
+                    self._stats["rechazados"] += 1
+                    raise LimiteTrabajos(
+                        f"Ya tienes {en_curso} reporte(s) en proceso; espera a que terminen."
+                    )
+
+                trabajo = {
+                    "id": uuid.uuid4().hex, "tipo": tipo, "params": params, "clave": clave,
+                    "usuario": usuario, "modulo": modulo, "titulo": titulo,
+                    "estado": "pendiente", "hechos": 0, "total": None, "etapa": "En cola",
+                    "error": None, "nombre": None, "mimetype": None, "tamano": None,
+                    "creado": time.time(), "terminado": None,
+                }
+                # El estado se escribe antes que la marca: quien vea la marca siempre encuentra el trabajo
+                self._guardar(trabajo)
+                if not self._tomar_clave(clave, trabajo["id"]):
+                    # Otro worker lo registró justo ahora: se reutiliza en la siguiente vuelta
+                    os.remove(self._ruta(f"{trabajo['id']}.json"))
+                    continue
+                self._obtener_executor().submit(self._ejecutar, trabajo)
+                self._stats["enviados"] += 1
+                return trabajo, True
+        raise RuntimeError("No se pudo registrar el trabajo; intenta de nuevo.")
+
+    def _obtener_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.trabajadores, thread_name_prefix="reportes")
+        return self._executor
+
+    # -----------------------------
+    # Ejecución
+    # -----------------------------
+    def _ejecutar(self, trabajo: dict) -> None:
+        ultimo = [0.0]
+
+        def progreso(hechos: int, total: int = None, etapa: str = None):
+            trabajo["hechos"] = hechos
+            if total is not None:
+                trabajo["total"] = total
+            if etapa is not None:
+                trabajo["etapa"] = etapa
+            # Se escribe como mucho una vez por segundo
+            ahora = time.monotonic()
+            if ahora - ultimo[0] >= 1:
+                ultimo[0] = ahora
+                self._guardar(trabajo)
+
+        trabajo.update(estado="ejecutando", etapa="Iniciando")
+        self._guardar(trabajo)
+        ruta = self.ruta_resultado(trabajo["id"])
+        try:
+            with open(ruta, "wb") as salida:
+                info = self._tipos[trabajo["tipo"]](salida, trabajo["params"], progreso)
+            trabajo.update(estado="listo", etapa="Listo", nombre=info["nombre"], mimetype=info["mimetype"],
+                           tamano=os.path.getsize(ruta), resumen=info.get("resumen"))
+            self._stats["completados"] += 1
+        except Exception as e:
+            print(f"Error en trabajo de reporte {trabajo['id']} ({trabajo['tipo']}): {e}")
+            trabajo.update(estado="error", error=str(e))
+            self._stats["fallidos"] += 1
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+        trabajo["terminado"] = time.time()
+        self._guardar(trabajo)
+        self._soltar_clave(trabajo)
+
+    # -----------------------------
+    # Expiración
+    # -----------------------------
+    def limpiar(self, forzar: bool = False) -> int:
+        """Borra resultados y estados expirados (como mucho una vez por minuto salvo `forzar`)."""
+        if not forzar and time.monotonic() - self._ultima_limpieza < 60:
+            return 0
+        self._ultima_limpieza = time.monotonic()
+        borrados = 0
+        try:
+            nombres = os.listdir(self.directorio)
+        except OSError:
+            return 0
+        ahora = time.time()
+        for nombre in nombres:
+            if nombre.endswith(".tmp"):
+                # Temporales de escrituras interrumpidas
+                ruta = self._ruta(nombre)
+                try:
+                    if ahora - os.path.getmtime(ruta) > 300:
+                        os.remove(ruta)
+                except OSError:
+                    pass
+                continue
+            if not nombre.endswith(".json"):
+                continue
+            trabajo = self.estado(nombre[:-5])
+            if not trabajo or trabajo["estado"] in ACTIVOS:
+                continue
+            if ahora - (trabajo["terminado"] or trabajo["actualizado"]) > self.expiracion:
+                for ruta in (self.ruta_resultado(trabajo["id"]), self._ruta(nombre)):
+                    try:
+                        os.remove(ruta)
+                    except OSError:
+                        pass
+                borrados += 1
+        self._stats["expirados"] += borrados
+        return borrados
+
+    def stats(self) -> dict:
+        datos = dict(self._stats)
+        datos.update({"trabajadores": self.trabajadores, "max_por_usuario": self.max_por_usuario,
+                      "expiracion": self.expiracion})
+        return datos
+
+
+def describir(trabajo: dict) -> dict:
+    """Datos del trabajo para la respuesta JSON de estado."""
+    porcentaje = None
+    if trabajo["estado"] == "listo":
+        porcentaje = 100
+    elif trabajo.get("total"):
+        porcentaje = min(99, int(trabajo["hechos"] * 100 / trabajo["total"]))
+    return {
+        "id": trabajo["id"],
+        "titulo": trabajo["titulo"],
+        "estado": trabajo["estado"],
+        "etapa": trabajo.get("etapa"),
+        "hechos": trabajo.get("hechos"),
+        "total": trabajo.get("total"),
+        "porcentaje": porcentaje,
+        "error": trabajo.get("error"),
+        "nombre": trabajo.get("nombre"),
+        "tamano": trabajo.get("tamano"),
+        "resumen": trabajo.get("resumen"),
+        "creado": datetime.fromtimestamp(trabajo["creado"]).isoformat(timespec="seconds"),
+    }